@@ -1,8 +1,11 @@
 import json
 import os
-import re
 import sys
-from zhipuai import ZhipuAI
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import model_routing
 
 react_prompt = """
 你是一个专业的新闻分析师。你的任务是根据提供的多条新闻搜索摘要（Snippets），构建该事件的完整档案。
@@ -67,12 +70,138 @@ agent_prompt = {
     }
 }
 
+# 合并模式：一次调用同时完成四个任务，共用同一段 react_prompt 与输入内容
+fused_prompt = {
+    "name": "事件档案（内容总结 + 时间轴梳理 + 立场分析 + 关联推荐）",
+    "goal": "一次性完成以下四个子任务，并把结果放在同一个 JSON 对象中：\n"
+            + "\n".join(
+                f"【{agent_prompt[k]['name']}】{' '.join(agent_prompt[k]['goal'].split())}" for k in ("0", "A", "B", "C")
+            ),
+    "format": """Action 格式（四个字段缺一不可）:
+        {
+            \"summary\": \"...\",
+            \"timeline\": [{\"date\": \"YYYY-MM-DD\", \"title\": \"...\", \"snippet\": \"...\", \"sourceName\": \"...\", \"url\": \"...\", \"tags\": [\"...\"], \"isReversal\": false}],
+            \"stakeholders\": [{\"party\": \"...\", \"stance\": \"...\", \"viewpoint\": \"...\"}],
+            \"associations\": [{\"eventName\": \"...\", \"reason\": \"...\"}]
+        }""",
+}
+
+
+STEP_KEYS = ("0", "A", "B", "C")
+EXEC_MODES = ("concurrent", "sequential", "fused")
+# 步骤 -> final_output.data 中的字段名
+SECTION_NAMES = {"0": "summary", "A": "timeline", "B": "stances", "C": "relatedEvents"}
+
+
+def _section_value(agent_key: str, data: dict):
+    if agent_key == "0":
+        return data.get("summary", "")
+    if agent_key == "A":
+        return data.get("timeline", [])
+    if agent_key == "B":
+        return data.get("stakeholders") or data.get("stances") or []
+    return data.get("associations") or data.get("relatedEvents") or []
+
+
+def _list_of_dicts(v) -> bool:
+    return isinstance(v, list) and all(isinstance(x, dict) for x in v)
+
+
+def _split_fused(data: dict) -> dict:
+    """Pick the well-formed sections out of a fused Action, keyed like the per-step results."""
+    sections = {}
+    if not isinstance(data, dict) or data.get("code") == 500:
+        return sections
+    summary = data.get("summary")
+    if isinstance(summary, str) and summary.strip():
+        sections["0"] = {"summary": summary}
+    if _list_of_dicts(data.get("timeline")):
+        sections["A"] = {"timeline": data["timeline"]}
+    stances = data.get("stakeholders", data.get("stances"))
+    if _list_of_dicts(stances):
+        sections["B"] = {"stakeholders": stances}
+    related = data.get("associations", data.get("relatedEvents"))
+    if _list_of_dicts(related):
+        sections["C"] = {"associations": related}
+    return sections
+
+
+def _env_int(name: str, fallback: int) -> int:
+    try:
+        n = int(os.getenv(name, ""))
+        return n if n > 0 else fallback
+    except Exception:
+        return fallback
+
+
+def _env_float(name: str, fallback: float) -> float:
+    try:
+        n = float(os.getenv(name, ""))
+        return n if n > 0 else fallback
+    except Exception:
+        return fallback
+
 
 class ReActTrinityAnalyzer:
-    def __init__(self, api_key: str):
-        self.client = ZhipuAI(api_key=api_key)
-        self.model = "glm-4-flash"
+    def __init__(self, api_key: str, exec_mode: str | None = None, max_workers: int | None = None,
+                 step_timeout: float | None = None, use_cache: bool = True, incremental: bool = True):
+        import event_state
+        from disk_cache import get_llm_cache
+
+        self._api_key = api_key
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.model = model_routing.DEFAULT_MODEL
         self.debug = os.getenv("AGENT_DEBUG", "").strip() == "1"
+        # concurrent: 四个步骤互不依赖，并行执行；sequential: 保留原来的逐个执行；
+        # fused: 一次调用完成四个任务，缺失/格式错误的部分再单独补请求
+        mode = (exec_mode or os.getenv("AGENT_EXEC_MODE", "") or "concurrent").strip().lower()
+        self.exec_mode = mode if mode in EXEC_MODES else "concurrent"
+        self.max_workers = max_workers or _env_int("AGENT_MAX_WORKERS", len(STEP_KEYS))
+        # 单步截止时间（秒），从 run 开始计时
+        self.step_timeout = step_timeout or _env_float("AGENT_STEP_TIMEOUT_S", 60.0)
+        # 单个步骤调用失败/解析失败/缺字段时，只重试该步骤的次数（0 = 不重试）
+        try:
+            self.step_retries = max(0, int(os.getenv("AGENT_STEP_RETRIES", "1")))
+        except ValueError:
+            self.step_retries = 1
+        # 调用次数与 token 用量，便于对比不同执行模式
+        self.stats = {"calls": 0, "promptTokens": 0, "completionTokens": 0, "cacheHits": 0, "hedges": 0,
+                      "queueWaitMs": 0, "jsonRepairs": 0, "stepRetries": 0, "incremental": "off",
+                      "escalations": 0, "models": {}}
+        self._stats_lock = threading.Lock()
+        # 跨进程的结果缓存（仅缓存解析成功的结果）
+        self.cache = get_llm_cache() if use_cache else None
+        # 按整条 snippet 打包输入（按估算 token 计预算）；AGENT_INPUT_PACKING=0 恢复按字符截断
+        self.packing = os.getenv("AGENT_INPUT_PACKING", "1").strip() != "0"
+        # run(on_section=...) 时每完成一个步骤回调一次 (section, value)
+        self._on_section = None
+        # 增量分析：同一事件再次分析时只发送新增 snippet，并与上次结果合并（见 event_state.py）
+        self.events = event_state.get_event_store() if use_cache and incremental and event_state.enabled() else None
+        # 本次 run 的上次事件状态（增量模式下非空）
+        self._prior = None
+        # 当前线程所执行步骤的截止时间（monotonic），用于限制单次模型调用的超时
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        from replay import llm_client_from_env
+
+        # SDK 较重（httpx/pydantic），延迟到第一次真正调用模型时再导入；缓存命中则完全不需要
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    # 离线测试/基准：AGENT_LLM_REPLAY / AGENT_LLM_RECORD（见 replay.py）
+                    self._client = llm_client_from_env(self._api_key)
+                if self._client is None:
+                    from zhipuai import ZhipuAI
+
+                    self._client = ZhipuAI(api_key=self._api_key)
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
 
     def _max_chars_for_step(self, agent_key: str) -> int:
         def _to_int(v: str, fallback: int) -> int:
@@ -92,43 +221,171 @@ class ReActTrinityAnalyzer:
 
         return default_max
 
+    def _token_budget_for_step(self, agent_key: str) -> int:
+        env_name = {
+            "B": "AGENT_TOKEN_BUDGET_STANCES",
+            "C": "AGENT_TOKEN_BUDGET_RELATED_EVENTS",
+        }.get(agent_key, "AGENT_TOKEN_BUDGET_DEFAULT")
+        # 未单独配置时，按字符上限折算（中文约 0.7 token/字）
+        return _env_int(env_name, int(self._max_chars_for_step(agent_key) * 0.7))
+
+    def _prepare_input(self, agent_key: str, content: str) -> str:
+        from packing import pack_for_step
+
+        if self.packing:
+            packed = pack_for_step(content, agent_key, self._token_budget_for_step(agent_key))
+            if packed is not None:
+                return packed
+        # 非 SNIPPETS 结构的输入，沿用按字符截断
+        return content[:self._max_chars_for_step(agent_key)]
+
     def extract_json(self, text: str) -> dict:
+        import metrics
+        from json_recover import parse_object
+
         try:
-            match = re.search(r'(\{.*\})', text, re.DOTALL)
-            if match:
-                json_str = match.group(1).strip()
-                data = json.loads(json_str)
-                if isinstance(data, dict):
-                    if isinstance(data.get("Action"), dict):
-                        return data["Action"]
-                    if isinstance(data.get("action"), dict):
-                        return data["action"]
-                    if isinstance(data.get("data"), dict):
-                        nested = data["data"].get("Action") or data["data"].get("action")
-                        if isinstance(nested, dict):
-                            return nested
-                return data
-            return {"code": 500, "msg": "未在模型输出中找到有效的 Action JSON 结构", "data": None}
+            # 先按原来的贪婪匹配解析；失败时做括号配对扫描与截断/尾逗号修复（见 json_recover.py）
+            data, repaired = parse_object(text or "")
+            if data is None:
+                return {"code": 500, "msg": "未在模型输出中找到有效的 Action JSON 结构", "data": None}
+            if repaired:
+                metrics.add(jsonRepairs=1)
+                with self._stats_lock:
+                    self.stats["jsonRepairs"] += 1
+            if isinstance(data.get("Action"), dict):
+                return data["Action"]
+            if isinstance(data.get("action"), dict):
+                return data["action"]
+            if isinstance(data.get("data"), dict):
+                nested = data["data"].get("Action") or data["data"].get("action")
+                if isinstance(nested, dict):
+                    return nested
+            return data
         except Exception as e:
             return {"code": 500, "msg": "error", "data": f"JSON 解析错误: {str(e)}"}
 
-    def execute_react_step(self, agent_key: str, content: str) -> dict:
-        config = agent_prompt[agent_key]
+    def _record_usage(self, response):
+        import metrics
+
+        usage = getattr(response, "usage", None)
+        metrics.add(
+            calls=1,
+            promptTokens=int(getattr(usage, "prompt_tokens", 0) or 0),
+            completionTokens=int(getattr(usage, "completion_tokens", 0) or 0),
+        )
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["promptTokens"] += int(getattr(usage, "prompt_tokens", 0) or 0)
+            self.stats["completionTokens"] += int(getattr(usage, "completion_tokens", 0) or 0)
+
+    def _complete_routed(self, route: str, config: dict, content: str, refresh: bool = False,
+                         delta: bool = False) -> dict:
+        """便宜模型优先：调用失败、无法解析或未达到最低条目数时才改用下一档模型（见 model_routing.py）。
+
+        delta: 增量调用允许返回空列表，不检查最低条目数
+        """
+        import metrics
+
+        models = model_routing.tiers(route)
+        for tier, model in enumerate(models):
+            last = tier == len(models) - 1
+            try:
+                data = self._complete(config, content, refresh=refresh, model=model)
+                reason = None if last else model_routing.shortfall(route, data, delta)
+            except Exception as e:
+                if last:
+                    raise
+                reason = f"call failed: {e}"
+            if reason is None:
+                # 记录实际作答的模型档位，便于按延迟/成本调整路由
+                metrics.annotate(model=model, tier=tier)
+                with self._stats_lock:
+                    self.stats["models"][route] = model
+                return data
+            metrics.add(escalations=1)
+            with self._stats_lock:
+                self.stats["escalations"] += 1
+            if self.debug:
+                sys.stderr.write(f"[agent][{config['name']}] {model}: {reason}, 升级到 {models[tier + 1]}\n")
+                sys.stderr.flush()
+
+    def _complete(self, config: dict, content: str, refresh: bool = False, model: str | None = None) -> dict:
+        import hedging
+        import metrics
+        import rate_limit
+        from disk_cache import llm_cache_key
+        from packing import estimate_tokens
+
+        model = model or self.model
         system_msg = react_prompt.format(
             task_name=config["name"],
             task_goal=config["goal"],
             format_instruction=config["format"],
         )
 
-        max_chars = self._max_chars_for_step(agent_key)
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": f"需要分析的内容如下：\n{content[:max_chars]}"},
-            ],
-            temperature=0.2,
+        user_msg = f"需要分析的内容如下：\n{content}"
+        key = llm_cache_key(model, system_msg, user_msg, 0.2, None) if self.cache else None
+        if key and not refresh:
+            cached = self.cache.get(key)
+            if cached is not None:
+                metrics.add(cacheHits=1)
+                with self._stats_lock:
+                    self.stats["cacheHits"] += 1
+                if self.debug:
+                    sys.stderr.write(f"[agent][{config['name']}] cache hit\n")
+                    sys.stderr.flush()
+                return cached
+
+        # 按步骤学习延迟分布：超过近期分位数仍未返回则补发一次请求，先返回者胜出
+        latency_key = f"agent:{config['name']}" + ("" if model == self.model else f"@{model}")
+
+        def _create():
+            timeout = hedging.timeout_s(latency_key, self.step_timeout)
+            deadline = getattr(self._local, "deadline", None)
+            if deadline is not None:
+                # 超时的步骤不会被等待，但进程退出前仍要等线程里的请求结束：请求超时不超过步骤剩余时间
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("step deadline passed")
+                timeout = min(timeout, max(1.0, remaining))
+            return self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_msg},
+                    {"role": "user", "content": user_msg},
+                ],
+                temperature=0.2,
+                timeout=timeout,
+            )
+
+        # 跨进程限流：analyze 步骤优先级最高；max_tokens 未设置时按 1024 估算输出
+        est_tokens = estimate_tokens(system_msg) + estimate_tokens(user_msg) + 1024
+
+        def _on_hedge(after_s):
+            # 没有富余额度时不补发，避免对冲请求挤占限流预算
+            if not rate_limit.try_acquire(rate_limit.PRIORITY_ANALYZE, est_tokens):
+                return False
+            metrics.add(hedges=1)
+            with self._stats_lock:
+                self.stats["hedges"] += 1
+            if self.debug:
+                sys.stderr.write(f"[agent][{config['name']}] {after_s:.1f}s 未返回，补发请求\n")
+                sys.stderr.flush()
+
+        def _on_wait(waited_s):
+            metrics.add(queueWaitMs=int(waited_s * 1000))
+            with self._stats_lock:
+                self.stats["queueWaitMs"] += int(waited_s * 1000)
+            if self.debug:
+                sys.stderr.write(f"[agent][{config['name']}] 限流排队 {waited_s * 1000:.0f}ms\n")
+                sys.stderr.flush()
+
+        response = rate_limit.limited_call(
+            rate_limit.PRIORITY_ANALYZE, est_tokens,
+            lambda: hedging.hedged_call(latency_key, _create, on_hedge=_on_hedge),
+            on_wait=_on_wait,
         )
+        self._record_usage(response)
 
         raw_output = response.choices[0].message.content
         if self.debug:
@@ -136,38 +393,240 @@ class ReActTrinityAnalyzer:
             sys.stderr.write(raw_output)
             sys.stderr.write(f"\n[agent][{config['name']}] RAW OUTPUT END\n")
             sys.stderr.flush()
-        return self.extract_json(raw_output)
-
-    def run(self, raw_text: str):
-        data0 = self.execute_react_step("0", raw_text)
-        if isinstance(data0, dict) and data0.get("code") == 500:
-            return json.dumps(data0, ensure_ascii=False)
-
-        data_a = self.execute_react_step("A", raw_text)
-        if isinstance(data_a, dict) and data_a.get("code") == 500:
-            return json.dumps(data_a, ensure_ascii=False)
-
-        data_b = self.execute_react_step("B", raw_text)
-        if isinstance(data_b, dict) and data_b.get("code") == 500:
-            return json.dumps(data_b, ensure_ascii=False)
-
-        data_c = self.execute_react_step("C", raw_text)
-        if isinstance(data_c, dict) and data_c.get("code") == 500:
-            return json.dumps(data_c, ensure_ascii=False)
-
-        stances = data_b.get("stakeholders") or data_b.get("stances") or []
-        related_events = data_c.get("associations") or data_c.get("relatedEvents") or []
-
-        final_output = {
-            "code": 200,
-            "data": {
-                "summary": data0.get("summary", ""),
-                "timeline": data_a.get("timeline", []),
-                "stances": stances,
-                "relatedEvents": related_events,
-            },
-        }
-        return json.dumps(final_output, ensure_ascii=False, indent=2)
+        data = self.extract_json(raw_output)
+        metrics.add(parseFailures=int(self._is_failed(data)))
+        if key and not self._is_failed(data):
+            self.cache.put(key, data)
+        return data
+
+    def _with_prior(self, agent_key: str, content: str) -> str:
+        import event_state
+
+        if self._prior is None:
+            return content
+        return f"{event_state.prefix(agent_key, self._prior)}\n\n{content}"
+
+    def execute_react_step(self, agent_key: str, content: str, refresh: bool = False) -> dict:
+        import metrics
+
+        prepared = self._with_prior(agent_key, self._prepare_input(agent_key, content))
+        # 截断/打包前后的输入长度（字符），重试时以最后一次为准
+        metrics.annotate(charsIn=len(content), charsSent=len(prepared))
+        return self._complete_routed(SECTION_NAMES[agent_key], agent_prompt[agent_key], prepared, refresh=refresh,
+                                     delta=self._prior is not None)
+
+    def _run_step(self, agent_key: str, content: str, deadline: float | None = None) -> dict:
+        """One step; a failed call, unparseable output or a missing section re-requests only this step."""
+        import metrics
+
+        with metrics.span("step", SECTION_NAMES[agent_key]) as event:
+            self._local.deadline = deadline
+            try:
+                data = self._run_step_attempts(agent_key, content, deadline)
+            finally:
+                self._local.deadline = None
+            event["ok"] = not self._is_failed(data)
+            return data
+
+    def _run_step_attempts(self, agent_key: str, content: str, deadline: float | None) -> dict:
+        import metrics
+
+        attempt = 0
+        while True:
+            metrics.annotate(attempts=attempt + 1)
+            try:
+                data = self.execute_react_step(agent_key, content, refresh=attempt > 0)
+            except Exception as e:
+                if deadline is not None and time.monotonic() >= deadline:
+                    # 请求超时按步骤截止处理（与未等到结果的步骤一致）
+                    data = {"code": 500, "msg": "step timeout",
+                            "data": f"超时未完成的步骤: {agent_prompt[agent_key]['name']}"}
+                else:
+                    data = {"code": 500, "msg": "error", "data": f"模型调用失败: {str(e)}"}
+            if not self._is_failed(data):
+                if agent_key in _split_fused(data):
+                    return data
+                data = {"code": 500, "msg": "section missing",
+                        "data": f"{agent_prompt[agent_key]['name']} 输出缺少有效的 {SECTION_NAMES[agent_key]} 字段"}
+            if attempt >= self.step_retries or (deadline is not None and time.monotonic() >= deadline):
+                return data
+            attempt += 1
+            with self._stats_lock:
+                self.stats["stepRetries"] += 1
+            if self.debug:
+                sys.stderr.write(f"[agent][{agent_prompt[agent_key]['name']}] {data.get('msg')}, retry {attempt}\n")
+                sys.stderr.flush()
+
+    def execute_fused_step(self, content: str) -> dict:
+        import metrics
+        from packing import pack_for_step
+
+        with metrics.span("step", "fused") as event:
+            # 取各步骤上限中的最大值，保证每个子任务看到的内容不少于单独调用时
+            prepared = None
+            if self.packing:
+                budget = max(self._token_budget_for_step(k) for k in STEP_KEYS)
+                prepared = pack_for_step(content, "fused", budget)
+            if prepared is None:
+                prepared = content[:max(self._max_chars_for_step(k) for k in STEP_KEYS)]
+            prepared = self._with_prior("fused", prepared)
+            event.update(charsIn=len(content), charsSent=len(prepared), attempts=1)
+            data = self._complete_routed("fused", fused_prompt, prepared, delta=self._prior is not None)
+            event["ok"] = not self._is_failed(data)
+            return data
+
+    @staticmethod
+    def _is_failed(data) -> bool:
+        return isinstance(data, dict) and data.get("code") == 500
+
+    def _merged_value(self, agent_key: str, data: dict):
+        import event_state
+
+        value = _section_value(agent_key, data)
+        if self._prior is None:
+            return value
+        section = SECTION_NAMES[agent_key]
+        return event_state.merge_section(section, self._prior.get(section), value)
+
+    def _emit(self, agent_key: str, data: dict):
+        if self._on_section is not None:
+            self._on_section(SECTION_NAMES[agent_key], self._merged_value(agent_key, data))
+
+    def _run_sequential(self, raw_text: str, keys=STEP_KEYS) -> dict:
+        results = {}
+        for key in keys:
+            data = self._run_step(key, raw_text)
+            results[key] = data
+            if not self._is_failed(data):
+                self._emit(key, data)
+        return results
+
+    def _run_concurrent(self, raw_text: str, keys=STEP_KEYS, deadline: float | None = None) -> dict:
+        """Run the given steps in a bounded pool; failed or late steps come back as code-500 entries.
+
+        deadline defaults to step_timeout from now; the fused fallback passes the run's own.
+        """
+        pool = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(keys))))
+        if deadline is None:
+            deadline = time.monotonic() + self.step_timeout
+        results = {}
+        try:
+            futures = {pool.submit(self._run_step, key, raw_text, deadline): key for key in keys}
+            pending = set(futures)
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    for fut in pending:
+                        key = futures[fut]
+                        results[key] = {"code": 500, "msg": "step timeout",
+                                        "data": f"超时未完成的步骤: {agent_prompt[key]['name']}"}
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    data = fut.result()
+                    results[futures[fut]] = data
+                    if not self._is_failed(data):
+                        self._emit(futures[fut], data)
+            return results
+        finally:
+            # 超时时不再等待其余步骤
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run_fused(self, raw_text: str) -> dict:
+        # 融合调用与补请求共用一个截止时间，补请求只用剩余时间
+        deadline = time.monotonic() + self.step_timeout
+        self._local.deadline = deadline
+        try:
+            results = _split_fused(self.execute_fused_step(raw_text))
+        finally:
+            self._local.deadline = None
+        for key in STEP_KEYS:
+            if key in results:
+                self._emit(key, results[key])
+        missing = [k for k in STEP_KEYS if k not in results]
+        if missing:
+            if self.debug:
+                names = ", ".join(agent_prompt[k]["name"] for k in missing)
+                sys.stderr.write(f"[agent] fused output incomplete, re-requesting: {names}\n")
+                sys.stderr.flush()
+            results.update(self._run_concurrent(raw_text, keys=missing, deadline=deadline))
+        return results
+
+    def run(self, raw_text: str, on_section=None, refresh: bool = False):
+        """on_section(section, value) is called as soon as each section is parsed.
+
+        refresh=True ignores the stored event state and replaces it with this run's result.
+
+        Sections that still fail after their retries don't fail the run: they get empty
+        values (or, on an incremental run, their prior values) and the output carries
+        data.partial / data.sectionStatus / data.sectionErrors. Only a run where every
+        section failed and no prior state exists returns the (first) error.
+        """
+        from transport import dumps
+
+        plan = self.events.plan(raw_text, refresh=refresh) if self.events is not None else None
+        if plan is not None and plan.unchanged:
+            # 同一事件、没有新增 snippet：直接返回上次合并后的结果，不调用模型
+            self.stats["incremental"] = "unchanged"
+            data = {SECTION_NAMES[k]: plan.state.get(SECTION_NAMES[k]) or _section_value(k, {}) for k in STEP_KEYS}
+            if on_section is not None:
+                for k in STEP_KEYS:
+                    on_section(SECTION_NAMES[k], data[SECTION_NAMES[k]])
+            data["incremental"] = {"newSnippets": 0, "knownSnippets": len(plan.snippets)}
+            return dumps({"code": 200, "data": data}, indent=True)
+
+        content = raw_text
+        if plan is not None and plan.delta:
+            self.stats["incremental"] = "delta"
+            self._prior = plan.state
+            content = plan.delta_text
+            if self.debug:
+                sys.stderr.write(f"[agent] incremental run: {plan.new_count} new snippets, "
+                                 f"delta_len={len(content)} raw_len={len(raw_text)}\n")
+                sys.stderr.flush()
+        elif plan is not None:
+            self.stats["incremental"] = "full"
+
+        self._on_section = on_section
+        try:
+            if self.exec_mode == "fused":
+                results = self._run_fused(content)
+            elif self.exec_mode == "sequential":
+                results = self._run_sequential(content)
+            else:
+                results = self._run_concurrent(content)
+            failed = [k for k in STEP_KEYS if self._is_failed(results[k])]
+            if len(failed) == len(STEP_KEYS) and self._prior is None:
+                return dumps(results[failed[0]])
+            data = {
+                SECTION_NAMES[k]: self._prior.get(SECTION_NAMES[k]) or _section_value(k, {})
+                if k in failed and self._prior is not None
+                else self._merged_value(k, {} if k in failed else results[k])
+                for k in STEP_KEYS
+            }
+        finally:
+            self._on_section = None
+            self._prior = None
+
+        if plan is not None and not failed:
+            # 只有四个段落都成功时才记录已处理的 snippet，失败的段落下次还能看到这些新增内容
+            self.events.save(plan, data)
+
+        final_output = {"code": 200, "data": data}
+        if plan is not None and plan.delta:
+            data["incremental"] = {"newSnippets": plan.new_count, "knownSnippets": len(plan.snippets)}
+        if failed:
+            stale = "stale" if plan is not None and plan.delta else "failed"
+            data["partial"] = True
+            data["sectionStatus"] = {
+                SECTION_NAMES[k]: ("timeout" if results[k].get("msg") == "step timeout" else stale)
+                if k in failed else "ok"
+                for k in STEP_KEYS
+            }
+            data["sectionErrors"] = {
+                SECTION_NAMES[k]: str(results[k].get("data") or results[k].get("msg")) for k in failed
+            }
+        return dumps(final_output, indent=True)
 
 
 ### 调用请使用 analyzer=ReActTrinityAnalyzer(api_key)，获取结果请用 analyzer.run(text) ###
@@ -1,26 +1,340 @@
 import json
 import os
 import sys
+import threading
 import traceback
-import re
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlsplit
 
+import metrics
+import model_routing
+from json_recover import parse_object
+from packing import estimate_tokens
+from transport import error_envelope, load_stdin_json, loads, write_json, write_raw
+
 # Fix Windows encoding issues
 if sys.platform == 'win32':
     sys.stdin.reconfigure(encoding='utf-8', errors='replace')
     sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 
-# Local import (python/Agent.py)
-from Agent import ReActTrinityAnalyzer
-from zhipuai import ZhipuAI
+
+def _make_client(api_key: str, timeout: float | None = None):
+    # Offline stand-ins for tests/benchmarks (AGENT_LLM_REPLAY / AGENT_LLM_RECORD, see replay.py).
+    from replay import llm_client_from_env
+
+    client = llm_client_from_env(api_key)
+    if client is None:
+        # Heavy SDK import is deferred so error paths (missing key / bad payload) stay cheap.
+        from zhipuai import ZhipuAI
+
+        client = ZhipuAI(api_key=api_key)
+    if timeout and hasattr(client, "timeout"):
+        client.timeout = timeout
+    return client
+
+
+MODEL = model_routing.DEFAULT_MODEL
+
+
+def _chat_json(get_client, mode: str, system_msg: str, user_msg: str, max_tokens: int, debug: bool, cache) -> dict:
+    """One completion (model per AGENT_MODEL_ROUTES) parsed to JSON; parsed results go through the shared disk cache."""
+    with metrics.span("llm", mode, charsIn=len(system_msg) + len(user_msg)) as event:
+        # cheap model first; the next tier only sees calls that fail or fall short (model_routing.py)
+        models = model_routing.tiers(mode)
+        for tier, model in enumerate(models):
+            last = tier == len(models) - 1
+            try:
+                # only the last tier spends AGENT_STEP_RETRIES; earlier ones escalate straight away
+                data = _complete_json(get_client, mode, system_msg, user_msg, max_tokens, debug, cache,
+                                      model=model, retries=None if last else 0)
+                reason = None if last else model_routing.shortfall(mode, data)
+            except Exception as e:
+                if last:
+                    raise
+                reason = f"call failed: {e}"
+            if reason is None:
+                event.update(ok=True, model=model, tier=tier)
+                return data
+            metrics.add(escalations=1)
+            if debug:
+                sys.stderr.write(f"[agent][{mode}] {model}: {reason}, escalating to {models[tier + 1]}\n")
+
+
+def _complete_json(get_client, mode: str, system_msg: str, user_msg: str, max_tokens: int, debug: bool, cache,
+                   model: str = MODEL, retries: int | None = None) -> dict:
+    # imported on first model call: error paths and cache-less payloads skip sqlite/disk_cache
+    import hedging
+    import rate_limit
+    from disk_cache import llm_cache_key
+
+    key = llm_cache_key(model, system_msg, user_msg, 0.2, max_tokens) if cache else None
+    if key:
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.add(cacheHits=1)
+            if debug:
+                sys.stderr.write(f"[agent][{mode}] cache hit\n")
+            return cached
+
+    latency_key = f"runner:{mode}" + ("" if model == MODEL else f"@{model}")
+
+    def _create():
+        return get_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "system", "content": system_msg}, {"role": "user", "content": user_msg}],
+            temperature=0.2,
+            max_tokens=max_tokens,
+            timeout=hedging.timeout_s(latency_key, 20.0),
+        )
+
+    priority = rate_limit.MODE_PRIORITY.get(mode, rate_limit.PRIORITY_ANALYZE)
+    est_tokens = estimate_tokens(system_msg) + estimate_tokens(user_msg) + max_tokens
+
+    def _on_hedge(after_s):
+        if not rate_limit.try_acquire(priority, est_tokens):
+            return False
+        metrics.add(hedges=1)
+        if debug:
+            sys.stderr.write(f"[agent][{mode}] no reply after {after_s:.1f}s, sending hedge request\n")
+
+    def _on_wait(waited_s):
+        metrics.add(queueWaitMs=int(waited_s * 1000))
+        if debug:
+            sys.stderr.write(f"[agent][{mode}] queued {waited_s * 1000:.0f}ms for rate limit\n")
+
+    # a failed call or unparseable output is re-requested AGENT_STEP_RETRIES times (default 1)
+    if retries is None:
+        retries = _step_retries()
+    attempt = 0
+    while True:
+        metrics.annotate(attempts=attempt + 1)
+        try:
+            resp = rate_limit.limited_call(
+                priority, est_tokens, lambda: hedging.hedged_call(latency_key, _create, on_hedge=_on_hedge),
+                on_wait=_on_wait,
+            )
+            usage = getattr(resp, "usage", None)
+            metrics.add(
+                calls=1,
+                promptTokens=int(getattr(usage, "prompt_tokens", 0) or 0),
+                completionTokens=int(getattr(usage, "completion_tokens", 0) or 0),
+            )
+            raw_output = resp.choices[0].message.content
+            if debug:
+                sys.stderr.write(f"\n[agent][{mode}] RAW OUTPUT START\n{raw_output}\n[agent][{mode}] RAW OUTPUT END\n")
+            data = _extract_json(raw_output)
+            break
+        except Exception as e:
+            if isinstance(e, ValueError):
+                metrics.add(parseFailures=1)
+            if attempt >= retries:
+                raise
+            attempt += 1
+            if debug:
+                sys.stderr.write(f"[agent][{mode}] {e}, retry {attempt}\n")
+    if key:
+        cache.put(key, data)
+    return data
+
+
+def _step_retries() -> int:
+    try:
+        return max(0, int(os.getenv("AGENT_STEP_RETRIES", "1")))
+    except ValueError:
+        return 1
+
+
+def _extract_json(text: str) -> dict:
+    # greedy {...} first, then balanced-brace scan / truncation repair (json_recover.py)
+    data, repaired = parse_object(text or "")
+    if data is None:
+        raise ValueError("no json found")
+    if repaired:
+        metrics.add(jsonRepairs=1)
+    return data
 
 
-def _load_input() -> dict:
-    raw = sys.stdin.read()
-    if not raw.strip():
-        return {}
-    raw = raw.encode('utf-8', errors='replace').decode('utf-8')
-    return json.loads(raw)
+def _write_event(event: dict):
+    write_json(event, newline=True)
+
+
+def _write_result(out: dict, stream: bool):
+    """The final envelope: a "result" event when streaming, else the plain JSON."""
+    if stream:
+        _write_event({"event": "result", "result": out})
+    else:
+        write_json(out)
+
+
+# select/filter prompts: one table row per candidate instead of the full JSON objects
+_COMPACT_HELP = (
+    "候选以表格给出，每行一条，字段用 | 分隔：id | title | snippet | sourceName | date | sourceDomain | authorKey | flags | 长度。\n"
+    "flags: D=hasDate U=urlHasDate S=hasSourceName W=isWiki（- 表示均无）；长度为 titleLen/snippetLen/urlDepth。\n"
+    "id 为行首序号，输出时返回该序号。\n"
+)
+
+
+def _compact_enabled() -> bool:
+    return os.getenv("AGENT_PROMPT_COMPACT", "1").strip() != "0"
+
+
+def _snippet_chars() -> int:
+    try:
+        n = int(os.getenv("AGENT_PROMPT_SNIPPET_CHARS", ""))
+        return n if n > 0 else 120
+    except ValueError:
+        return 120
+
+
+def _cell(v, limit: int = 0) -> str:
+    s = " ".join(str(v or "").split()).replace("|", "｜")
+    if limit and len(s) > limit:
+        s = s[:limit] + "…"
+    return s or "-"
+
+
+def _compact_candidates(candidates: list, snippet_chars: int) -> tuple:
+    """-> (table text, {ordinal id: original id}). Missing signals are derived from the URL."""
+    from ddg_search import url_features
+
+    rows = []
+    id_map = {}
+    for c in candidates:
+        n = str(len(id_map) + 1)
+        id_map[n] = c.get("id")
+        url = str(c.get("url") or "")
+        _, domain, _, author, depth, url_has_date, is_wiki = url_features(url)
+        title = str(c.get("title") or "")
+        snippet = str(c.get("snippet") or "")
+        flags = "".join(flag for flag, on in (
+            ("D", c.get("hasDate", bool(c.get("datePublished")))),
+            ("U", c.get("urlHasDate", url_has_date)),
+            ("S", c.get("hasSourceName", bool(c.get("sourceName")))),
+            ("W", c.get("isWiki", is_wiki)),
+        ) if on) or "-"
+        lengths = f"{c.get('titleLen', len(title))}/{c.get('snippetLen', len(snippet))}/{c.get('urlDepth', depth)}"
+        rows.append(" | ".join([
+            n,
+            _cell(title),
+            _cell(snippet, snippet_chars),
+            _cell(c.get("sourceName")),
+            _cell(c.get("datePublished")),
+            _cell(c.get("sourceDomain") or domain),
+            _cell(c.get("authorKey") or author),
+            flags,
+            lengths,
+        ]))
+    return "candidates:\n" + "\n".join(rows), id_map
+
+
+def _map_ids_back(data: dict, keys: tuple, id_map: dict) -> dict:
+    """Ordinal ids in the model output -> original candidate ids.
+
+    Accepts 3, "3" and "#3". Anything else (out of range, 3.0, an echoed url or original
+    id) is dropped, as is a repeat of an id already placed, in this key or an earlier one.
+    """
+    out = dict(data)
+    seen = set()
+    for k in keys:
+        ids = []
+        for x in data.get(k) or []:
+            if isinstance(x, bool) or not isinstance(x, (int, str)):
+                continue
+            n = str(x).strip()
+            orig = id_map.get(n[1:] if n.startswith("#") else n)
+            if orig is not None and orig not in seen:
+                seen.add(orig)
+                ids.append(orig)
+        out[k] = ids
+    return out
+
+
+def _candidates_prompt(mode: str, candidates: list, debug: bool) -> tuple:
+    """-> (user_msg, system prompt suffix, id_map or None)."""
+    if not _compact_enabled():
+        return json.dumps({"candidates": candidates}, ensure_ascii=False), "", None
+    user_msg, id_map = _compact_candidates(candidates, _snippet_chars())
+    if debug:
+        full = estimate_tokens(json.dumps({"candidates": candidates}, ensure_ascii=False))
+        compact = estimate_tokens(user_msg)
+        saved = (1 - compact / full) * 100 if full else 0.0
+        sys.stderr.write(
+            f"[agent][{mode}] prompt tokens~{compact} (json~{full}, saved {saved:.0f}%) "
+            f"for {len(candidates)} candidates\n"
+        )
+    return user_msg, _COMPACT_HELP, id_map
+
+
+SUMMARIZE_SYSTEM = (
+    "你是新闻摘要器。基于每条新闻的title/snippet，输出简短摘要。\n"
+    "只输出JSON，不要Markdown。\n"
+    "格式: {\"summaries\":[{\"id\":\"...\",\"summary\":\"...\"}]}，summary一句话。"
+)
+
+
+def _summary_batches(items: list, budget_tokens: int, max_items: int) -> list:
+    """Consecutive batches bounded by estimated input tokens and item count (so 800 output tokens suffice)."""
+    batches = []
+    cur = []
+    used = 0
+    for it in items:
+        cost = estimate_tokens(json.dumps(it, ensure_ascii=False))
+        if cur and (used + cost > budget_tokens or len(cur) >= max_items):
+            batches.append(cur)
+            cur = []
+            used = 0
+        cur.append(it)
+        used += cost
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def _summarize(get_client, items: list, debug: bool, cache) -> dict:
+    """Batched, concurrent summarize; merged by id, ids missing from the output re-requested once."""
+    from disk_cache import env_num
+
+    budget = env_num("AGENT_SUMMARIZE_BATCH_TOKENS", 1500)
+    max_items = env_num("AGENT_SUMMARIZE_BATCH_ITEMS", 10)
+    workers = env_num("AGENT_MAX_WORKERS", 4)
+    by_id = {}
+    for it in items:
+        if isinstance(it, dict) and it.get("id") is not None:
+            by_id.setdefault(str(it["id"]), it)
+    summaries = {}
+
+    def _one(batch):
+        user_msg = json.dumps({"items": batch}, ensure_ascii=False)
+        try:
+            return _chat_json(get_client, "summarize", SUMMARIZE_SYSTEM, user_msg, 800, debug, cache)
+        except Exception as e:
+            # truncated / unparsable batch: its ids are retried below
+            if debug:
+                sys.stderr.write(f"[agent][summarize] batch of {len(batch)} failed: {e}\n")
+            return {}
+
+    def _collect(batches):
+        if len(batches) == 1:
+            outputs = [_one(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+                outputs = list(pool.map(_one, batches))
+        for data in outputs:
+            for s in (data or {}).get("summaries") or []:
+                if not isinstance(s, dict):
+                    continue
+                sid = str(s.get("id"))
+                if sid in by_id and sid not in summaries and s.get("summary"):
+                    summaries[sid] = s["summary"]
+
+    _collect(_summary_batches(items, budget, max_items))
+    missing = [it for sid, it in by_id.items() if sid not in summaries]
+    if missing:
+        if debug:
+            sys.stderr.write(f"[agent][summarize] re-requesting {len(missing)} missing ids\n")
+        _collect(_summary_batches(missing, budget, max_items))
+
+    return {"summaries": [{"id": it["id"], "summary": summaries[sid]} for sid, it in by_id.items() if sid in summaries]}
 
 
 def _norm_domain(url_or_domain: str) -> str:
@@ -47,197 +361,256 @@ def _norm_domain(url_or_domain: str) -> str:
     return s
 
 
+MODES = ("strategy", "select", "summarize", "filter")
+
+
+def api_key_from_env() -> str | None:
+    return (
+        os.environ.get("ZAI_API_KEY")
+        or os.environ.get("ZHIPU_API_KEY")
+        or os.environ.get("GLM_API_KEY")
+    )
+
+
+def client_getter(api_key: str, timeout: float = 20):
+    """get_client() that builds the client on first use (only on a cache miss) and shares it across threads."""
+    clients = []
+    client_lock = threading.Lock()
+
+    def get_client():
+        with client_lock:
+            if not clients:
+                clients.append(_make_client(api_key, timeout=timeout))
+            return clients[0]
+
+    return get_client
+
+
+def run_mode(mode: str, payload: dict, get_client, debug: bool, cache) -> dict:
+    """strategy / select / filter / summarize for one payload -> {"code": 200, "data": ...}."""
+    if mode == "strategy":
+        selection = payload.get("selection") or ""
+        page_title = payload.get("pageTitle") or ""
+        page_url = payload.get("pageUrl") or ""
+        max_queries = int(payload.get("maxQueries") or 4)
+        system_msg = (
+            "你是新闻搜索策略生成器。给定文本，请生成多条搜索query用于检索真实新闻。\n"
+            "必须输出纯JSON，不要Markdown。\n"
+            "格式: {\"queries\":[{\"q\":\"...\",\"priority\":1,\"angle\":\"...\",\"lang\":\"zh|en\"}]}.\n"
+            "硬约束：每条 query 的 angle 必须不同（不能同义改写）。\n"
+            "至少覆盖这些 angle（凑不齐也要尽量靠近）：\n"
+            "- 官方/监管/公告（press release / regulator / official statement）\n"
+            "- 争议/质疑/调查（controversy / criticism / investigation / lawsuit）\n"
+            "- 行业/数据/研究（report / data / statistics）\n"
+            "- 影响/受众/市场反应（impact / consumers / investors）\n"
+            "若事件涉及国外主体/国际组织/海外地区/英文专有名词，必须至少给出1-2条英文查询（lang=en）。\n"
+            "中文事件优先输出中文查询（lang=zh）。\n"
+            f"输出{max_queries}条左右，简洁关键词，避免重复。"
+        )
+        user_msg = f"selection={selection}\npage_title={page_title}\npage_url={page_url}"
+        data = _chat_json(get_client, "strategy", system_msg, user_msg, 400, debug, cache)
+        return {"code": 200, "data": data}
+
+    if mode == "select":
+        candidates = payload.get("candidates") or []
+        max_output = int(payload.get("maxOutput") or 10)
+        # Seed domain: the current highlighted page domain.
+        seed_domain = _norm_domain(payload.get("seedDomain") or payload.get("pageUrl") or "")
+
+        diversity_block = (
+            "5) 多样性（硬约束优先）：\n"
+            "   - 若候选提供 sourceDomain，则同一 sourceDomain 最多选 2 条；\n"
+            "   - 若候选提供 authorKey，则同一 authorKey 最多选 1 条；\n"
+            "   - 目标：至少覆盖 6 个不同 sourceDomain，不足则用相关度次高的条目补齐。\n"
+        )
+        if seed_domain:
+            diversity_block += (
+                "   - 额外硬约束：必须至少选出 3 个不同 sourceDomain，且其中至少 2 个域名必须不等于当前页面域名（seedDomain）。\n"
+                "     同 seedDomain 最多选 1 条（最好 0 条）。\n"
+                f"     seedDomain={seed_domain}\n"
+            )
+
+        system_msg = (
+            "你是新闻筛选器，从候选列表中选择相关度高、新闻性强、可核验的新闻条目。\n"
+            "只允许返回候选中的id，不要编造。\n"
+            "请基于以下维度综合评分并挑选：\n"
+            "1) 相关度：是否与原始主题强相关；\n"
+            "2) 新闻性：是否像正式新闻报道而非观点/闲聊/百科；\n"
+            "3) 可核验性：是否有明确来源/日期/标题结构；\n"
+            "4) 时效性：日期较新的优先；\n"
+            + diversity_block +
+            "6) 百科类内容可作为背景信息，最多保留1条。\n"
+            "候选中提供了 hasDate/hasSourceName/titleLen/snippetLen/urlDepth/urlHasDate/sourceDomain/authorKey/isWiki 等信号，可用于判断新闻性与多样性。\n"
+            f"输出JSON格式: {{\"selected_ids\":[...]}}，数量不超过{max_output}。"
+        )
+        user_msg, help_text, id_map = _candidates_prompt("select", candidates, debug)
+        data = _chat_json(get_client, "select", system_msg + help_text, user_msg, 600, debug, cache)
+        if id_map is not None:
+            data = _map_ids_back(data, ("selected_ids",), id_map)
+        return {"code": 200, "data": data}
+
+    if mode == "filter":
+        import prefilter
+
+        candidates = payload.get("candidates") or []
+        query = payload.get("query") or payload.get("selection") or ""
+        use_prefilter = prefilter.enabled() and payload.get("prefilter", True) is not False
+        if use_prefilter:
+            # clear-cut candidates are decided locally; only the rest goes to the LLM
+            decided, ambiguous = prefilter.classify(candidates, query)
+        else:
+            decided, ambiguous = {}, candidates
+        data = {}
+        if ambiguous:
+            system_msg = (
+                "你是新闻候选过滤器。请将候选划分为 news/background/noise 三类。\n"
+                "news: 正式新闻报道；background: 背景/百科/解释性内容；noise: 无关或低价值。\n"
+                "尽量保证 news 相关且可信，background 最多保留1条。\n"
+                "只允许返回候选中的id，不要编造。\n"
+                "输出JSON格式: {\"news_ids\":[...],\"background_ids\":[...],\"discard_ids\":[...]}。\n"
+            )
+            user_msg, help_text, id_map = _candidates_prompt("filter", ambiguous, debug)
+            data = _chat_json(get_client, "filter", system_msg + help_text, user_msg, 600, debug, cache)
+            if id_map is not None:
+                data = _map_ids_back(data, ("news_ids", "background_ids", "discard_ids"), id_map)
+        if use_prefilter:
+            if debug:
+                sys.stderr.write(
+                    f"[agent][filter] prefilter local={len(candidates) - len(ambiguous)} "
+                    f"llm={len(ambiguous)} of {len(candidates)}\n"
+                )
+            data = prefilter.merge(candidates, decided, data, ambiguous)
+        return {"code": 200, "data": data}
+
+    if mode == "summarize":
+        items = payload.get("items") or []
+        data = _summarize(get_client, items, debug, cache)
+        return {"code": 200, "data": data}
+
+    raise ValueError(f"unknown mode: {mode}")
+
+
+def run_analyze(payload: dict, api_key: str, debug: bool, cache, on_section=None, client=None,
+                stats_out: dict | None = None) -> str:
+    """ReActTrinityAnalyzer.run for one payload; returns its JSON string."""
+    raw_text = payload.get("rawText") or payload.get("text") or ""
+    # Local import (python/Agent.py)
+    from Agent import ReActTrinityAnalyzer
+
+    # {"incremental": false}: analyze from scratch even if this event was analyzed before
+    analyzer = ReActTrinityAnalyzer(
+        api_key=api_key, use_cache=cache is not None, incremental=payload.get("incremental") is not False
+    )
+    if client is not None:
+        analyzer.client = client
+    if debug:
+        sys.stderr.write(f"[agent] run start, text_len={len(raw_text)} model={MODEL}\n")
+        sys.stderr.flush()
+    # {"refresh": true}: analyze from scratch and replace the stored event state
+    result_json_str = analyzer.run(raw_text, on_section=on_section, refresh=bool(payload.get("refresh")))
+    if stats_out is not None:
+        stats_out["stats"] = dict(analyzer.stats)
+    if debug:
+        sys.stderr.write(f"[agent] run finished stats={analyzer.stats}\n")
+        sys.stderr.flush()
+    return result_json_str
+
+
+def _llm_cache(payload: dict):
+    """The shared LLM cache (opens the SQLite file); None for {"noCache": true}."""
+    if payload.get("noCache"):
+        return None
+    from disk_cache import get_llm_cache
+
+    return get_llm_cache()
+
+
+def _payload_error(payload: dict) -> dict | None:
+    mode = payload.get("mode")
+    if mode is not None and mode not in MODES:
+        return error_envelope(f"unknown mode: {mode}", code=400)
+    if mode is None and not (payload.get("rawText") or payload.get("text")):
+        return error_envelope("rawText is required", code=400)
+    return None
+
+
+def handle(payload: dict, api_key: str, get_client, debug: bool = False, on_section=None) -> dict:
+    """One payload in-process (batch runner / HTTP server) with a shared client -> result envelope."""
+    err = _payload_error(payload)
+    if err is not None:
+        return err
+    cache = _llm_cache(payload)
+    mode = payload.get("mode")
+    if mode in MODES:
+        return run_mode(mode, payload, get_client, debug, cache)
+    return loads(run_analyze(payload, api_key, debug, cache, on_section=on_section, client=get_client()))
+
+
 def main():
+    stream = False
+    mode = None
+    failed = False
+    metrics_extra = {}
     try:
-        payload = _load_input()
-        raw_text = payload.get("rawText") or payload.get("text") or ""
+        payload = load_stdin_json()
         validate_only = bool(payload.get("validateOnly"))
         debug = os.getenv("AGENT_DEBUG", "").strip() == "1"
         mode = payload.get("mode")
+        # {"stream": true}: NDJSON events per finished section, then one "result" event.
+        stream = bool(payload.get("stream"))
 
-        api_key = (
-            os.environ.get("ZAI_API_KEY")
-            or os.environ.get("ZHIPU_API_KEY")
-            or os.environ.get("GLM_API_KEY")
-        )
+        api_key = api_key_from_env()
         if not api_key:
-            out = {"code": 500, "msg": "Missing API key env (ZAI_API_KEY)", "data": None}
-            sys.stdout.write(json.dumps(out, ensure_ascii=False))
+            _write_result(error_envelope("Missing API key env (ZAI_API_KEY)"), stream)
             return
 
         if validate_only:
             try:
-                client = ZhipuAI(api_key=api_key)
-                if hasattr(client, "timeout"):
-                    client.timeout = 8
+                client = _make_client(api_key, timeout=8)
                 client.chat.completions.create(
-                    model="glm-4-flash",
+                    model=MODEL,
                     messages=[{"role": "user", "content": "ping"}],
                     temperature=0.0,
                     max_tokens=1,
                 )
-                sys.stdout.write(json.dumps({"code": 200, "data": {"ok": True}}, ensure_ascii=False))
+                write_json({"code": 200, "data": {"ok": True}})
                 return
             except Exception as e:
-                out = {"code": 500, "msg": "validate error", "data": {"error": str(e)}}
-                sys.stdout.write(json.dumps(out, ensure_ascii=False))
+                write_json(error_envelope("validate error", str(e)))
                 return
 
-        if mode in ["strategy", "select", "summarize", "filter"]:
-            client = ZhipuAI(api_key=api_key)
-            if hasattr(client, "timeout"):
-                client.timeout = 20
-
-            def _extract_json(text: str) -> dict:
-                match = re.search(r'(\{.*\})', text, re.DOTALL)
-                if not match:
-                    raise ValueError("no json found")
-                return json.loads(match.group(1))
-
-            if mode == "strategy":
-                selection = payload.get("selection") or ""
-                page_title = payload.get("pageTitle") or ""
-                page_url = payload.get("pageUrl") or ""
-                max_queries = int(payload.get("maxQueries") or 4)
-                system_msg = (
-                    "你是新闻搜索策略生成器。给定文本，请生成多条搜索query用于检索真实新闻。\n"
-                    "必须输出纯JSON，不要Markdown。\n"
-                    "格式: {\"queries\":[{\"q\":\"...\",\"priority\":1,\"angle\":\"...\",\"lang\":\"zh|en\"}]}.\n"
-                    "硬约束：每条 query 的 angle 必须不同（不能同义改写）。\n"
-                    "至少覆盖这些 angle（凑不齐也要尽量靠近）：\n"
-                    "- 官方/监管/公告（press release / regulator / official statement）\n"
-                    "- 争议/质疑/调查（controversy / criticism / investigation / lawsuit）\n"
-                    "- 行业/数据/研究（report / data / statistics）\n"
-                    "- 影响/受众/市场反应（impact / consumers / investors）\n"
-                    "若事件涉及国外主体/国际组织/海外地区/英文专有名词，必须至少给出1-2条英文查询（lang=en）。\n"
-                    "中文事件优先输出中文查询（lang=zh）。\n"
-                    f"输出{max_queries}条左右，简洁关键词，避免重复。"
-                )
-                user_msg = f"selection={selection}\npage_title={page_title}\npage_url={page_url}"
-                resp = client.chat.completions.create(
-                    model="glm-4-flash",
-                    messages=[{"role": "system", "content": system_msg}, {"role": "user", "content": user_msg}],
-                    temperature=0.2,
-                    max_tokens=400,
-                )
-                raw_output = resp.choices[0].message.content
-                if debug:
-                    sys.stderr.write(f"\n[agent][strategy] RAW OUTPUT START\n{raw_output}\n[agent][strategy] RAW OUTPUT END\n")
-                data = _extract_json(raw_output)
-                sys.stdout.write(json.dumps({"code": 200, "data": data}, ensure_ascii=False))
-                return
-
-            if mode == "select":
-                candidates = payload.get("candidates") or []
-                max_output = int(payload.get("maxOutput") or 10)
-                # Seed domain: the current highlighted page domain.
-                seed_domain = _norm_domain(payload.get("seedDomain") or payload.get("pageUrl") or "")
-
-                diversity_block = (
-                    "5) 多样性（硬约束优先）：\n"
-                    "   - 若候选提供 sourceDomain，则同一 sourceDomain 最多选 2 条；\n"
-                    "   - 若候选提供 authorKey，则同一 authorKey 最多选 1 条；\n"
-                    "   - 目标：至少覆盖 6 个不同 sourceDomain，不足则用相关度次高的条目补齐。\n"
-                )
-                if seed_domain:
-                    diversity_block += (
-                        "   - 额外硬约束：必须至少选出 3 个不同 sourceDomain，且其中至少 2 个域名必须不等于当前页面域名（seedDomain）。\n"
-                        "     同 seedDomain 最多选 1 条（最好 0 条）。\n"
-                        f"     seedDomain={seed_domain}\n"
-                    )
-
-                system_msg = (
-                    "你是新闻筛选器，从候选列表中选择相关度高、新闻性强、可核验的新闻条目。\n"
-                    "只允许返回候选中的id，不要编造。\n"
-                    "请基于以下维度综合评分并挑选：\n"
-                    "1) 相关度：是否与原始主题强相关；\n"
-                    "2) 新闻性：是否像正式新闻报道而非观点/闲聊/百科；\n"
-                    "3) 可核验性：是否有明确来源/日期/标题结构；\n"
-                    "4) 时效性：日期较新的优先；\n"
-                    + diversity_block +
-                    "6) 百科类内容可作为背景信息，最多保留1条。\n"
-                    "候选中提供了 hasDate/hasSourceName/titleLen/snippetLen/urlDepth/urlHasDate/sourceDomain/authorKey/isWiki 等信号，可用于判断新闻性与多样性。\n"
-                    f"输出JSON格式: {{\"selected_ids\":[...]}}，数量不超过{max_output}。"
-                )
-                user_msg = json.dumps({"candidates": candidates}, ensure_ascii=False)
-                resp = client.chat.completions.create(
-                    model="glm-4-flash",
-                    messages=[{"role": "system", "content": system_msg}, {"role": "user", "content": user_msg}],
-                    temperature=0.2,
-                    max_tokens=600,
-                )
-                raw_output = resp.choices[0].message.content
-                if debug:
-                    sys.stderr.write(f"\n[agent][select] RAW OUTPUT START\n{raw_output}\n[agent][select] RAW OUTPUT END\n")
-                data = _extract_json(raw_output)
-                sys.stdout.write(json.dumps({"code": 200, "data": data}, ensure_ascii=False))
-                return
+        err = _payload_error(payload)
+        if err is not None:
+            _write_result(err, stream)
+            return
+        # Per-request bypass of the shared LLM cache ({"noCache": true}); opened only past the checks above.
+        cache = _llm_cache(payload)
 
-            if mode == "filter":
-                candidates = payload.get("candidates") or []
-                system_msg = (
-                    "你是新闻候选过滤器。请将候选划分为 news/background/noise 三类。\n"
-                    "news: 正式新闻报道；background: 背景/百科/解释性内容；noise: 无关或低价值。\n"
-                    "尽量保证 news 相关且可信，background 最多保留1条。\n"
-                    "只允许返回候选中的id，不要编造。\n"
-                    "输出JSON格式: {\"news_ids\":[...],\"background_ids\":[...],\"discard_ids\":[...]}。\n"
-                )
-                user_msg = json.dumps({"candidates": candidates}, ensure_ascii=False)
-                resp = client.chat.completions.create(
-                    model="glm-4-flash",
-                    messages=[{"role": "system", "content": system_msg}, {"role": "user", "content": user_msg}],
-                    temperature=0.2,
-                    max_tokens=600,
-                )
-                raw_output = resp.choices[0].message.content
-                if debug:
-                    sys.stderr.write(f"\n[agent][filter] RAW OUTPUT START\n{raw_output}\n[agent][filter] RAW OUTPUT END\n")
-                data = _extract_json(raw_output)
-                sys.stdout.write(json.dumps({"code": 200, "data": data}, ensure_ascii=False))
-                return
+        if mode in MODES:
+            write_json(run_mode(mode, payload, client_getter(api_key), debug, cache))
+            return
 
-            if mode == "summarize":
-                items = payload.get("items") or []
-                system_msg = (
-                    "你是新闻摘要器。基于每条新闻的title/snippet，输出简短摘要。\n"
-                    "只输出JSON，不要Markdown。\n"
-                    "格式: {\"summaries\":[{\"id\":\"...\",\"summary\":\"...\"}]}，summary一句话。"
-                )
-                user_msg = json.dumps({"items": items}, ensure_ascii=False)
-                resp = client.chat.completions.create(
-                    model="glm-4-flash",
-                    messages=[{"role": "system", "content": system_msg}, {"role": "user", "content": user_msg}],
-                    temperature=0.2,
-                    max_tokens=800,
-                )
-                raw_output = resp.choices[0].message.content
-                if debug:
-                    sys.stderr.write(f"\n[agent][summarize] RAW OUTPUT START\n{raw_output}\n[agent][summarize] RAW OUTPUT END\n")
-                data = _extract_json(raw_output)
-                sys.stdout.write(json.dumps({"code": 200, "data": data}, ensure_ascii=False))
-                return
+        on_section = None
+        if stream:
+            def on_section(section, value):
+                _write_event({"event": "section", "section": section, "data": value})
 
-        analyzer = ReActTrinityAnalyzer(api_key=api_key)
-        if debug:
-            sys.stderr.write(f"[agent] run start, text_len={len(raw_text)} model=glm-4-flash\n")
-            sys.stderr.flush()
-        result_json_str = analyzer.run(raw_text)
-        if debug:
-            sys.stderr.write("[agent] run finished\n")
-            sys.stderr.flush()
+        result_json_str = run_analyze(payload, api_key, debug, cache, on_section=on_section, stats_out=metrics_extra)
 
-        sys.stdout.write(result_json_str)
+        if stream:
+            _write_event({"event": "result", "result": loads(result_json_str)})
+        else:
+            write_raw(result_json_str.encode("utf-8", errors="replace"))
 
     except Exception as e:
-        out = {
-            "code": 500,
-            "msg": "agent_runner error",
-            "data": {
-                "error": str(e),
-                "trace": traceback.format_exc()[-4000:],
-            },
-        }
-        sys.stdout.write(json.dumps(out, ensure_ascii=False))
+        failed = True
+        _write_result(error_envelope("agent_runner error", str(e), trace=traceback.format_exc()[-4000:]), stream)
+    finally:
+        # only loaded (and only holding samples) once a model call was made
+        hedging = sys.modules.get("hedging")
+        if hedging is not None:
+            hedging.flush()
+        metrics.flush("agent_runner", mode or "analyze", ok=not failed, **metrics_extra)
 
 
 if __name__ == "__main__":
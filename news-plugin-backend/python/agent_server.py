@@ -0,0 +1,323 @@
+"""Long-lived HTTP service for the AGENT_URL path (agent.js agentAnalyzeHttp).
+
+One process keeps one pooled LLM client, the disk caches and the latency history
+warm, and serves many requests at once instead of one agent_runner.py spawn each:
+
+  POST /analyze   {query, context, snippets[, article, refresh]} (what agentAnalyzeHttp posts;
+                  a {rawText} body is accepted too) -> {"code": 200, "data": {summary, timeline, ...}}
+  POST /run       any agent_runner.py stdin payload (mode strategy/select/filter/summarize,
+                  or rawText) -> the same envelope agent_runner.py prints
+  POST /search    a ddg_search.py stdin payload -> {"results": [...]} (AGENT_SERVER_SEARCH=0 disables it)
+  GET  /health    {"code": 200, "data": {"ok": true, "inFlight", "queued"}}
+
+Errors use error_envelope() with the HTTP status set to its code, so axios rejects
+them like a failed spawn. At most AGENT_SERVER_CONCURRENCY requests run at once
+(default 8); up to AGENT_SERVER_QUEUE more wait for a slot (default 64), beyond that
+the reply is 503. When the caller disconnects (e.g. the AGENT_TIMEOUT_MS abort), the
+request is cancelled: its remaining model calls are not sent.
+
+Usage:
+  python agent_server.py [--host 127.0.0.1] [--port 8765]
+  AGENT_URL=http://127.0.0.1:8765/analyze npm run dev
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import hedging
+import metrics
+from agent_runner import MODES, api_key_from_env, client_getter, handle
+from disk_cache import env_num
+from transport import dumps_bytes, error_envelope, loads
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            411: "Length Required", 413: "Payload Too Large", 499: "Client Closed Request",
+            500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable"}
+MAX_HEADER_BYTES = 16 * 1024
+
+
+class Cancelled(Exception):
+    pass
+
+
+class _CancellableClient:
+    """Per-request view of the shared client: no new completion starts once the caller is gone."""
+
+    def __init__(self, client, cancelled: threading.Event):
+        self._client = client
+        self._cancelled = cancelled
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        if self._cancelled.is_set():
+            raise Cancelled("client disconnected")
+        return self._client.chat.completions.create(**kwargs)
+
+
+def build_raw_text(query: str, context: dict | None, snippets: list, article: dict | None = None) -> str:
+    """Same text blob as buildRawText() in src/routes/analyze.js."""
+    context = context or {}
+    parts = [f"QUERY: {query}"]
+    if context.get("currentUrl"):
+        parts.append(f"CURRENT_URL: {context['currentUrl']}")
+    if context.get("timestamp"):
+        parts.append(f"TIMESTAMP: {context['timestamp']}")
+    parts.append("SNIPPETS:")
+    for idx, s in enumerate(snippets or []):
+        if not isinstance(s, dict):
+            continue
+        lines = [f"#{idx + 1}"]
+        for label, field in (("DATE", "datePublished"), ("SOURCE", "sourceName"), ("TITLE", "title"),
+                             ("SNIPPET", "snippet"), ("URL", "url")):
+            if s.get(field):
+                lines.append(f"{label}: {s[field]}")
+        parts.append("\n".join(lines))
+        parts.append("")
+    # article after the snippets so truncation still keeps the snippets
+    if isinstance(article, dict):
+        if article.get("title"):
+            parts.append(f"ARTICLE_TITLE: {article['title']}")
+        if article.get("text"):
+            parts.append("ARTICLE_TEXT:")
+            parts.append(article["text"])
+    return "\n".join(parts)
+
+
+class AgentServer:
+    def __init__(self, api_key: str, concurrency: int, queue_limit: int, search: bool = True):
+        self.api_key = api_key
+        self.debug = os.getenv("AGENT_DEBUG", "").strip() == "1"
+        self.get_client = client_getter(api_key)
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.search = search
+        self.slots = asyncio.Semaphore(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="agent")
+        self.in_flight = 0
+        self.queued = 0
+        self.served = 0
+
+    # --- work (runs on the executor) ---
+
+    def _run(self, route: str, payload: dict, cancelled: threading.Event) -> dict:
+        if route == "/search":
+            import ddg_search
+
+            out = ddg_search.search(payload) or {"results": []}
+            if out.get("error"):
+                return error_envelope("search error", out["error"], code=502)
+            return out
+        if route == "/analyze" and not (payload.get("rawText") or payload.get("text")):
+            query = str(payload.get("query") or "").strip()
+            if not query:
+                return error_envelope("query is required", code=400)
+            payload = {**payload, "rawText": build_raw_text(
+                query, payload.get("context"), payload.get("snippets") or [], payload.get("article"))}
+            payload.pop("mode", None)
+        elif route == "/run" and payload.get("mode") and payload["mode"] not in MODES:
+            return error_envelope(f"unknown mode: {payload['mode']}", code=400)
+        # streaming needs NDJSON framing; over HTTP the whole envelope is returned
+        payload.pop("stream", None)
+        client = _CancellableClient(self.get_client(), cancelled)
+        return handle(payload, self.api_key, lambda: client, debug=self.debug)
+
+    # --- HTTP ---
+
+    async def _read_request(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        if len(head) > MAX_HEADER_BYTES:
+            raise ValueError("header too large")
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        return method.upper(), target.split("?", 1)[0], headers
+
+    async def _respond(self, writer, status: int, body: dict):
+        data = dumps_bytes(body)
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    @staticmethod
+    async def _wait_disconnect(reader):
+        """Returns on EOF of the request socket, i.e. the caller aborted (one request per connection)."""
+        try:
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+
+    async def _dispatch(self, reader, route: str, payload: dict):
+        """(status, body); None when the caller went away first."""
+        if self.queued >= self.queue_limit and self.slots.locked():
+            return 503, error_envelope("agent_server busy", code=503)
+        cancelled = threading.Event()
+        gone = asyncio.ensure_future(self._wait_disconnect(reader))
+        self.queued += 1
+        try:
+            acquire = asyncio.ensure_future(self.slots.acquire())
+            await asyncio.wait({acquire, gone}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.queued -= 1
+        if not acquire.done():
+            acquire.cancel()
+            return None
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        work = loop.run_in_executor(self.executor, self._run, route, payload, cancelled)
+
+        def _release(_):
+            # the slot is held until the thread is really done, cancelled or not
+            self.in_flight -= 1
+            self.slots.release()
+
+        work.add_done_callback(_release)
+        try:
+            await asyncio.wait({work, gone}, return_when=asyncio.FIRST_COMPLETED)
+            if not work.done():
+                cancelled.set()
+                if self.debug:
+                    sys.stderr.write(f"[agent_server] {route} caller disconnected, cancelling\n")
+                return None
+            try:
+                body = work.result()
+            except Cancelled:
+                return None
+            except Exception as e:
+                body = error_envelope("agent_runner error", str(e),
+                                      trace=traceback.format_exc()[-4000:] if self.debug else None)
+            code = body.get("code") if isinstance(body.get("code"), int) else 200
+            return (code if 200 <= code < 600 else 500), body
+        finally:
+            gone.cancel()
+
+    async def handle_conn(self, reader, writer):
+        t0 = time.perf_counter()
+        route, status = "-", 0
+        try:
+            try:
+                method, route, headers = await self._read_request(reader)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                status = 400
+                await self._respond(writer, 400, error_envelope("bad request", code=400))
+                return
+            if route == "/health":
+                status = 200
+                await self._respond(writer, 200, {"code": 200, "data": {
+                    "ok": True, "inFlight": self.in_flight, "queued": self.queued, "served": self.served}})
+                return
+            if route not in ("/", "/analyze", "/run", "/search") or (route == "/search" and not self.search):
+                status = 404
+                await self._respond(writer, 404, error_envelope(f"no route {route}", code=404))
+                return
+            if method != "POST":
+                status = 405
+                await self._respond(writer, 405, error_envelope("POST only", code=405))
+                return
+            if "content-length" not in headers:
+                status = 411
+                await self._respond(writer, 411, error_envelope("Content-Length required", code=411))
+                return
+            length = int(headers["content-length"])
+            if length > env_num("AGENT_SERVER_MAX_BODY", 4 * 1024 * 1024):
+                status = 413
+                await self._respond(writer, 413, error_envelope("payload too large", code=413))
+                return
+            try:
+                payload = loads(await reader.readexactly(length)) if length else {}
+                if not isinstance(payload, dict):
+                    raise ValueError("payload must be a JSON object")
+            except ValueError as e:
+                status = 400
+                await self._respond(writer, 400, error_envelope("invalid payload", str(e), code=400))
+                return
+
+            out = await self._dispatch(reader, "/analyze" if route == "/" else route, payload)
+            if out is None:
+                status = 499
+                return
+            status, body = out
+            self.served += 1
+            await self._respond(writer, status, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status = status or 499
+        finally:
+            if self.debug:
+                sys.stderr.write(f"[agent_server] {route} {status} {(time.perf_counter() - t0) * 1000:.0f}ms "
+                                 f"inFlight={self.in_flight}\n")
+                sys.stderr.flush()
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def flush_periodically(self, every_s: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(every_s)
+            await loop.run_in_executor(None, self.flush)
+
+    def flush(self):
+        hedging.flush()
+        metrics.flush("agent_server", "serve", ok=True, served=self.served)
+
+
+async def serve(host: str, port: int):
+    api_key = api_key_from_env()
+    if not api_key:
+        raise SystemExit("Missing API key env (ZAI_API_KEY)")
+    app = AgentServer(
+        api_key,
+        concurrency=env_num("AGENT_SERVER_CONCURRENCY", 8),
+        queue_limit=env_num("AGENT_SERVER_QUEUE", 64),
+        search=os.getenv("AGENT_SERVER_SEARCH", "1").strip() != "0",
+    )
+    server = await asyncio.start_server(app.handle_conn, host, port, limit=MAX_HEADER_BYTES)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+    flusher = asyncio.ensure_future(app.flush_periodically(env_num("AGENT_SERVER_FLUSH_S", 60.0, float)))
+    sys.stderr.write(f"[agent_server] listening on http://{host}:{port} concurrency={app.concurrency}\n")
+    sys.stderr.flush()
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        flusher.cancel()
+        app.executor.shutdown(wait=False, cancel_futures=True)
+        app.flush()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default=os.getenv("AGENT_SERVER_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=env_num("AGENT_SERVER_PORT", 8765))
+    args = ap.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
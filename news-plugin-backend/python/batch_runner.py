@@ -0,0 +1,199 @@
+"""Bulk JSONL entry point for offline backfills.
+
+Reads one agent_runner payload per line (any mode: analyze / strategy / select /
+filter / summarize), runs them in one process with a shared client and bounded
+concurrency, and writes one JSONL result per input line:
+
+    {"line": 0, "id": <payload "id" or null>, "ms": 812.4, "result": {"code": 200, "data": ...}}
+
+Results are written in input order by default (--order completion writes them as
+they finish; use "line"/"id" to match them up). Every result line is flushed as it
+is written, so the output file is also the checkpoint: re-running the same command
+skips input lines that already have a result (--retry-errors also redoes the ones
+that failed; the redone result is appended, the last record for a line wins).
+A summary (items/s, per-item p50/p95/p99, per-mode counts) goes to stderr.
+
+Calls go through the shared rate limiter at the background priority class
+(AGENT_RATE_MIN_PRIORITY=2) unless that env var is set explicitly.
+
+Usage:
+  python batch_runner.py events.jsonl -o results.jsonl
+  python batch_runner.py events.jsonl -o results.jsonl --workers 8 --order completion
+  cat events.jsonl | python batch_runner.py - -o -
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+os.environ.setdefault("AGENT_RATE_MIN_PRIORITY", "2")
+
+import hedging  # noqa: E402
+import metrics  # noqa: E402
+from agent_runner import MODES, api_key_from_env, client_getter, handle  # noqa: E402
+from disk_cache import env_num  # noqa: E402
+from metrics_report import percentile  # noqa: E402
+from transport import dumps, error_envelope, loads  # noqa: E402
+
+
+def read_checkpoint(path: str, retry_errors: bool) -> set:
+    """Input line numbers that already have a result in `path` (a torn last line is cut off)."""
+    if path == "-" or not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # interrupted mid-write: drop the partial line so appends start clean
+            f.truncate(end)
+            data = data[:end]
+    done = set()
+    for raw in data.splitlines():
+        try:
+            rec = loads(raw)
+        except ValueError:
+            continue
+        if not isinstance(rec, dict) or not isinstance(rec.get("line"), int):
+            continue
+        if retry_errors and (rec.get("result") or {}).get("code") != 200:
+            continue
+        done.add(rec["line"])
+    return done
+
+
+def _iter_input(path: str):
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        for i, raw in enumerate(f):
+            if raw.strip():
+                yield i, raw
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+def run_batch(input_path: str, output_path: str, workers: int, order: str = "input",
+              resume: bool = True, retry_errors: bool = False) -> dict:
+    api_key = api_key_from_env()
+    if not api_key:
+        raise SystemExit("Missing API key env (ZAI_API_KEY)")
+    debug = os.getenv("AGENT_DEBUG", "").strip() == "1"
+    get_client = client_getter(api_key)
+    done = read_checkpoint(output_path, retry_errors) if resume else set()
+    out = sys.stdout.buffer if output_path == "-" else open(output_path, "ab" if resume else "wb")
+    out_lock = threading.Lock()
+
+    stats = {"items": 0, "skipped": 0, "errors": 0, "modes": {}}
+    item_ms = []
+
+    def _one(line_no: int, raw: bytes) -> dict:
+        t0 = time.perf_counter()
+        tag = None
+        try:
+            payload = loads(raw)
+        except ValueError as e:
+            payload = None
+            err = str(e)
+        if not isinstance(payload, dict):
+            return {"line": line_no, "id": None, "ms": 0.0, "mode": "error",
+                    "result": error_envelope("invalid payload", err if payload is None else "not a JSON object", code=400)}
+        try:
+            tag = payload.get("id")
+            # batch results are whole envelopes; NDJSON section events don't apply here
+            payload.pop("stream", None)
+            result = handle(payload, api_key, get_client, debug=debug)
+            mode = payload.get("mode") if payload.get("mode") in MODES else "analyze"
+        except Exception as e:
+            mode = "error"
+            result = error_envelope("agent_runner error", str(e), trace=traceback.format_exc()[-2000:] if debug else None)
+        return {"line": line_no, "id": tag, "ms": round((time.perf_counter() - t0) * 1000, 1),
+                "mode": mode, "result": result}
+
+    def _write(rec: dict):
+        stats["items"] += 1
+        item_ms.append(rec["ms"])
+        stats["modes"][rec["mode"]] = stats["modes"].get(rec["mode"], 0) + 1
+        if (rec["result"] or {}).get("code") != 200:
+            stats["errors"] += 1
+        rec = {k: v for k, v in rec.items() if k != "mode"}
+        with out_lock:
+            out.write(dumps(rec).encode("utf-8") + b"\n")
+            out.flush()
+
+    start = time.perf_counter()
+    pending = {}
+    ready = {}
+    # input order: results wait in `ready` until every earlier (not skipped) line is written
+    order_queue = []
+    window = max(1, workers) * 2
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+
+            def _drain(block: bool):
+                if not pending:
+                    return
+                finished, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    pending.pop(fut)
+                    rec = fut.result()
+                    if order == "completion":
+                        _write(rec)
+                    else:
+                        ready[rec["line"]] = rec
+                while order_queue and order_queue[0] in ready:
+                    _write(ready.pop(order_queue.pop(0)))
+
+            for line_no, raw in _iter_input(input_path):
+                if line_no in done:
+                    stats["skipped"] += 1
+                    continue
+                while len(pending) >= window:
+                    _drain(block=True)
+                pending[pool.submit(_one, line_no, raw)] = line_no
+                order_queue.append(line_no)
+                _drain(block=False)
+            while pending:
+                _drain(block=True)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        hedging.flush()
+        metrics.flush("batch_runner", "batch", ok=True, items=stats["items"])
+
+    wall = time.perf_counter() - start
+    return {
+        "items": stats["items"],
+        "skipped": stats["skipped"],
+        "errors": stats["errors"],
+        "modes": stats["modes"],
+        "workers": workers,
+        "wallS": round(wall, 2),
+        "itemsPerS": round(stats["items"] / wall, 2) if wall > 0 else 0.0,
+        "itemP50Ms": percentile(item_ms, 0.50),
+        "itemP95Ms": percentile(item_ms, 0.95),
+        "itemP99Ms": percentile(item_ms, 0.99),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("input", help="JSONL payloads, or - for stdin")
+    ap.add_argument("-o", "--output", required=True, help="JSONL results (also the checkpoint), or - for stdout")
+    ap.add_argument("--workers", type=int, default=env_num("AGENT_BATCH_WORKERS", 4),
+                    help="payloads in flight (default AGENT_BATCH_WORKERS or 4)")
+    ap.add_argument("--order", choices=("input", "completion"), default="input")
+    ap.add_argument("--no-resume", action="store_true", help="overwrite the output instead of resuming")
+    ap.add_argument("--retry-errors", action="store_true", help="on resume, redo lines whose result was an error")
+    args = ap.parse_args()
+
+    summary = run_batch(args.input, args.output, args.workers, order=args.order,
+                        resume=not args.no_resume, retry_errors=args.retry_errors)
+    sys.stderr.write("[batch] " + json.dumps(summary, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
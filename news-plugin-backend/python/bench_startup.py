@@ -0,0 +1,154 @@
+"""Startup benchmark for agent_runner.py.
+
+Spawns the runner the same way Node does (one process per call, payload on
+stdin) and measures:
+  - wall-clock spawn -> first stdout byte
+  - `-X importtime` cumulative import cost, top modules, and whether the
+    ZhipuAI SDK got imported at all
+
+Usage:
+  python bench_startup.py                       # print JSON report
+  python bench_startup.py --runs 20 --save base.json
+  python bench_startup.py --baseline base.json  # exit 1 on regression
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUNNER = os.path.join(HERE, "agent_runner.py")
+KEY_ENVS = ("ZAI_API_KEY", "ZHIPU_API_KEY", "GLM_API_KEY")
+
+# name -> (stdin payload, with api key?)
+SCENARIOS = {
+    "missing_key": (b'{"rawText": "x"}', False),
+    "bad_payload": (b'{"rawText": ', True),
+    "empty_payload": (b"", False),
+}
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _env(with_key: bool) -> dict:
+    env = {k: v for k, v in os.environ.items() if k not in KEY_ENVS and k != "PYTHONPROFILEIMPORTTIME"}
+    if with_key:
+        env["ZAI_API_KEY"] = "bench-dummy-key"
+    return env
+
+
+def _spawn_first_byte(payload: bytes, with_key: bool) -> float:
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, RUNNER],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=_env(with_key),
+        cwd=HERE,
+    )
+    proc.stdin.write(payload)
+    proc.stdin.close()
+    proc.stdout.read(1)
+    elapsed = time.perf_counter() - start
+    proc.stdout.read()
+    proc.wait()
+    return elapsed
+
+
+def _importtime(payload: bytes, with_key: bool) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", RUNNER],
+        input=payload,
+        capture_output=True,
+        env=_env(with_key),
+        cwd=HERE,
+    )
+    top_level = []
+    sdk = False
+    for line in proc.stderr.decode("utf-8", errors="replace").splitlines():
+        m = _IMPORT_LINE.match(line)
+        if not m:
+            continue
+        cumulative_us = int(m.group(2))
+        module = m.group(4)
+        if module.split(".")[0] in ("zhipuai", "httpx", "pydantic"):
+            sdk = True
+        # importtime indents nested imports by two spaces per level
+        if len(m.group(3)) <= 1:
+            top_level.append((module, cumulative_us))
+    top_level.sort(key=lambda x: x[1], reverse=True)
+    return {
+        "totalImportUs": sum(us for _, us in top_level),
+        "topModules": [{"module": mod, "us": us} for mod, us in top_level[:10]],
+        "sdkImported": sdk,
+    }
+
+
+def _pct(values: list, q: float) -> float:
+    s = sorted(values)
+    idx = min(len(s) - 1, max(0, int(round(q * (len(s) - 1)))))
+    return s[idx]
+
+
+def run_bench(runs: int) -> dict:
+    report = {"python": sys.version.split()[0], "runs": runs, "scenarios": {}}
+    for name, (payload, with_key) in SCENARIOS.items():
+        _spawn_first_byte(payload, with_key)  # warm the page cache / .pyc
+        samples = [_spawn_first_byte(payload, with_key) for _ in range(runs)]
+        report["scenarios"][name] = {
+            "firstByteMs": {
+                "median": round(statistics.median(samples) * 1000, 2),
+                "p95": round(_pct(samples, 0.95) * 1000, 2),
+                "min": round(min(samples) * 1000, 2),
+            },
+            **_importtime(payload, with_key),
+        }
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    problems = []
+    for name, cur in report["scenarios"].items():
+        if cur["sdkImported"]:
+            problems.append(f"{name}: SDK imported on an error path")
+        base = (baseline.get("scenarios") or {}).get(name)
+        if not base:
+            continue
+        cur_ms = cur["firstByteMs"]["median"]
+        base_ms = base["firstByteMs"]["median"]
+        if cur_ms > base_ms * (1 + tolerance):
+            problems.append(f"{name}: first byte median {cur_ms}ms > baseline {base_ms}ms (+{int(tolerance * 100)}%)")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--save", help="write the report to this file")
+    ap.add_argument("--baseline", help="compare against a saved report")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = ap.parse_args()
+
+    report = run_bench(max(1, args.runs))
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    problems = compare(report, baseline, args.tolerance)
+    report["regressions"] = problems
+
+    out = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            f.write(out)
+    print(out)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
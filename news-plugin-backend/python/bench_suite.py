@@ -0,0 +1,329 @@
+"""Offline benchmark suite (no ZhipuAI / DuckDuckGo access needed).
+
+Everything runs against the stand-ins in replay.py, so numbers are comparable
+across commits. Results are a flat {metric: value} JSON map.
+
+Sections:
+  analyzer   ReActTrinityAnalyzer wall time per exec mode (fake LLM latency)
+  runner     agent_runner.main wall time per mode, in-process
+  parse      extract_json / _extract_json overhead per call
+  ddg        _enrich / _dedup_by_url / _collapse_near_dups / _diversify (vs legacy) at 10..10k candidates
+  transport  stdin decode / surrogate scrub / JSON encode of select-filter payloads (vs old path)
+  e2e        spawned agent_runner.py / ddg_search.py throughput
+
+Usage:
+  python bench_suite.py --out bench.json
+  python bench_suite.py --only ddg --sizes 10,100,1000
+  python bench_suite.py --compare bench.json        # print ratios vs a saved run
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SECTIONS = ("analyzer", "runner", "parse", "ddg", "transport", "e2e")
+
+# Offline defaults; must be in place before Agent / agent_runner create clients or caches.
+os.environ.setdefault("AGENT_CACHE", "0")
+os.environ.setdefault("AGENT_LLM_REPLAY", "fake")
+os.environ.setdefault("DDG_REPLAY", "fake")
+os.environ.setdefault("ZAI_API_KEY", "bench-dummy-key")
+# fake latencies must not drain the shared rate-limit buckets or train the hedge thresholds
+os.environ.setdefault("AGENT_RATE_LIMIT", "0")
+os.environ.setdefault("AGENT_HEDGE", "0")
+# repeated analyses of the same text must not turn into incremental/unchanged runs
+os.environ.setdefault("AGENT_INCREMENTAL", "0")
+
+import agent_runner  # noqa: E402
+import ddg_search  # noqa: E402
+import transport  # noqa: E402
+from Agent import EXEC_MODES, ReActTrinityAnalyzer  # noqa: E402
+from replay import FakeZhipuAI, canned_output, fake_search_results  # noqa: E402
+
+
+def _timed(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _summary(prefix: str, samples: list, unit: float = 1000.0, suffix: str = "ms") -> dict:
+    s = sorted(samples)
+    return {
+        f"{prefix}.p50_{suffix}": round(statistics.median(s) * unit, 3),
+        f"{prefix}.p95_{suffix}": round(s[min(len(s) - 1, int(round(0.95 * (len(s) - 1))))] * unit, 3),
+    }
+
+
+def sample_raw_text(n_snippets: int = 12, article_chars: int = 3000) -> str:
+    parts = ["QUERY: 咖啡涨价", "CURRENT_URL: https://news.sina.com.cn/a.html", "SNIPPETS:"]
+    for i, r in enumerate(fake_search_results("咖啡涨价", n_snippets)):
+        parts.append("\n".join(filter(None, [
+            f"#{i + 1}",
+            f"DATE: {r['date']}" if r["date"] else None,
+            f"SOURCE: {r['source']}" if r["source"] else None,
+            f"TITLE: {r['title']}",
+            f"SNIPPET: {r['body']}",
+            f"URL: {r['href']}",
+        ])))
+        parts.append("")
+    parts.append("ARTICLE_TITLE: 某品牌咖啡宣布涨价")
+    parts.append("ARTICLE_TEXT:")
+    parts.append(("某品牌咖啡宣布全线产品涨价，消费者反应不一。" * 200)[:article_chars])
+    return "\n".join(parts)
+
+
+def sample_candidates(n: int) -> list:
+    return [
+        {"id": f"ddg:{i + 1}", "title": r["title"], "snippet": r["body"], "url": r["href"],
+         "sourceName": r["source"], "datePublished": r["date"]}
+        for i, r in enumerate(fake_search_results("咖啡涨价 候选", n))
+    ]
+
+
+def bench_analyzer(args) -> dict:
+    out = {}
+    text = sample_raw_text()
+    for mode in EXEC_MODES:
+        def once():
+            analyzer = ReActTrinityAnalyzer(api_key="bench", exec_mode=mode, use_cache=False)
+            analyzer.client = FakeZhipuAI(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms)
+            analyzer.run(text)
+        out.update(_summary(f"analyzer.{mode}", _timed(once, args.repeat)))
+    return out
+
+
+def _run_main(module, payload: dict) -> str:
+    buf = io.StringIO()
+    old_stdin = sys.stdin
+    sys.stdin = io.StringIO(json.dumps(payload, ensure_ascii=False))
+    try:
+        with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(io.StringIO()):
+            module.main()
+    finally:
+        sys.stdin = old_stdin
+    return buf.getvalue()
+
+
+def bench_runner(args) -> dict:
+    os.environ["AGENT_LLM_FAKE_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["AGENT_LLM_FAKE_JITTER_MS"] = str(args.llm_jitter_ms)
+    candidates = sample_candidates(120)
+    payloads = {
+        "strategy": {"mode": "strategy", "selection": "咖啡涨价", "maxQueries": 4},
+        "select": {"mode": "select", "candidates": candidates, "maxOutput": 10},
+        "filter": {"mode": "filter", "candidates": candidates},
+        "filter_llm_only": {"mode": "filter", "candidates": candidates, "prefilter": False},
+        "summarize": {"mode": "summarize", "items": candidates[:20]},
+        "summarize_120": {"mode": "summarize", "items": candidates},
+        "analyze": {"rawText": sample_raw_text()},
+    }
+    out = {}
+    for name, payload in payloads.items():
+        out.update(_summary(f"runner.{name}", _timed(lambda: _run_main(agent_runner, payload), args.repeat)))
+    return out
+
+
+def bench_parse(args) -> dict:
+    analyzer = ReActTrinityAnalyzer(api_key="bench", use_cache=False)
+    fused = canned_output([{"content": "事件档案"}])
+    timeline = canned_output([{"content": "时间轴梳理"}])
+    n = 2000
+    out = {}
+    for name, text in (("fused", fused), ("timeline", timeline)):
+        start = time.perf_counter()
+        for _ in range(n):
+            analyzer.extract_json(text)
+        out[f"parse.agent.{name}_us"] = round((time.perf_counter() - start) / n * 1e6, 3)
+        start = time.perf_counter()
+        for _ in range(n):
+            agent_runner._extract_json(text)
+        out[f"parse.runner.{name}_us"] = round((time.perf_counter() - start) / n * 1e6, 3)
+    return out
+
+
+def bench_ddg(args) -> dict:
+    # the previous list-scanning version; test_diversify.py checks both pick the same items
+    from test_diversify import _diversify_legacy
+
+    out = {}
+    for size in args.sizes:
+        raw = [
+            {"title": r["title"], "snippet": r["body"], "url": r["href"],
+             "sourceName": r["source"], "datePublished": r["date"]}
+            for r in fake_search_results("咖啡涨价 基准", size)
+        ]
+        repeat = max(1, min(args.repeat, 10000 // max(size, 1)))
+        enriched = ddg_search._enrich(raw)
+        deduped = ddg_search._dedup_by_url(enriched)
+        exclude = {"news.sina.com.cn"}
+        out.update(_summary(f"ddg.enrich.n{size}", _timed(lambda: ddg_search._enrich(raw), repeat)))
+
+        def enrich_cold():
+            ddg_search.url_features.cache_clear()
+            ddg_search._enrich(raw)
+        out.update(_summary(f"ddg.enrich_cold.n{size}", _timed(enrich_cold, repeat)))
+        out.update(_summary(f"ddg.dedup.n{size}", _timed(lambda: ddg_search._dedup_by_url(enriched), repeat)))
+        # every 3rd story syndicated to 3 more portals with a slightly different snippet
+        syndicated = []
+        for i, it in enumerate(deduped):
+            syndicated.append(it)
+            if i % 3 == 0:
+                syndicated.extend(
+                    it.copy(urlNormalized=f"{it.urlNormalized}#copy{j}", snippet=it.snippet + "（转载）")
+                    for j in range(3)
+                )
+        collapsed = ddg_search._collapse_near_dups(syndicated)
+        out[f"ddg.near_dup.n{size}.kept"] = len(collapsed)
+        out[f"ddg.near_dup.n{size}.expected"] = len(deduped)
+        out.update(_summary(
+            f"ddg.near_dup.n{size}", _timed(lambda: ddg_search._collapse_near_dups(syndicated), repeat)
+        ))
+        configs = {
+            "diversify": (20, 2, 1, exclude, 1, 2),
+            # limit close to the pool size forces every relaxation pass
+            "diversify_fill": (max(1, len(deduped) // 2), 2, 1, exclude, 1, 2),
+        }
+        for name, cfg in configs.items():
+            out.update(_summary(f"ddg.{name}.n{size}", _timed(lambda: ddg_search._diversify(deduped, *cfg), repeat)))
+            out.update(_summary(
+                f"ddg.{name}_legacy.n{size}",
+                _timed(lambda: _diversify_legacy(deduped, *cfg), max(1, repeat // 5)),
+            ))
+    return out
+
+
+def _legacy_sanitize(s: str) -> str:
+    """ddg_search.sanitize_text before transport.scrub (per-character scan)."""
+    s = "".join(ch for ch in s if not (0xD800 <= ord(ch) <= 0xDFFF))
+    return s.encode("utf-8", errors="replace").decode("utf-8")
+
+
+def bench_transport(args) -> dict:
+    out = {"transport.backend": transport.JSON_BACKEND}
+    for n in (50, 250):
+        payload = {"mode": "filter", "candidates": [c.to_dict() for c in ddg_search._enrich(sample_candidates(n))]}
+        text = json.dumps(payload, ensure_ascii=False)
+        data = text.encode("utf-8")
+        out[f"transport.payload_kb.n{n}"] = round(len(data) / 1024, 1)
+        repeat = max(20, args.repeat * 20)
+
+        def old_read():
+            # agent_runner._load_input / ddg_search main before the shared codec
+            raw = data.decode("utf-8")
+            raw = raw.encode("utf-8", errors="replace").decode("utf-8")
+            return json.loads(_legacy_sanitize(raw))
+
+        out.update(_summary(f"transport.read_old.n{n}", _timed(old_read, repeat), 1e6, "us"))
+        out.update(_summary(f"transport.read.n{n}", _timed(lambda: transport.loads(data), repeat), 1e6, "us"))
+        out.update(_summary(f"transport.scrub_old.n{n}", _timed(lambda: _legacy_sanitize(text), repeat), 1e6, "us"))
+        out.update(_summary(f"transport.scrub.n{n}", _timed(lambda: transport.scrub(text), repeat), 1e6, "us"))
+        out.update(_summary(
+            f"transport.write_old.n{n}",
+            _timed(lambda: json.dumps({"code": 200, "data": payload}, ensure_ascii=False).encode("utf-8"), repeat),
+            1e6, "us",
+        ))
+        out.update(_summary(
+            f"transport.write.n{n}", _timed(lambda: transport.dumps_bytes({"code": 200, "data": payload}), repeat),
+            1e6, "us",
+        ))
+    return out
+
+
+def _spawn(script: str, payload: dict, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(HERE, script)],
+        input=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env,
+        cwd=HERE,
+        check=False,
+    )
+    return time.perf_counter() - start
+
+
+def bench_e2e(args) -> dict:
+    env = dict(os.environ)
+    env["AGENT_LLM_FAKE_LATENCY_MS"] = str(args.llm_latency_ms)
+    env["DDG_FAKE_LATENCY_MS"] = str(args.ddg_latency_ms)
+    jobs = {
+        "agent_runner": ("agent_runner.py", {"rawText": sample_raw_text()}),
+        "ddg_search": ("ddg_search.py", {"query": "咖啡涨价", "count": 20, "seedUrl": "https://news.sina.com.cn/a"}),
+    }
+    out = {}
+    for name, (script, payload) in jobs.items():
+        n = args.e2e_requests
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.e2e_concurrency) as pool:
+            latencies = list(pool.map(lambda _: _spawn(script, payload, env), range(n)))
+        wall = time.perf_counter() - start
+        out[f"e2e.{name}.rps"] = round(n / wall, 3)
+        out.update(_summary(f"e2e.{name}", latencies))
+    return out
+
+
+def compare(current: dict, baseline: dict) -> list:
+    lines = []
+    for k in sorted(current):
+        if k in baseline and isinstance(current[k], (int, float)) and baseline[k]:
+            lines.append(f"{k:48s} {baseline[k]:>12} -> {current[k]:>12}  x{current[k] / baseline[k]:.2f}")
+    return lines
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--only", default=",".join(SECTIONS), help="comma list of sections")
+    ap.add_argument("--sizes", default="10,100,1000,10000")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--llm-latency-ms", type=float, default=200)
+    ap.add_argument("--llm-jitter-ms", type=float, default=50)
+    ap.add_argument("--ddg-latency-ms", type=float, default=300)
+    ap.add_argument("--e2e-requests", type=int, default=16)
+    ap.add_argument("--e2e-concurrency", type=int, default=8)
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--compare", help="baseline results JSON to compare against")
+    args = ap.parse_args()
+    args.sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    args.repeat = max(1, args.repeat)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=HERE).stdout.strip()
+    except OSError:
+        commit = ""
+
+    metrics = {}
+    for section in [s.strip() for s in args.only.split(",") if s.strip() in SECTIONS]:
+        metrics.update(globals()[f"bench_{section}"](args))
+
+    report = {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "metrics": metrics,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print("\n".join(compare(metrics, json.load(f).get("metrics", {}))))
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
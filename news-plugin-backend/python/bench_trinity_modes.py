@@ -0,0 +1,84 @@
+"""Compare ReActTrinityAnalyzer execution modes on the same input.
+
+Runs each mode (fused / concurrent / sequential by default) against the same
+rawText and reports wall time, number of completions and token usage as JSON.
+Needs a real key in ZAI_API_KEY / ZHIPU_API_KEY / GLM_API_KEY.
+
+Usage:
+  python bench_trinity_modes.py --input raw.txt --runs 3
+  python bench_trinity_modes.py --modes fused,concurrent
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from Agent import ReActTrinityAnalyzer, EXEC_MODES
+
+SAMPLE_TEXT = (
+    "QUERY: 咖啡涨价\n\nSNIPPETS:\n#1\nTITLE: 咖啡涨价新闻\nSNIPPET: 某品牌咖啡宣布涨价10%\n"
+    "URL: https://example.com/news1"
+)
+
+
+def _load_text(path: str | None) -> str:
+    if not path:
+        return SAMPLE_TEXT
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+    try:
+        payload = json.loads(raw)
+        if isinstance(payload, dict):
+            return payload.get("rawText") or payload.get("text") or ""
+    except ValueError:
+        pass
+    return raw
+
+
+def bench_mode(api_key: str, mode: str, text: str, runs: int) -> dict:
+    wall = []
+    ok = 0
+    totals = {"calls": 0, "promptTokens": 0, "completionTokens": 0}
+    for _ in range(runs):
+        analyzer = ReActTrinityAnalyzer(api_key=api_key, exec_mode=mode)
+        start = time.perf_counter()
+        out = json.loads(analyzer.run(text))
+        wall.append(time.perf_counter() - start)
+        ok += 1 if out.get("code") == 200 else 0
+        for k in totals:
+            totals[k] += analyzer.stats[k]
+    return {
+        "runs": runs,
+        "ok": ok,
+        "wallMs": {
+            "median": round(statistics.median(wall) * 1000, 1),
+            "max": round(max(wall) * 1000, 1),
+        },
+        "perRun": {k: round(v / runs, 1) for k, v in totals.items()},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--input", help="rawText file (plain text or runner JSON payload)")
+    ap.add_argument("--modes", default="fused,concurrent,sequential")
+    ap.add_argument("--runs", type=int, default=1)
+    args = ap.parse_args()
+
+    api_key = os.environ.get("ZAI_API_KEY") or os.environ.get("ZHIPU_API_KEY") or os.environ.get("GLM_API_KEY")
+    if not api_key:
+        sys.stderr.write("Missing API key in env (ZAI_API_KEY / ZHIPU_API_KEY / GLM_API_KEY)\n")
+        sys.exit(1)
+
+    text = _load_text(args.input)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip() in EXEC_MODES]
+    report = {"inputChars": len(text), "modes": {}}
+    for mode in modes:
+        report["modes"][mode] = bench_mode(api_key, mode, text, max(1, args.runs))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
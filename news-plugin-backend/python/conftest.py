@@ -0,0 +1,2 @@
+# test_api.py / test_runner.py are manual scripts that call the real API on import
+collect_ignore = ["test_api.py", "test_runner.py"]
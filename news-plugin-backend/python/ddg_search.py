@@ -1,25 +1,26 @@
 import json
+import os
+import queue
 import sys
+import threading
+import time
 import warnings
+from concurrent.futures import Future, TimeoutError as FutureTimeout, wait
 from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 import re
 import hashlib
+from functools import lru_cache
+
+import metrics
+from near_dup import cluster, shingle_hashes
+from transport import load_stdin_json, scrub, search_error, write_json
 
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 
 
 def sanitize_text(s: str) -> str:
-  """Make text safe for UTF-8 transport."""
-  if s is None:
-    return ""
-  if not isinstance(s, str):
-    s = str(s)
-
-  # drop surrogate code points explicitly
-  s = "".join(ch for ch in s if not (0xD800 <= ord(ch) <= 0xDFFF))
-  # ensure UTF-8 encodable
-  s = s.encode("utf-8", errors="replace").decode("utf-8")
-  return s
+  """Make text safe for UTF-8 transport (lone surrogates dropped; no-op for clean text)."""
+  return scrub(s)
 
 
 def safe_stderr(msg: str):
@@ -118,36 +119,142 @@ def _is_wiki(domain: str, url: str) -> bool:
   return False
 
 
+# Suffixes under which names are registered one label deeper (public-suffix style, abridged),
+# plus shared hosts where every subdomain is a different publisher.
+_MULTI_LABEL_SUFFIXES = {
+  "com.cn", "net.cn", "org.cn", "gov.cn", "edu.cn", "ac.cn",
+  "com.hk", "net.hk", "org.hk", "gov.hk", "edu.hk", "idv.hk",
+  "com.tw", "net.tw", "org.tw", "gov.tw", "edu.tw", "idv.tw",
+  "com.mo", "com.sg", "edu.sg", "gov.sg", "com.my",
+  "co.uk", "org.uk", "ac.uk", "gov.uk", "co.jp", "ne.jp", "or.jp", "ac.jp", "go.jp",
+  "co.kr", "or.kr", "com.au", "net.au", "org.au", "edu.au", "gov.au", "co.nz", "co.in", "com.br",
+  "github.io", "blogspot.com", "substack.com",
+}
+
+
+@lru_cache(maxsize=2048)
+def registrable_domain(domain: str) -> str:
+  """news.sina.com.cn / finance.sina.com.cn -> sina.com.cn (one source for the caps)."""
+  if not domain or domain.replace(".", "").isdigit():
+    return domain
+  labels = domain.split(".")
+  if len(labels) <= 2:
+    return domain
+  if ".".join(labels[-2:]) in _MULTI_LABEL_SUFFIXES:
+    return ".".join(labels[-3:])
+  return ".".join(labels[-2:])
+
+
+@lru_cache(maxsize=4096)
+def url_features(url: str) -> tuple:
+  """(urlNormalized, sourceDomain, sourceSite, authorKey, urlDepth, urlHasDate, isWiki) from one urlsplit.
+
+  Same values as _normalize_url / _norm_domain / _author_key / _url_depth / _url_has_date / _is_wiki.
+  Also used by agent_runner.py and prefilter.py to derive the signals a candidate lacks.
+  """
+  try:
+    parts = urlsplit(url)
+    query = parts.query
+    if query:
+      q = [(k, v) for (k, v) in parse_qsl(query, keep_blank_values=True) if k.lower() not in _TRACKING_KEYS]
+      query = urlencode(q, doseq=True)
+    netloc = parts.netloc.lower()
+    nurl = urlunsplit((parts.scheme.lower() or "https", netloc, parts.path, query, ""))
+  except Exception:
+    nurl = url
+    domain = _norm_domain(nurl)
+    return (nurl, domain, registrable_domain(domain), _author_key(nurl), _url_depth(nurl),
+            _url_has_date(nurl), _is_wiki(domain, nurl))
+
+  domain = netloc.split("@", 1)[-1].split(":", 1)[0]
+  if domain.startswith("www."):
+    domain = domain[4:]
+  path = parts.path
+  author = ""
+  for pat in _AUTHOR_PATTERNS:
+    m = pat.search(path)
+    if m:
+      author = f"{pat.pattern}:{m.group(1).lower()}"
+      break
+  stripped = path.strip("/")
+  depth = len([p for p in stripped.split("/") if p]) if stripped else 0
+  has_date = bool(_DATE_IN_URL.search(path) or _DATE_IN_URL_2.search(path))
+  return (nurl, domain, registrable_domain(domain), author, depth, has_date, _is_wiki(domain, nurl))
+
+
+_RAW_FIELDS = ("title", "snippet", "url", "sourceName", "datePublished")
+_DERIVED_FIELDS = (
+  "id", "urlNormalized", "sourceDomain", "sourceSite", "authorKey", "hasDate", "hasSourceName",
+  "titleLen", "snippetLen", "urlDepth", "urlHasDate", "isWiki",
+)
+# set later in the pipeline; only emitted once set
+_TAG_FIELDS = ("query", "clusterSize")
+_FIELD_SET = frozenset(_RAW_FIELDS + _DERIVED_FIELDS + _TAG_FIELDS)
+
+
+class _Candidate:
+  """Compact search result; read with .get() like the dicts it replaces, turned back into a dict by to_dict()."""
+
+  __slots__ = _RAW_FIELDS + _DERIVED_FIELDS + _TAG_FIELDS + ("extra",)
+
+  @classmethod
+  def from_dict(cls, d: dict) -> "_Candidate":
+    c = cls.__new__(cls)
+    for k in _FIELD_SET:
+      setattr(c, k, d.get(k))
+    extra = {k: v for k, v in d.items() if k not in _FIELD_SET}
+    c.extra = extra or None
+    return c
+
+  def get(self, key: str, default=None):
+    if key in _FIELD_SET:
+      v = getattr(self, key)
+      return default if v is None else v
+    return self.extra.get(key, default) if self.extra else default
+
+  def copy(self, **changes) -> "_Candidate":
+    c = _Candidate.__new__(_Candidate)
+    for k in _Candidate.__slots__:
+      setattr(c, k, changes.get(k, getattr(self, k)))
+    return c
+
+  def to_dict(self) -> dict:
+    out = {k: getattr(self, k) for k in _RAW_FIELDS}
+    if self.extra:
+      out.update(self.extra)
+    for k in _DERIVED_FIELDS:
+      out[k] = getattr(self, k)
+    for k in _TAG_FIELDS:
+      v = getattr(self, k)
+      if v is not None:
+        out[k] = v
+    return out
+
+
 def _enrich(items: list) -> list:
+  """Raw result dicts -> _Candidate records with the derived URL/text features."""
   enriched = []
   for i, it in enumerate(items):
-    url = it.get("url") or ""
-    nurl = _normalize_url(url)
-    domain = _norm_domain(nurl)
-    ak = _author_key(nurl)
-    has_date = bool((it.get("datePublished") or "").strip()) or _url_has_date(nurl)
-    has_source = bool((it.get("sourceName") or "").strip())
-    title = it.get("title") or ""
-    snippet = it.get("snippet") or ""
+    c = _Candidate.from_dict(it)
+    url = c.url or ""
+    nurl, domain, site, ak, depth, url_has_date, is_wiki = url_features(url)
     try:
       stable_id = "u_" + hashlib.sha1((nurl or url).encode("utf-8", errors="ignore")).hexdigest()[:12]
     except Exception:
       stable_id = f"ddg_{i}"
-
-    enriched.append({
-      **it,
-      "id": it.get("id") or stable_id,
-      "urlNormalized": nurl,
-      "sourceDomain": domain,
-      "authorKey": ak,
-      "hasDate": has_date,
-      "hasSourceName": has_source,
-      "titleLen": len(title),
-      "snippetLen": len(snippet),
-      "urlDepth": _url_depth(nurl),
-      "urlHasDate": _url_has_date(nurl),
-      "isWiki": _is_wiki(domain, nurl),
-    })
+    c.id = c.id or stable_id
+    c.urlNormalized = nurl
+    c.sourceDomain = domain
+    c.sourceSite = site
+    c.authorKey = ak
+    c.hasDate = bool((c.datePublished or "").strip()) or url_has_date
+    c.hasSourceName = bool((c.sourceName or "").strip())
+    c.titleLen = len(c.title or "")
+    c.snippetLen = len(c.snippet or "")
+    c.urlDepth = depth
+    c.urlHasDate = url_has_date
+    c.isWiki = is_wiki
+    enriched.append(c)
   return enriched
 
 
@@ -165,6 +272,42 @@ def _dedup_by_url(items: list) -> list:
   return out
 
 
+def _shingle_hashes(it: dict) -> set:
+  """Shingles of title+snippet (see near_dup.py)."""
+  return shingle_hashes(f"{it.get('title') or ''}{it.get('snippet') or ''}")
+
+
+def _collapse_near_dups(items: list, threshold: float = 0.8, exclude_set: set | None = None,
+                        max_checks: int = 32, bucket_cap: int = 64) -> list:
+  """Keep one representative per cluster of near-duplicate title+snippet (syndicated copies).
+
+  Clustering is near_dup.cluster (MinHash/LSH candidates, exact shingle Jaccard check, linear
+  cost even when every result repeats the same query words).
+
+  The representative prefers a non-excluded domain, then hasDate, hasSourceName, longer snippet;
+  it takes the slot of the cluster's first member. The output holds copies of the representatives
+  (_Candidate records or plain dicts) with clusterSize set; the input items are not modified.
+  """
+  exclude_set = exclude_set or set()
+
+  def _rank(it):
+    return (
+      (it.get("sourceDomain") or "") not in exclude_set,
+      bool(it.get("hasDate")),
+      bool(it.get("hasSourceName")),
+      int(it.get("snippetLen") or 0),
+    )
+
+  clusters = cluster(items, _shingle_hashes, _rank, threshold, max_checks=max_checks, bucket_cap=bucket_cap)
+  return [_with_cluster_size(rep, size) for rep, size in clusters]
+
+
+def _with_cluster_size(it, size: int):
+  if isinstance(it, _Candidate):
+    return it.copy(clusterSize=size)
+  return {**it, "clusterSize": size}
+
+
 def _unique_domains(items: list, exclude_set: set | None = None) -> set:
   s = set()
   for it in items:
@@ -185,132 +328,383 @@ def _diversify(
   exclude_domains: set,
   excluded_domain_cap: int,
   min_external_domains: int,
+  scores: list | None = None,
+  group_key: str = "sourceDomain",
 ) -> list:
   """Greedy diversify. If exclude_domains provided, enforce a minimum number of external domains.
 
   - For domains in exclude_domains: use excluded_domain_cap (often 0 or 1)
   - For other domains: use per_domain_cap
+  - scores (optional, parallel to items): visit items by descending score instead of arrival order
+  - group_key: item field that identifies a source for the caps ("sourceSite" groups subdomains);
+    exclude_domains must hold values of the same field
+
+  Passes work on positions with a taken-flag per item, so each pass is one linear walk.
   """
+  n = len(items)
+  if limit <= 0 or n == 0:
+    return []
+  if scores is not None:
+    order = sorted(range(n), key=lambda i: -(scores[i] or 0))
+  else:
+    order = range(n)
 
-  def _cap_for_domain(d: str) -> int:
-    if d and d in exclude_domains:
-      return excluded_domain_cap
-    return per_domain_cap
-
-  def _pick(src, cap_domain, cap_author, allow_excluded: bool):
-    dom_cnt = {}
-    au_cnt = {}
-    picked = []
-    ext_domains = set()
-    for it in src:
-      if len(picked) >= limit:
+  taken = bytearray(n)
+  picked = []
+  dom_cnt = {}
+  au_cnt = {}
+
+  def _walk(allow_excluded: bool, dom_cnt_pass: dict, au_cap: int, budget: int, ext_domains: set | None):
+    got = 0
+    for i in order:
+      if got >= budget:
         break
-      d = it.get("sourceDomain") or ""
-      a = it.get("authorKey") or ""
+      if taken[i]:
+        continue
+      it = items[i]
+      d = it.get(group_key) or ""
       is_excluded = bool(d and d in exclude_domains)
-      if (not allow_excluded) and is_excluded:
+      if is_excluded and not allow_excluded:
         continue
-      dom_cap = cap_domain(d) if cap_domain else 0
-      if dom_cap and d and dom_cnt.get(d, 0) >= dom_cap:
+      a = it.get("authorKey") or ""
+      dom_cap = excluded_domain_cap if is_excluded else per_domain_cap
+      if dom_cap and d and dom_cnt_pass.get(d, 0) >= dom_cap:
         continue
-      if cap_author and a and au_cnt.get(a, 0) >= cap_author:
+      if au_cap and a and au_cnt.get(a, 0) >= au_cap:
         continue
-      picked.append(it)
+      taken[i] = 1
+      picked.append(i)
+      got += 1
       if d:
-        dom_cnt[d] = dom_cnt.get(d, 0) + 1
-        if not is_excluded:
+        dom_cnt_pass[d] = dom_cnt_pass.get(d, 0) + 1
+        if ext_domains is not None and not is_excluded:
           ext_domains.add(d)
       if a:
         au_cnt[a] = au_cnt.get(a, 0) + 1
-    return picked, dom_cnt, au_cnt, ext_domains
 
   # Pass 1: try to collect enough external domains (do not allow excluded domains)
-  picked1, dom_cnt, au_cnt, ext_domains = _pick(items, _cap_for_domain, per_author_cap, allow_excluded=False)
-
-  # If we still don't have enough external domain coverage, relax author cap for external-only picking
-  if len(ext_domains) < min_external_domains and len(picked1) < limit:
-    picked1b, dom_cnt2, au_cnt2, ext_domains2 = _pick(
-      [it for it in items if it not in picked1],
-      _cap_for_domain,
-      0,
-      allow_excluded=False,
-    )
-    # merge counters
-    picked1.extend(picked1b)
-    for k, v in dom_cnt2.items():
+  ext_domains = set()
+  _walk(False, dom_cnt, per_author_cap, limit, ext_domains)
+
+  # If we still don't have enough external domain coverage, relax author cap for external-only picking.
+  # Domain counts restart for this pass and are merged afterwards (as the original passes did).
+  if len(ext_domains) < min_external_domains and len(picked) < limit:
+    dom_cnt_1b = {}
+    _walk(False, dom_cnt_1b, 0, limit - len(picked), ext_domains)
+    for k, v in dom_cnt_1b.items():
       dom_cnt[k] = dom_cnt.get(k, 0) + v
-    for k, v in au_cnt2.items():
-      au_cnt[k] = au_cnt.get(k, 0) + v
-    ext_domains |= ext_domains2
-
-  picked = picked1
 
   # Pass 2: fill remaining slots (allow excluded domains with separate cap)
   if len(picked) < limit:
-    for it in items:
-      if len(picked) >= limit:
-        break
-      if it in picked:
-        continue
-      d = it.get("sourceDomain") or ""
-      a = it.get("authorKey") or ""
-      dom_cap = _cap_for_domain(d)
-      if dom_cap and d and dom_cnt.get(d, 0) >= dom_cap:
-        continue
-      if per_author_cap and a and au_cnt.get(a, 0) >= per_author_cap:
-        continue
-      picked.append(it)
-      if d:
-        dom_cnt[d] = dom_cnt.get(d, 0) + 1
-      if a:
-        au_cnt[a] = au_cnt.get(a, 0) + 1
+    _walk(True, dom_cnt, per_author_cap, limit - len(picked), None)
 
   # Pass 3: if still not enough, relax author cap, then domain cap (last resort)
   if len(picked) < limit:
-    for it in items:
+    _walk(True, dom_cnt, 0, limit - len(picked), None)
+
+  if len(picked) < limit:
+    for i in order:
       if len(picked) >= limit:
         break
-      if it in picked:
-        continue
-      d = it.get("sourceDomain") or ""
-      dom_cap = _cap_for_domain(d)
-      if dom_cap and d and dom_cnt.get(d, 0) >= dom_cap:
-        continue
-      picked.append(it)
-      if d:
-        dom_cnt[d] = dom_cnt.get(d, 0) + 1
+      if not taken[i]:
+        taken[i] = 1
+        picked.append(i)
+
+  return [items[i] for i in picked[:limit]]
 
-  if len(picked) < limit:
-    picked.extend([it for it in items if it not in picked])
 
-  return picked[:limit]
+def _scores_from_field(items: list, field: str) -> list:
+  out = []
+  for it in items:
+    try:
+      out.append(float(it.get(field) or 0))
+    except (TypeError, ValueError):
+      out.append(0.0)
+  return out
 
 
-def collect_results(ddgs_cls, query, count, backend, region):
+def collect_results(ddgs_cls, query, count, backend, region, session=None):
+  """Run one DDG text search. Pass `session` to reuse an open DDGS instead of opening a new one."""
   out = []
   query = sanitize_text(query)
 
-  with warnings.catch_warnings():
+  with metrics.span("search", backend, queryChars=len(query), pooled=session is not None) as event, \
+      warnings.catch_warnings():
     warnings.simplefilter("ignore", RuntimeWarning)
-    with ddgs_cls() as ddgs:
-      iterator = ddgs.text(
+    if session is not None:
+      iterator = session.text(
         query,
         max_results=count,
         backend=backend,
         region=region,
         safesearch="off",
       )
-      for r in iterator:
-        out.append({
-          "title": r.get("title") or "",
-          "snippet": r.get("body") or "",
-          "url": r.get("href") or "",
-          "sourceName": r.get("source") or "",
-          "datePublished": r.get("date") or ""
-        })
+      rows = list(iterator)
+    else:
+      with ddgs_cls() as ddgs:
+        rows = list(ddgs.text(
+          query,
+          max_results=count,
+          backend=backend,
+          region=region,
+          safesearch="off",
+        ))
+    for r in rows:
+      out.append({
+        "title": r.get("title") or "",
+        "snippet": r.get("body") or "",
+        "url": r.get("href") or "",
+        "sourceName": r.get("source") or "",
+        "datePublished": r.get("date") or ""
+      })
+    event["results"] = len(out)
   return out
 
 
+class _SessionPool:
+  """Bounded set of open DDGS sessions shared by the fan-out worker threads."""
+
+  def __init__(self, ddgs_cls):
+    self._cls = ddgs_cls
+    self._free = queue.LifoQueue()
+    self._lock = threading.Lock()
+    self._open = []
+
+  def acquire(self):
+    try:
+      return self._free.get_nowait()
+    except queue.Empty:
+      s = self._cls()
+      s = s.__enter__() or s
+      with self._lock:
+        self._open.append(s)
+      return s
+
+  def release(self, s, broken: bool = False):
+    if broken:
+      # don't hand a failed session to the next query
+      self._close_one(s)
+      return
+    self._free.put(s)
+
+  def _close_one(self, s):
+    with self._lock:
+      if s in self._open:
+        self._open.remove(s)
+    try:
+      s.__exit__(None, None, None)
+    except Exception:
+      pass
+
+  def close(self):
+    with self._lock:
+      sessions = list(self._open)
+    for s in sessions:
+      self._close_one(s)
+
+
+def _search_pooled(pool, ddgs_cls, query, count, backend, region, attempts: int = 2):
+  """collect_results on a pooled session; by default with the single retry main() always had."""
+  for attempt in range(attempts):
+    s = pool.acquire()
+    try:
+      out = collect_results(ddgs_cls, query, count, backend, region, session=s)
+      pool.release(s)
+      return out
+    except Exception as e:
+      pool.release(s, broken=True)
+      if attempt + 1 >= attempts:
+        raise
+      safe_stderr(f"[ddg_search] retry after error ({sanitize_text(str(e))[:120]})\n")
+  return []
+
+
+# --- Search-result cache ---------------------------------------------
+#
+# Entries are the enriched rows of one DDG call (raw fields + derived features),
+# keyed on the normalized query (incl. -site: exclusions), count, backend, region.
+# Past DDG_CACHE_TTL_S an entry is still served for DDG_CACHE_STALE_S more seconds
+# while a detached process refreshes it (stale-while-revalidate).
+
+_search_cache = None
+
+
+def _get_search_cache():
+  global _search_cache
+  if _search_cache is None:
+    from disk_cache import DiskCache, env_num
+    _search_cache = DiskCache(
+      path=os.getenv("DDG_CACHE_PATH") or os.getenv("AGENT_CACHE_PATH") or None,
+      namespace="ddg",
+      ttl_s=env_num("DDG_CACHE_TTL_S", 600.0, float),
+      stale_s=env_num("DDG_CACHE_STALE_S", 1800.0, float, minimum=0),
+      max_entries=env_num("DDG_CACHE_MAX_ENTRIES", 5000),
+      enabled=os.getenv("DDG_CACHE", "1").strip() != "0",
+    )
+  return _search_cache
+
+
+def _normalize_query(query: str) -> str:
+  """Case/whitespace-insensitive; -site: exclusions are order-insensitive."""
+  tokens = sanitize_text(query).lower().split()
+  sites = sorted({t for t in tokens if t.startswith("-site:")})
+  return " ".join([t for t in tokens if not t.startswith("-site:")] + sites)
+
+
+def _search_key(query, count, backend, region) -> str:
+  from disk_cache import cache_key
+  return cache_key("text", _normalize_query(query), int(count), backend, region)
+
+
+class _CacheStats:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.counts = {"hits": 0, "stale": 0, "misses": 0, "revalidations": 0}
+
+  def add(self, k: str):
+    with self._lock:
+      self.counts[k] += 1
+
+
+def _spawn_revalidate(query, count, backend, region):
+  """Refresh a stale entry in a detached process; stdio detached so Node's 'close' doesn't wait for it."""
+  import subprocess
+
+  payload = {"revalidate": {"query": query, "count": count, "backend": backend, "region": region}}
+  kwargs = {}
+  if os.name == "nt":
+    kwargs["creationflags"] = getattr(subprocess, "DETACHED_PROCESS", 0) | getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)
+  else:
+    kwargs["start_new_session"] = True
+  proc = subprocess.Popen(
+    [sys.executable, os.path.abspath(__file__)],
+    stdin=subprocess.PIPE,
+    stdout=subprocess.DEVNULL,
+    stderr=subprocess.DEVNULL,
+    **kwargs,
+  )
+  proc.stdin.write(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+  proc.stdin.close()
+
+
+def _cached_search(pool, ddgs_cls, query, count, backend, region, cache=None, stats=None, attempts: int = 2):
+  """Enriched rows for one search, served from the shared cache when possible."""
+  key = _search_key(query, count, backend, region) if cache is not None and cache.enabled else None
+  if key:
+    entry = cache.get_entry(key)
+    if entry is not None:
+      rows, stale = entry
+      rows = [_Candidate.from_dict(d) for d in rows]
+      for c in rows:
+        if c.sourceSite is None:
+          # entry written before sourceSite existed
+          c.sourceSite = registrable_domain(c.sourceDomain or "")
+      if stale:
+        if stats:
+          stats.add("stale")
+        if cache.claim(key, lease_s=60):
+          try:
+            _spawn_revalidate(query, count, backend, region)
+            if stats:
+              stats.add("revalidations")
+          except OSError as e:
+            safe_stderr(f"[ddg_search] revalidate spawn failed ({sanitize_text(str(e))[:120]})\n")
+      elif stats:
+        stats.add("hits")
+      return rows
+    if stats:
+      stats.add("misses")
+  rows = _enrich(_search_pooled(pool, ddgs_cls, query, count, backend, region, attempts=attempts))
+  if key and rows:
+    # empty pages are usually throttling, not an answer worth keeping
+    cache.put(key, [c.to_dict() for c in rows])
+  return rows
+
+
+def _revalidate(job: dict):
+  query = sanitize_text(job.get("query", "")).strip()
+  if not query:
+    return
+  new_ddgs_cls, legacy_ddgs_cls = _load_ddgs_classes()
+  ddgs_cls = new_ddgs_cls or legacy_ddgs_cls
+  if not ddgs_cls:
+    return
+  count = int(job.get("count", 20))
+  backend = sanitize_text(job.get("backend", "auto"))
+  region = sanitize_text(job.get("region", "cn-zh"))
+  rows = _enrich(collect_results(ddgs_cls, query, count, backend, region))
+  if rows:
+    _get_search_cache().put(_search_key(query, count, backend, region), [c.to_dict() for c in rows])
+
+
+def _submit_daemon(fn, *args) -> Future:
+  """Run fn on a daemon thread: a dropped speculative search must not hold up process exit."""
+  fut = Future()
+
+  def _run():
+    if not fut.set_running_or_notify_cancel():
+      return
+    try:
+      fut.set_result(fn(*args))
+    except BaseException as e:
+      fut.set_exception(e)
+
+  threading.Thread(target=_run, daemon=True).start()
+  return fut
+
+
+def _parse_queries(payload: dict) -> list:
+  """payload.queries: ["q", {"q": "..."}...]; falls back to payload.query. Order kept, duplicates dropped."""
+  raw = payload.get("queries")
+  out = []
+  if isinstance(raw, list):
+    for x in raw:
+      q = x.get("q") if isinstance(x, dict) else x
+      q = sanitize_text(q or "").strip()
+      if q and q not in out:
+        out.append(q)
+  if not out:
+    q = sanitize_text(payload.get("query", "")).strip()
+    if q:
+      out.append(q)
+  return out
+
+
+def _load_ddgs_classes():
+  """(new ddgs.DDGS, legacy duckduckgo_search.DDGS); either may be None.
+
+  DDG_REPLAY / DDG_RECORD swap in offline stand-ins (see replay.py).
+  """
+  from replay import ddgs_cls_from_env, make_recording_ddgs
+
+  fake_cls = ddgs_cls_from_env()
+  if fake_cls is not None:
+    return fake_cls, None
+
+  new_ddgs_cls = None
+  legacy_ddgs_cls = None
+
+  try:
+    from ddgs import DDGS as NewDDGS
+    new_ddgs_cls = NewDDGS
+  except Exception:
+    pass
+
+  try:
+    warnings.simplefilter("ignore", RuntimeWarning)
+    from duckduckgo_search import DDGS as LegacyDDGS
+    legacy_ddgs_cls = LegacyDDGS
+  except Exception:
+    pass
+
+  record = os.getenv("DDG_RECORD", "").strip()
+  if record and new_ddgs_cls:
+    new_ddgs_cls = make_recording_ddgs(new_ddgs_cls, record)
+  elif record and legacy_ddgs_cls:
+    legacy_ddgs_cls = make_recording_ddgs(legacy_ddgs_cls, record)
+  return new_ddgs_cls, legacy_ddgs_cls
+
+
 def _parse_exclude_domains(payload: dict) -> set:
   raw = payload.get("excludeDomains")
   out = set()
@@ -334,18 +728,38 @@ def _parse_exclude_domains(payload: dict) -> set:
   return out
 
 
-def main():
-  try:
-    raw = sanitize_text(sys.stdin.read())
-    payload = json.loads(raw) if raw else {}
+def _metrics_mode(payload: dict) -> str:
+  if isinstance(payload.get("revalidate"), dict):
+    return "revalidate"
+  return "multi" if isinstance(payload.get("queries"), list) and _parse_queries(payload) else "single"
+
+
+def search(payload: dict, metrics_extra: dict | None = None) -> dict | None:
+  """One stdin payload -> the JSON written to stdout (None for a background revalidate).
 
-    query = sanitize_text(payload.get("query", "")).strip()
+  Also called in-process by agent_server.py; metrics_extra collects cache/result counts.
+  """
+  pool = None
+  if metrics_extra is None:
+    metrics_extra = {}
+  try:
+    if isinstance(payload.get("revalidate"), dict):
+      # background refresh spawned by a stale cache hit; nobody reads the output
+      _revalidate(payload["revalidate"])
+      return None
+
+    queries = _parse_queries(payload)
+    # Multi-query fan-out: {"queries": [...]} -> one process, one global enrich/dedup/diversify.
+    multi = isinstance(payload.get("queries"), list) and len(queries) > 0
     count = int(payload.get("count", 20))
+    per_query_count = int(payload.get("perQueryCount") or count)
+    max_concurrency = max(1, int(payload.get("maxConcurrency", 4) or 4))
     region = sanitize_text(payload.get("region", "cn-zh"))
 
-    if not query:
-      print(json.dumps({"error": "query is required"}, ensure_ascii=False))
-      return
+    if not queries:
+      return search_error("query is required")
+    # primary query (logs); retries are built per query from that query's own results
+    query = queries[0]
 
     # Determine seed domain (the page user is highlighting). Caller can pass seedUrl/pageUrl.
     seed_url = sanitize_text(payload.get("seedUrl") or payload.get("pageUrl") or "").strip()
@@ -370,6 +784,16 @@ def main():
     anti_dominant_retry = bool(payload.get("antiDominantRetry", True))
     anti_dominant_topk = int(payload.get("antiDominantTopK", 2) or 2)
     include_meta = bool(payload.get("includeMeta", False))
+    # collapsing syndicated copies is opt-in: payload nearDup, else DDG_NEAR_DUP=1
+    near_dup = payload.get("nearDup")
+    if near_dup is None:
+      near_dup = os.getenv("DDG_NEAR_DUP", "").strip() == "1"
+    near_dup = bool(near_dup)
+    # caps count subdomains of one registrable domain (news./finance.sina.com.cn) as one source
+    group_by_site = bool(payload.get("groupBySite", True))
+    # optional numeric result field (e.g. "clusterSize") to order diversification by
+    score_by = sanitize_text(payload.get("scoreBy") or "").strip()
+    near_dup_threshold = float(payload.get("nearDupThreshold", 0.8) or 0.8)
 
     # If caller provided seed_url, default to enforcing external domains.
     enforce_external = payload.get("enforceExternal")
@@ -377,106 +801,259 @@ def main():
       enforce_external = True if seed_domain else False
     enforce_external = bool(enforce_external)
 
-    # ddgs import
-    new_ddgs_cls = None
-    legacy_ddgs_cls = None
-
-    try:
-      from ddgs import DDGS as NewDDGS
-      new_ddgs_cls = NewDDGS
-    except Exception:
-      pass
-
-    try:
-      warnings.simplefilter("ignore", RuntimeWarning)
-      from duckduckgo_search import DDGS as LegacyDDGS
-      legacy_ddgs_cls = LegacyDDGS
-    except Exception:
-      pass
+    new_ddgs_cls, legacy_ddgs_cls = _load_ddgs_classes()
 
     if not new_ddgs_cls and not legacy_ddgs_cls:
-      print(json.dumps({"error": "ddgs/duckduckgo_search not available"}, ensure_ascii=False))
-      return
+      return search_error("ddgs/duckduckgo_search not available")
 
     backend = sanitize_text(payload.get("backend", "auto"))
     if backend == "html":
       backend = "auto"
 
-    safe_stderr(f"[ddg_search] backend={backend} region={region} query={query[:80]} seedDomain={seed_domain or '-'}\n")
+    safe_stderr(f"[ddg_search] backend={backend} region={region} query={query[:80]} seedDomain={seed_domain or '-'}"
+                + (f" queries={len(queries)}" if multi else "") + "\n")
 
     ddgs_cls = new_ddgs_cls or legacy_ddgs_cls
     backend2 = backend if new_ddgs_cls else "html"
-
-    # --- first search ---
-    try:
-      results = collect_results(ddgs_cls, query, count, backend2, region)
-    except Exception as e:
-      # one retry
-      safe_stderr(f"[ddg_search] retry after error ({sanitize_text(str(e))[:120]})\n")
-      results = collect_results(ddgs_cls, query, count, backend2, region)
-
-    results = _dedup_by_url(_enrich(results))
+    pool = _SessionPool(ddgs_cls)
+    cache = None if payload.get("noCache") else _get_search_cache()
+    cache_stats = _CacheStats()
+    metrics_extra["cache"] = cache_stats.counts
+
+    def _follow_up(q2, group):
+      more = _cached_search(pool, ddgs_cls, q2, count, backend2, region, cache, cache_stats, attempts=1)
+      if multi:
+        for r in more:
+          r.query = group
+      return more
+
+    # Speculative mode: likely follow-up searches start alongside the first search and
+    # are kept or dropped afterwards with the usual thresholds (bounded by a deadline).
+    speculative = payload.get("speculative")
+    if speculative is None:
+      speculative = os.getenv("DDG_SPECULATIVE", "").strip() == "1"
+    speculative = bool(speculative)
+    spec_deadline = time.monotonic() + max(0, int(payload.get("speculativeDeadlineMs", 8000) or 8000)) / 1000.0
+    # deadlineMs (set by the Node multi-query path): answer with what has arrived by then
+    deadline_ms = int(payload.get("deadlineMs") or 0)
+    deadline = time.monotonic() + deadline_ms / 1000.0 if deadline_ms > 0 else None
+    searches = [{"kind": "primary", "q": q, "speculative": False, "used": True} for q in queries]
+    spec = {}
+
+    def _search_entry(kind, q2, group, speculative):
+      entry = {"kind": kind, "q": q2, "speculative": speculative, "used": False}
+      if multi:
+        entry["group"] = group
+      searches.append(entry)
+      return entry
+
+    def _spec_launch(kind, group, q2):
+      entry = _search_entry(kind, q2, group, True)
+      spec[(kind, group)] = (_submit_daemon(_follow_up, q2, group), entry)
+
+    def _spec_take(key):
+      """Results of a launched speculative search, or None (not launched / failed / past deadline)."""
+      if key not in spec:
+        return None
+      fut, entry = spec.pop(key)
+      try:
+        more = fut.result(timeout=max(0.0, spec_deadline - time.monotonic()))
+      except FutureTimeout:
+        entry["status"] = "timeout"
+        fut.cancel()
+        return None
+      except Exception:
+        entry["status"] = "error"
+        return None
+      entry["used"] = True
+      entry["status"] = "kept"
+      return more
+
+    def _spec_drop(key):
+      if key in spec:
+        fut, entry = spec.pop(key)
+        fut.cancel()
+        entry["status"] = "discarded"
+
+    def _one_follow_up(group, q2):
+      if deadline is not None and time.monotonic() >= deadline:
+        return None, "timeout"
+      try:
+        return _follow_up(q2, group), "kept"
+      except Exception:
+        return None, "error"
+
+    def _run_follow_ups(kind, jobs):
+      """jobs: [(group query, retry query)] -> results per job (None if failed / past the deadline).
+
+      Several groups run concurrently with the first round's slot limit and deadline.
+      """
+      entries = [_search_entry(kind, q2, group, False) for group, q2 in jobs]
+      if len(jobs) == 1:
+        outs = [_one_follow_up(*jobs[0])]
+      else:
+        slots = threading.BoundedSemaphore(min(max_concurrency, len(jobs)))
+
+        def _bounded(group, q2):
+          with slots:
+            return _one_follow_up(group, q2)
+
+        futs = [_submit_daemon(_bounded, group, q2) for group, q2 in jobs]
+        wait(futs, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+        outs = [f.result() if f.done() else (None, "timeout") for f in futs]
+      for entry, (more, status) in zip(entries, outs):
+        entry["status"] = status
+        entry["used"] = more is not None
+      return [more for more, _ in outs]
+
+    def _merge(results, more):
+      if more is None:
+        return results
+      return _dedup_by_url(results + _dedup_by_url(more))
+
+    def _groups(items):
+      """(query, its rows) per query; retries are built from each query's own results."""
+      if not multi:
+        return [(query, items)] if items else []
+      by_query = {}
+      for r in items:
+        by_query.setdefault(r.query, []).append(r)
+      return [(q, by_query[q]) for q in queries if by_query.get(q)]
+
+    def _exclude_query(group, domains):
+      return group + " " + " ".join([f"-site:{d}" for d in domains])
+
+    def _dominant_domains(items):
+      dom_cnt = {}
+      for it in items:
+        d = it.get("sourceDomain") or ""
+        if d:
+          dom_cnt[d] = dom_cnt.get(d, 0) + 1
+      return [d for (d, _) in sorted(dom_cnt.items(), key=lambda x: x[1], reverse=True)]
+
+    if speculative and enforce_external and exclude_domains:
+      # the dominant domains aren't known yet: exclude the seed + configured domains
+      guess = ([seed_domain] if seed_domain else []) + sorted(d for d in exclude_domains if d != seed_domain)
+      guess = guess[:max(2, anti_dominant_topk + 1)]
+      if guess:
+        for q in queries:
+          _spec_launch("external", q, _exclude_query(q, guess))
+
+    # --- first search (one per query, concurrently over pooled sessions) ---
+    def _first(q):
+      try:
+        return q, _cached_search(pool, ddgs_cls, q, per_query_count, backend2, region, cache, cache_stats), None
+      except Exception as e:
+        return q, [], e
+
+    if len(queries) == 1 and deadline is None:
+      rounds = [_first(queries[0])]
+    else:
+      # daemon threads + a slot limit: at the deadline the finished queries are returned
+      # and the slow ones are reported as timed out instead of holding up everything
+      slots = threading.BoundedSemaphore(min(max_concurrency, len(queries)))
+
+      def _bounded(q):
+        with slots:
+          return _first(q)
+
+      futs = [_submit_daemon(_bounded, q) for q in queries]
+      wait(futs, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+      rounds = [f.result() if f.done() else (q, [], TimeoutError("deadline passed"))
+                for q, f in zip(queries, futs)]
+
+    errors = [err for (_, _, err) in rounds if err is not None]
+    if len(errors) == len(rounds):
+      raise errors[0]
+
+    query_meta = []
+    first_rows = []
+    for q, rows, err in rounds:
+      entry = {"q": q, "count": len(rows)}
+      if err is not None:
+        entry["error"] = sanitize_text(str(err))[:200]
+      query_meta.append(entry)
+      if multi:
+        for r in rows:
+          r.query = q
+      first_rows.extend(rows)
+
+    results = _dedup_by_url(first_rows)
+
+    if speculative and anti_dominant_retry and results:
+      # launch the diversity retries now instead of after the external retry
+      for q, rows in _groups(results):
+        exclude = _dominant_domains(rows)[:max(1, anti_dominant_topk)]
+        if exclude:
+          _spec_launch("diversity", q, _exclude_query(q, exclude))
 
     # --- external-domain enforcement retry (exclude seed domain / excluded domains) ---
+    # Needed when the merged results lack outside sources (then so does every query's
+    # share of them): each query gets its own retry, tagged with that query.
+    min_external = max(1, min_external_domains)
+    external_needed = False
     if enforce_external and exclude_domains and results:
-      ext = _unique_domains(results, exclude_set=exclude_domains)
-      if len(ext) < max(1, min_external_domains):
-        # Exclude seed + maybe other dominant domains to get more outside sources.
-        # Keep the exclude list small to avoid killing recall.
-        # Priority: seedDomain first, then dominant domains in current results.
-        dom_cnt = {}
-        for it in results:
-          d = it.get("sourceDomain") or ""
-          if not d:
-            continue
-          dom_cnt[d] = dom_cnt.get(d, 0) + 1
-        dominant = [d for (d, _) in sorted(dom_cnt.items(), key=lambda x: x[1], reverse=True)]
-
-        exclude_list = []
-        if seed_domain:
-          exclude_list.append(seed_domain)
-        for d in dominant:
-          if d == seed_domain:
-            continue
-          if d in exclude_domains:
-            exclude_list.append(d)
-          elif len(exclude_list) < max(2, anti_dominant_topk + 1):
-            # add a couple more dominant sites
-            exclude_list.append(d)
-          if len(exclude_list) >= max(2, anti_dominant_topk + 1):
-            break
-
-        exclude_list = [d for d in exclude_list if d]
-        if exclude_list:
-          q2 = query + " " + " ".join([f"-site:{d}" for d in exclude_list])
-          safe_stderr(f"[ddg_search] external retry exclude={exclude_list}\n")
-          try:
-            more = collect_results(ddgs_cls, q2, count, backend2, region)
-            more = _dedup_by_url(_enrich(more))
-            results = _dedup_by_url(results + more)
-          except Exception:
-            pass
+      external_needed = len(_unique_domains(results, exclude_set=exclude_domains)) < min_external
+    jobs = []
+    for q, rows in (_groups(results) if external_needed else []):
+      if ("external", q) in spec:
+        safe_stderr(f"[ddg_search] external retry (speculative) q={q[:80]}\n")
+        results = _merge(results, _spec_take(("external", q)))
+        continue
+      # Exclude seed + maybe other dominant domains to get more outside sources.
+      # Keep the exclude list small to avoid killing recall.
+      # Priority: seedDomain first, then dominant domains in this query's results.
+      dominant = _dominant_domains(rows)
+
+      exclude_list = []
+      if seed_domain:
+        exclude_list.append(seed_domain)
+      for d in dominant:
+        if d == seed_domain:
+          continue
+        if d in exclude_domains:
+          exclude_list.append(d)
+        elif len(exclude_list) < max(2, anti_dominant_topk + 1):
+          # add a couple more dominant sites
+          exclude_list.append(d)
+        if len(exclude_list) >= max(2, anti_dominant_topk + 1):
+          break
+
+      exclude_list = [d for d in exclude_list if d]
+      if exclude_list:
+        safe_stderr(f"[ddg_search] external retry exclude={exclude_list} q={q[:80]}\n")
+        jobs.append((q, _exclude_query(q, exclude_list)))
+    for more in (_run_follow_ups("external", jobs) if jobs else []):
+      results = _merge(results, more)
 
     # --- existing anti-dominant retry (general diversity) ---
+    min_unique = max(2, min_unique_domains)
+    diversity_needed = False
     if anti_dominant_retry and results:
-      dom_cnt = {}
-      for it in results:
-        d = it.get("sourceDomain") or ""
-        if d:
-          dom_cnt[d] = dom_cnt.get(d, 0) + 1
-      unique_dom = len(dom_cnt)
-      if unique_dom < max(2, min_unique_domains):
-        top_domains = sorted(dom_cnt.items(), key=lambda x: x[1], reverse=True)
-        exclude = [d for (d, _) in top_domains[:max(1, anti_dominant_topk)] if d]
-        if exclude:
-          q2 = query + " " + " ".join([f"-site:{d}" for d in exclude])
-          safe_stderr(f"[ddg_search] diversity retry exclude={exclude}\n")
-          try:
-            more = collect_results(ddgs_cls, q2, count, backend2, region)
-            more = _dedup_by_url(_enrich(more))
-            results = _dedup_by_url(results + more)
-          except Exception:
-            pass
+      diversity_needed = len(_unique_domains(results)) < min_unique
+    jobs = []
+    for q, rows in (_groups(results) if diversity_needed else []):
+      if ("diversity", q) in spec:
+        safe_stderr(f"[ddg_search] diversity retry (speculative) q={q[:80]}\n")
+        results = _merge(results, _spec_take(("diversity", q)))
+        continue
+      exclude = _dominant_domains(rows)[:max(1, anti_dominant_topk)]
+      if exclude:
+        safe_stderr(f"[ddg_search] diversity retry exclude={exclude} q={q[:80]}\n")
+        jobs.append((q, _exclude_query(q, exclude)))
+    for more in (_run_follow_ups("diversity", jobs) if jobs else []):
+      results = _merge(results, more)
+
+    # speculative searches that were not needed
+    for key in list(spec):
+      _spec_drop(key)
+
+    # --- collapse syndicated copies (same story on many portals) ---
+    collapsed = 0
+    if near_dup:
+      before = len(results)
+      results = _collapse_near_dups(results, threshold=near_dup_threshold, exclude_set=exclude_domains)
+      collapsed = before - len(results)
 
     # --- diversify selection ---
     if diversify:
@@ -485,13 +1062,17 @@ def main():
         count,
         per_domain_cap,
         per_author_cap,
-        exclude_domains,
+        {registrable_domain(d) for d in exclude_domains} if group_by_site else exclude_domains,
         excluded_domain_cap,
         (min_external_domains if enforce_external else 0),
+        scores=_scores_from_field(results, score_by) if score_by else None,
+        group_key="sourceSite" if group_by_site else "sourceDomain",
       )
     else:
       results = results[:count]
 
+    metrics_extra["results"] = len(results)
+    metrics_extra["nearDuplicatesCollapsed"] = collapsed
     if include_meta:
       meta = {
         "seedDomain": seed_domain,
@@ -499,12 +1080,35 @@ def main():
         "uniqueDomains": sorted(list(_unique_domains(results, exclude_set=set()))),
         "uniqueExternalDomains": sorted(list(_unique_domains(results, exclude_set=exclude_domains))) if exclude_domains else [],
       }
-      print(json.dumps({"results": results, "meta": meta}, ensure_ascii=False))
-    else:
-      print(json.dumps({"results": results}, ensure_ascii=False))
+      if multi:
+        meta["queries"] = query_meta
+      meta["searches"] = searches
+      meta["nearDuplicatesCollapsed"] = collapsed
+      if cache is not None and cache.enabled:
+        meta["cache"] = dict(cache_stats.counts)
+      return {"results": [c.to_dict() for c in results], "meta": meta}
+    return {"results": [c.to_dict() for c in results]}
+  finally:
+    if pool is not None:
+      pool.close()
+
+
+def main():
+  failed = False
+  metrics_mode = "single"
+  metrics_extra = {}
+  try:
+    payload = load_stdin_json()
+    metrics_mode = _metrics_mode(payload)
+    out = search(payload, metrics_extra)
+    if out is not None:
+      write_json(out, newline=True)
 
   except Exception as e:
-    print(json.dumps({"error": sanitize_text(str(e))}, ensure_ascii=False))
+    failed = True
+    write_json(search_error(str(e)), newline=True)
+  finally:
+    metrics.flush("ddg_search", metrics_mode, ok=not failed, **metrics_extra)
 
 
 if __name__ == "__main__":
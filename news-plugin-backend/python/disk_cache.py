@@ -0,0 +1,195 @@
+"""SQLite-backed key/value cache shared by the spawned Python processes.
+
+- content-addressed keys (sha256 of the request parameters)
+- TTL per entry, size cap with LRU eviction (by last access time)
+- WAL + busy_timeout so many runner processes can read/write concurrently
+- cache errors never fail a request: they degrade to a miss / no-op
+
+Env:
+  AGENT_CACHE=0                 disable the LLM cache entirely
+  AGENT_CACHE_PATH              sqlite file (default: <tmp>/bubblepop_cache.sqlite3)
+  AGENT_CACHE_TTL_S             entry lifetime in seconds (default 3600)
+  AGENT_CACHE_MAX_ENTRIES       LRU size cap (default 2000)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "bubblepop_cache.sqlite3")
+
+
+def env_num(name: str, fallback, cast=int, minimum=None):
+    """Numeric env knob; unset, unparsable or out-of-range values give fallback.
+
+    By default only values > 0 count; pass minimum=0 for knobs where 0 is meaningful.
+    """
+    try:
+        n = cast(os.getenv(name, ""))
+        ok = n > 0 if minimum is None else n >= minimum
+        return n if ok else fallback
+    except Exception:
+        return fallback
+
+
+def cache_key(*parts) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8", errors="replace")).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, path: str | None = None, namespace: str = "llm", ttl_s: float = 3600,
+                 max_entries: int = 2000, enabled: bool = True, stale_s: float = 0):
+        self.path = path or DEFAULT_PATH
+        self.namespace = namespace
+        self.ttl_s = ttl_s
+        # entries older than ttl_s but within ttl_s + stale_s are only served by get_entry()
+        self.stale_s = stale_s
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (ns, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (ns, accessed)")
+            self._conn = conn
+        return self._conn
+
+    def _warn(self, op: str, err: Exception):
+        if os.getenv("AGENT_DEBUG", "").strip() == "1":
+            sys.stderr.write(f"[cache] {op} failed: {err}\n")
+            sys.stderr.flush()
+
+    def get(self, key: str):
+        """Return the cached value, or None on miss/expiry/error."""
+        entry = self.get_entry(key)
+        if entry is None or entry[1]:
+            return None
+        return entry[0]
+
+    def get_entry(self, key: str):
+        """(value, is_stale) or None. Stale = past ttl_s but inside the stale_s window."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT value, created FROM entries WHERE ns = ? AND key = ?", (self.namespace, key)
+                ).fetchone()
+                if row is None or now - row[1] > self.ttl_s + self.stale_s:
+                    if row is not None:
+                        conn.execute("DELETE FROM entries WHERE ns = ? AND key = ?", (self.namespace, key))
+                    self.misses += 1
+                    return None
+                conn.execute(
+                    "UPDATE entries SET accessed = ? WHERE ns = ? AND key = ?", (now, self.namespace, key)
+                )
+            stale = now - row[1] > self.ttl_s
+            if not stale:
+                self.hits += 1
+            return json.loads(row[0]), stale
+        except (sqlite3.Error, ValueError, OSError) as e:
+            self._warn("get", e)
+            self.misses += 1
+            return None
+
+    def claim(self, key: str, lease_s: float) -> bool:
+        """Take a short cross-process lease on key (e.g. one revalidation at a time)."""
+        if not self.enabled:
+            return False
+        now = time.time()
+        lease_key = "lease:" + key
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        "SELECT created FROM entries WHERE ns = ? AND key = ?", (self.namespace, lease_key)
+                    ).fetchone()
+                    if row is not None and now - row[0] < lease_s:
+                        return False
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries (ns, key, value, created, accessed) VALUES (?, ?, '1', ?, ?)",
+                        (self.namespace, lease_key, now, now),
+                    )
+                    return True
+                finally:
+                    conn.execute("COMMIT")
+        except (sqlite3.Error, OSError) as e:
+            self._warn("claim", e)
+            return False
+
+    def put(self, key: str, value) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            raw = json.dumps(value, ensure_ascii=False)
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (ns, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, raw, now, now),
+                )
+                self._evict(conn, now)
+        except (sqlite3.Error, TypeError, ValueError, OSError) as e:
+            self._warn("put", e)
+
+    def _evict(self, conn, now: float):
+        conn.execute(
+            "DELETE FROM entries WHERE ns = ? AND created < ?", (self.namespace, now - self.ttl_s - self.stale_s)
+        )
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries WHERE ns = ?", (self.namespace,)).fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM entries WHERE ns = ? AND key IN ("
+                " SELECT key FROM entries WHERE ns = ? ORDER BY accessed ASC LIMIT ?)",
+                (self.namespace, self.namespace, overflow),
+            )
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> DiskCache:
+    """Process-wide cache for parsed LLM results, configured from env."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = DiskCache(
+                path=os.getenv("AGENT_CACHE_PATH") or None,
+                namespace="llm",
+                ttl_s=env_num("AGENT_CACHE_TTL_S", 3600.0, float),
+                max_entries=env_num("AGENT_CACHE_MAX_ENTRIES", 2000),
+                enabled=os.getenv("AGENT_CACHE", "1").strip() != "0",
+            )
+        return _llm_cache
+
+
+def llm_cache_key(model: str, system_msg: str, user_msg: str, temperature: float, max_tokens) -> str:
+    return cache_key("chat", model, system_msg, user_msg, temperature, max_tokens)
@@ -0,0 +1,254 @@
+"""Per-event state for incremental re-analysis.
+
+A re-run of the same story (same QUERY, overlapping snippets) only needs the
+model to look at the snippets it has not seen yet. The store keeps, per
+normalized query, the last merged sections and the keys of the snippets that went
+into them (normalized URL, or title when there is no URL, plus the normalized
+date / title / snippet text, so an updated snippet at a known URL counts as new):
+
+    {"fingerprint", "snippets": [...], "articleKey",
+     "summary", "timeline", "stances", "relatedEvents", "updated"}
+
+plan() decides how a run proceeds:
+    None          no usable prior state -> full analysis
+    unchanged     same query + exactly the same snippet set (+ same article) -> prior
+                  result, no model calls
+    delta         only the new snippet blocks are sent, each step gets a compact
+                  view of its prior section (prefix()) and the output is merged
+                  into the prior state with merge_section()
+A snippet set that only drops snippets, or a request with {"refresh": true}, gets a
+full analysis that replaces the stored state.
+
+Env:
+  AGENT_INCREMENTAL=1               keep per-event state (default 0: always analyze from scratch)
+  AGENT_EVENT_TTL_S                 state lifetime in seconds (default 259200 = 3 days)
+  AGENT_EVENT_MIN_OVERLAP           share of current snippets already seen before the
+                                    prior state is reused (default 0.2)
+  AGENT_EVENT_MAX_ITEMS             cap per merged list section (default 40)
+"""
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from disk_cache import DiskCache, cache_key, env_num
+from packing import parse_raw_text
+
+_DATE = re.compile(r"(\d{4})\D{0,3}(\d{1,2})\D{0,3}(\d{1,2})")
+_SPACES = re.compile(r"\s+")
+
+# prefix instructions: the step prompts stay as they are, the user content explains the delta
+_DELTA_NOTE = {
+    "0": "【增量分析】上面是该事件已有的概括，下面只给出新增的搜索摘要。请结合已有概括与新增信息，输出更新后的一句话概括。",
+    "A": "【增量分析】上面是已整理的时间轴（日期 | 标题 | 来源），下面只给出新增的搜索摘要。"
+         "只输出新增摘要中出现、且与已有条目不重复的时间节点；没有则输出空数组。",
+    "B": "【增量分析】上面是已识别的相关方（名称 | 立场），下面只给出新增的搜索摘要。"
+         "只输出新出现的相关方，或立场发生变化的已有相关方（沿用原名称）；没有则输出空数组。",
+    "C": "【增量分析】上面是已推荐的关联事件，下面只给出新增的搜索摘要。只输出与已有条目不同的关联事件；没有则输出空数组。",
+}
+_SECTION_FOR_STEP = {"0": "summary", "A": "timeline", "B": "stances", "C": "relatedEvents"}
+
+
+def enabled() -> bool:
+    return os.getenv("AGENT_INCREMENTAL", "0").strip() == "1"
+
+
+def _norm_text(s) -> str:
+    return _SPACES.sub(" ", str(s or "")).strip().lower()
+
+
+def _norm_url(url: str) -> str:
+    try:
+        parts = urlsplit(str(url or "").strip())
+    except ValueError:
+        return ""
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if not host:
+        return ""
+    path = parts.path.rstrip("/")
+    return f"{host}{path}" + (f"?{parts.query}" if parts.query else "")
+
+
+def snippet_key(block: dict) -> str:
+    url = _norm_url(block.get("URL"))
+    return url or "t:" + _norm_text(block.get("TITLE") or block.get("SNIPPET"))[:120]
+
+
+def _content_key(block: dict) -> str:
+    """snippet_key plus the snippet's text: the same URL with a rewritten snippet is a new snippet."""
+    text = [_norm_text(block.get(k)) for k in ("DATE", "TITLE", "SNIPPET")]
+    return cache_key(snippet_key(block), *text)[:24]
+
+
+def _query(parsed: dict) -> str:
+    for line in parsed["header"]:
+        if line.startswith("QUERY:"):
+            return _norm_text(line[len("QUERY:"):])
+    return ""
+
+
+def _date_sort_key(item: dict) -> tuple:
+    m = _DATE.search(str(item.get("date") or ""))
+    if not m:
+        return (1, "")
+    return (0, f"{m.group(1)}{int(m.group(2)):02d}{int(m.group(3)):02d}")
+
+
+def _item_key(section: str, item: dict) -> str:
+    if section == "timeline":
+        return _norm_url(item.get("url")) or "t:" + _norm_text(item.get("date")) + "|" + _norm_text(item.get("title"))
+    if section == "stances":
+        return _norm_text(item.get("party"))
+    return _norm_text(item.get("eventName"))
+
+
+def merge_section(section: str, prior, new):
+    """Deterministic merge of one section; prior order wins, new items are appended.
+
+    timeline: dedup by url (date+title without one), stable-sorted by date
+    stances: a re-reported party replaces its prior entry in place
+    relatedEvents: dedup by eventName
+    """
+    if section == "summary":
+        return new if isinstance(new, str) and new.strip() else (prior or "")
+    prior = [x for x in (prior or []) if isinstance(x, dict)]
+    new = [x for x in (new or []) if isinstance(x, dict)]
+    out = list(prior)
+    index = {_item_key(section, x): i for i, x in enumerate(out)}
+    for item in new:
+        k = _item_key(section, item)
+        if k in index:
+            if section == "stances":
+                out[index[k]] = item
+            continue
+        index[k] = len(out)
+        out.append(item)
+    if section == "timeline":
+        out.sort(key=_date_sort_key)
+    return out[:env_num("AGENT_EVENT_MAX_ITEMS", 40)]
+
+
+def prefix(agent_key: str, state: dict) -> str:
+    """Compact view of the prior section for one step (or all four for "fused")."""
+    if agent_key == "fused":
+        return "\n\n".join(prefix(k, state) for k in ("0", "A", "B", "C"))
+    if agent_key == "0":
+        body = f"PRIOR_SUMMARY: {state.get('summary') or ''}"
+    elif agent_key == "A":
+        rows = [f"{t.get('date', '')} | {t.get('title', '')} | {t.get('sourceName', '')}"
+                for t in state.get("timeline") or []]
+        body = "PRIOR_TIMELINE:\n" + "\n".join(rows)
+    elif agent_key == "B":
+        rows = [f"{s.get('party', '')} | {s.get('stance', '')}" for s in state.get("stances") or []]
+        body = "PRIOR_STAKEHOLDERS:\n" + "\n".join(rows)
+    else:
+        rows = [str(e.get("eventName", "")) for e in state.get("relatedEvents") or []]
+        body = "PRIOR_ASSOCIATIONS:\n" + "\n".join(rows)
+    return f"{body}\n{_DELTA_NOTE[agent_key]}"
+
+
+def _render_delta(parsed: dict, blocks: list, with_article: bool) -> str:
+    parts = list(parsed["header"])
+    parts.append("SNIPPETS:")
+    for b in blocks:
+        lines = [f"#{b['n']}"] + [f"{k}: {b[k]}" for k in ("DATE", "SOURCE", "TITLE", "SNIPPET", "URL") if b.get(k)]
+        parts.append("\n".join(lines))
+        parts.append("")
+    if with_article:
+        if parsed["articleTitle"]:
+            parts.append(f"ARTICLE_TITLE: {parsed['articleTitle']}")
+        parts.append("ARTICLE_TEXT:")
+        parts.append(parsed["articleText"])
+    return "\n".join(parts)
+
+
+class Plan:
+    def __init__(self, key: str, fingerprint: str, snippets: list, article_key: str,
+                 state: dict | None = None, delta_text: str | None = None, new_count: int = 0):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.snippets = snippets
+        self.article_key = article_key
+        self.state = state
+        self.delta_text = delta_text
+        self.new_count = new_count
+
+    @property
+    def unchanged(self) -> bool:
+        return self.state is not None and self.delta_text is None
+
+    @property
+    def delta(self) -> bool:
+        return self.state is not None and self.delta_text is not None
+
+
+class EventStore:
+    def __init__(self, cache: DiskCache):
+        self.cache = cache
+
+    def plan(self, raw_text: str, refresh: bool = False) -> Plan | None:
+        """Plan for this rawText; None when it has no QUERY / snippet blocks.
+
+        refresh: ignore the stored state (full analysis, saved over it).
+        """
+        parsed = parse_raw_text(raw_text)
+        query = _query(parsed)
+        if not query or not parsed["blocks"]:
+            return None
+        keys = [_content_key(b) for b in parsed["blocks"]]
+        article_key = cache_key(parsed["articleTitle"], parsed["articleText"]) if parsed["articleText"] else ""
+        # the state is found by query; whether it can be reused is decided by the full snippet set
+        fingerprint = cache_key("event", query, sorted(set(keys)), article_key)
+        plan = Plan(cache_key("event", query), fingerprint, sorted(set(keys)), article_key)
+        if refresh:
+            return plan
+        state = self.cache.get(plan.key)
+        if not isinstance(state, dict):
+            return plan
+        if state.get("fingerprint") == fingerprint:
+            plan.state = state
+            return plan
+        seen = set(state.get("snippets") or [])
+        new_blocks = [b for b, k in zip(parsed["blocks"], keys) if k not in seen]
+        if not new_blocks and state.get("articleKey") == article_key:
+            # fewer snippets than last time: the prior result covers snippets this run lacks
+            return plan
+        overlap = 1 - len(new_blocks) / len(keys)
+        if overlap < env_num("AGENT_EVENT_MIN_OVERLAP", 0.2, float, minimum=0):
+            # mostly different results for the same words: treat as a new event
+            return plan
+        plan.snippets = sorted(seen | set(keys))
+        plan.state = state
+        plan.new_count = len(new_blocks)
+        plan.delta_text = _render_delta(parsed, new_blocks, state.get("articleKey") != article_key)
+        return plan
+
+    def save(self, plan: Plan, sections: dict):
+        self.cache.put(plan.key, {
+            "fingerprint": plan.fingerprint,
+            "snippets": plan.snippets,
+            "articleKey": plan.article_key,
+            "updated": time.time(),
+            **{name: sections.get(name) for name in _SECTION_FOR_STEP.values()},
+        })
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_event_store() -> EventStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EventStore(DiskCache(
+                path=os.getenv("AGENT_CACHE_PATH") or None,
+                namespace="event",
+                ttl_s=env_num("AGENT_EVENT_TTL_S", 259200.0, float),
+                max_entries=env_num("AGENT_CACHE_MAX_ENTRIES", 2000),
+                enabled=enabled(),
+            ))
+        return _store
@@ -0,0 +1,214 @@
+"""Hedged LLM calls with thresholds learned from recent latency.
+
+hedged_call(key, fn) runs fn(); if it has not returned after the
+AGENT_HEDGE_PERCENTILE latency of recent calls with the same key (a runner mode
+or an analyzer step), a duplicate call is started and whichever finishes first
+wins. The slower one keeps running on a daemon thread and is ignored.
+
+Latency histograms (log-spaced buckets, exponentially decayed) and the
+call/hedge counters are kept per key in the shared SQLite cache file, so every
+spawned process learns from the previous ones. Hedges are capped at
+AGENT_HEDGE_BUDGET x calls for that key.
+
+timeout_s(key, fallback) turns the same histogram into a per-mode/per-step
+request timeout: AGENT_TIMEOUT_FACTOR x p99, clamped to
+[AGENT_TIMEOUT_MIN_S, fallback]. Until a key has enough samples the fallback is used.
+
+Off by default: a hedge doubles the cost of a slow call, and the 5 s timeout
+floor only makes sense once latencies have been learned for the deployment.
+
+Env:
+  AGENT_HEDGE=1                 hedge and learn timeouts (default 0: never hedge, don't record latencies)
+  AGENT_HEDGE_PERCENTILE        hedge after this latency percentile (default 0.9)
+  AGENT_HEDGE_BUDGET            max hedges per call (default 0.1; 0 only learns timeouts)
+  AGENT_HEDGE_MIN_MS            never hedge earlier than this (default 1500)
+  AGENT_HEDGE_MIN_SAMPLES       samples needed before hedging a key (default 20)
+  AGENT_TIMEOUT_FACTOR          timeout = factor x learned p99 (default 3)
+  AGENT_TIMEOUT_MIN_S           lower bound for learned timeouts (default 5)
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from disk_cache import DiskCache, env_num
+
+# bucket i covers [BASE_MS * GROWTH**i, BASE_MS * GROWTH**(i+1)); last bucket is open-ended
+BASE_MS = 100.0
+GROWTH = 1.25
+N_BUCKETS = 32
+# weight of history vs. new samples each time a process merges its samples in
+DECAY = 0.98
+
+
+def _bucket(ms: float) -> int:
+    if ms <= BASE_MS:
+        return 0
+    return min(N_BUCKETS - 1, int(math.log(ms / BASE_MS, GROWTH)))
+
+
+def _bucket_upper_ms(i: int) -> float:
+    return BASE_MS * GROWTH ** (i + 1)
+
+
+def _empty() -> dict:
+    return {"buckets": [0.0] * N_BUCKETS, "calls": 0.0, "hedges": 0.0}
+
+
+class LatencyStore:
+    """Per-key decayed histograms; reads once per key, merges this process's samples on flush()."""
+
+    def __init__(self, cache: DiskCache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._known = {}
+        self._pending = {}
+
+    def _state(self, key: str) -> dict:
+        if key not in self._known:
+            stored = self.cache.get(key)
+            self._known[key] = stored if isinstance(stored, dict) and len(stored.get("buckets") or []) == N_BUCKETS \
+                else _empty()
+        return self._known[key]
+
+    def record(self, key: str, latency_ms: float, hedged: bool = False):
+        with self._lock:
+            for target in (self._state(key), self._pending.setdefault(key, _empty())):
+                target["buckets"][_bucket(latency_ms)] += 1
+                target["calls"] += 1
+                target["hedges"] += 1 if hedged else 0
+
+    def percentile_ms(self, key: str, q: float, min_samples: int) -> float | None:
+        with self._lock:
+            buckets = self._state(key)["buckets"]
+            total = sum(buckets)
+            if total < min_samples:
+                return None
+            need = q * total
+            acc = 0.0
+            for i, c in enumerate(buckets):
+                acc += c
+                if acc >= need:
+                    return _bucket_upper_ms(i)
+            return _bucket_upper_ms(N_BUCKETS - 1)
+
+    def hedge_allowed(self, key: str, budget: float) -> bool:
+        with self._lock:
+            s = self._state(key)
+            return s["hedges"] + 1 <= budget * (s["calls"] + 1)
+
+    def flush(self):
+        """Merge this process's samples into the stored histograms (older history decays)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for key, delta in pending.items():
+            stored = self.cache.get(key)
+            if not (isinstance(stored, dict) and len(stored.get("buckets") or []) == N_BUCKETS):
+                stored = _empty()
+            merged = {
+                "buckets": [b * DECAY + d for b, d in zip(stored["buckets"], delta["buckets"])],
+                "calls": stored["calls"] * DECAY + delta["calls"],
+                "hedges": stored["hedges"] * DECAY + delta["hedges"],
+            }
+            self.cache.put(key, merged)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return os.getenv("AGENT_HEDGE", "0").strip() == "1"
+
+
+def get_store() -> LatencyStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LatencyStore(DiskCache(
+                path=os.getenv("AGENT_CACHE_PATH") or None,
+                namespace="latency",
+                ttl_s=7 * 86400,
+                max_entries=500,
+                enabled=enabled(),
+            ))
+        return _store
+
+
+def flush():
+    """Persist this process's latency samples (no-op when nothing was recorded)."""
+    if _store is not None:
+        _store.flush()
+
+
+def timeout_s(key: str, fallback: float) -> float:
+    """Request timeout learned from the p99 latency of key, never above fallback."""
+    if not enabled():
+        return fallback
+    p99 = get_store().percentile_ms(key, 0.99, env_num("AGENT_HEDGE_MIN_SAMPLES", 20))
+    if p99 is None:
+        return fallback
+    learned = p99 / 1000.0 * env_num("AGENT_TIMEOUT_FACTOR", 3.0, float)
+    return min(fallback, max(env_num("AGENT_TIMEOUT_MIN_S", 5.0, float), learned))
+
+
+def _start(fn) -> Future:
+    """fn() on a daemon thread: an abandoned duplicate must not hold up process exit."""
+    fut = Future()
+
+    def _run():
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(fn())
+        except BaseException as e:
+            fut.set_exception(e)
+
+    threading.Thread(target=_run, daemon=True).start()
+    return fut
+
+
+def hedged_call(key: str, fn, on_hedge=None):
+    """fn() with one hedged duplicate past the learned latency threshold for key.
+
+    on_hedge(threshold_s) runs before the duplicate is sent; returning False skips it.
+    """
+    if not enabled():
+        return fn()
+    store = get_store()
+    threshold_ms = store.percentile_ms(
+        key, env_num("AGENT_HEDGE_PERCENTILE", 0.9, float), env_num("AGENT_HEDGE_MIN_SAMPLES", 20)
+    )
+    start = time.monotonic()
+    if threshold_ms is None:
+        result = fn()
+        store.record(key, (time.monotonic() - start) * 1000)
+        return result
+
+    threshold_s = max(threshold_ms, env_num("AGENT_HEDGE_MIN_MS", 1500.0, float, minimum=0)) / 1000.0
+    primary = _start(fn)
+    done, _ = wait([primary], timeout=threshold_s)
+    if done or not store.hedge_allowed(key, env_num("AGENT_HEDGE_BUDGET", 0.1, float, minimum=0)):
+        result = primary.result()
+        store.record(key, (time.monotonic() - start) * 1000)
+        return result
+
+    # on_hedge may veto the duplicate (e.g. no spare rate-limit budget)
+    if on_hedge and on_hedge(threshold_s) is False:
+        result = primary.result()
+        store.record(key, (time.monotonic() - start) * 1000)
+        return result
+    hedge_start = time.monotonic()
+    pending = {primary, _start(fn)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                # the primary's latency is what the percentile should learn (censored at now)
+                store.record(key, (time.monotonic() - start) * 1000, hedged=True)
+                return fut.result()
+            error = fut.exception()
+    store.record(key, (time.monotonic() - hedge_start) * 1000, hedged=True)
+    raise error
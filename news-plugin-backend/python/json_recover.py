@@ -0,0 +1,166 @@
+"""Tolerant JSON-object recovery for model output.
+
+The prompts ask for "Thought: ... Action: {json}", but the model sometimes adds
+prose after the object, leaves a trailing comma, or gets cut off by max_tokens
+in the middle of a string / array. parse_object() tries, in order:
+
+1. the old greedy {...} match parsed as is (fast path, same result as before)
+2. balanced-brace scanning from each "{" (the one after "Action" first), so
+   trailing prose and stray braces in the Thought don't matter
+3. repair of the scanned fragment: trailing commas dropped, an unterminated
+   string closed, open arrays/objects closed; if that is still invalid, the
+   fragment is cut back to the last complete element (comma at any depth) and
+   closed again. Inside a list only the finished items are kept (a truncated
+   timeline keeps its complete entries and drops the half-written one)
+
+Returns (dict, repaired) or (None, False); a repair that recovers no key counts as
+no JSON (a literal {} is still returned as is).
+"""
+import json
+import re
+
+_GREEDY = re.compile(r"(\{.*\})", re.DOTALL)
+_ACTION = re.compile(r"action\s*[:：]?", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+# bounded work per output: start positions tried, and cut-back points per start
+MAX_STARTS = 16
+MAX_CUTS = 64
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _scan(text: str, start: int):
+    """Walk from text[start] == "{".
+
+    -> (end index or None if unbalanced, stack at the end, in_string at the end,
+        [(comma index, stack snapshot)] for commas outside strings, opener positions of the stack)
+    """
+    stack = []
+    opened = []
+    in_str = False
+    escape = False
+    commas = []
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append(ch)
+            opened.append(i)
+        elif ch in "}]":
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                # mismatched closer: treat the fragment as broken here
+                return None, stack, False, commas, opened
+            stack.pop()
+            opened.pop()
+            if not stack:
+                return i, stack, False, commas, opened
+        elif ch == ",":
+            commas.append((i, tuple(stack)))
+    return None, stack, in_str, commas, opened
+
+
+def _strip_trailing_commas(s: str) -> str:
+    # only outside strings: rebuild from the string/non-string segments
+    out = []
+    pos = 0
+    for m in re.finditer(r'"(?:[^"\\]|\\.)*"', s):
+        out.append(_TRAILING_COMMA.sub(r"\1", s[pos:m.start()]))
+        out.append(m.group(0))
+        pos = m.end()
+    out.append(_TRAILING_COMMA.sub(r"\1", s[pos:]))
+    return "".join(out)
+
+
+def _loads_dict(s: str):
+    try:
+        data = json.loads(s)
+    except ValueError:
+        try:
+            data = json.loads(_strip_trailing_commas(s))
+        except ValueError:
+            return None
+    return data if isinstance(data, dict) else None
+
+
+def _close(prefix: str, stack, in_str: bool) -> str:
+    tail = '"' if in_str else ""
+    # a dangling backslash would escape the closing quote
+    if in_str and prefix.endswith("\\") and not prefix.endswith("\\\\"):
+        prefix = prefix[:-1]
+    return prefix + tail + "".join(_CLOSERS[c] for c in reversed(stack))
+
+
+def _repair(text: str, start: int):
+    end, stack, in_str, commas, opened = _scan(text, start)
+    if end is not None:
+        return _loads_dict(text[start:end + 1])
+    if not stack:
+        return None
+    if "[" in stack:
+        # truncated inside a list: keep only its finished items (a half-written
+        # timeline entry would miss required fields), possibly none
+        d = stack.index("[")
+        outer = tuple(stack[:d + 1])
+        cut = opened[d] + 1
+        for pos, snapshot in reversed(commas):
+            if pos < cut:
+                break
+            if snapshot == outer:
+                cut = pos
+                break
+        data = _loads_dict(_close(text[start:cut], outer, False))
+        if data is not None:
+            return data
+    fragment = text[start:].rstrip()
+    data = _loads_dict(_close(fragment, stack, in_str))
+    if data is not None:
+        return data
+    # cut back to the last complete element
+    for pos, snapshot in reversed(commas[-MAX_CUTS:]):
+        data = _loads_dict(_close(text[start:pos], snapshot, False))
+        if data is not None:
+            return data
+    return None
+
+
+def _starts(text: str):
+    starts = []
+    actions = list(_ACTION.finditer(text))
+    if actions:
+        first = text.find("{", actions[-1].end())
+        if first >= 0:
+            starts.append(first)
+    i = text.find("{")
+    while i >= 0 and len(starts) < MAX_STARTS:
+        if i not in starts:
+            starts.append(i)
+        i = text.find("{", i + 1)
+    return starts
+
+
+def parse_object(text: str):
+    """-> (dict, repaired) or (None, False)."""
+    if not text:
+        return None, False
+    match = _GREEDY.search(text)
+    if match:
+        try:
+            data = json.loads(match.group(1).strip())
+            if isinstance(data, dict):
+                return data, False
+        except ValueError:
+            pass
+    for start in _starts(text):
+        data = _repair(text, start)
+        # an empty object is all a bare "{" repairs to: nothing was recovered
+        if data:
+            return data, True
+    return None, False
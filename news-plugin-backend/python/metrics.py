@@ -0,0 +1,111 @@
+"""Structured per-process instrumentation for the spawned Python entry points.
+
+Code under measurement opens a span; anything called inside it on the same
+thread can add to it:
+
+    with metrics.span("step", "timeline", charsIn=len(text)):
+        ...
+        metrics.add(promptTokens=usage.prompt_tokens)   # summed
+        metrics.annotate(parseOk=True)                  # set
+
+Span kinds used in this repo:
+    step     one analyzer step (execute_react_step / fused), incl. its retries
+    llm      one model completion (cache hits included, cacheHit=True)
+    search   one DDG text search (collect_results)
+
+At exit, flush(entry, mode) appends one JSON line per process to
+AGENT_METRICS_PATH (the sidecar file metrics_report.py aggregates):
+
+    {"ts", "entry", "mode", "pid", "wallMs", "ok", "events": [{"kind", "name", "wallMs", ...}], ...extra}
+
+With AGENT_DEBUG=1 the same line also goes to stderr, prefixed "[metrics] ".
+stdout is never touched, so Node's parsing of the result is unaffected.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+_lock = threading.Lock()
+_events = []
+_start = time.monotonic()
+
+
+def enabled() -> bool:
+    return bool(os.getenv("AGENT_METRICS_PATH", "").strip()) or os.getenv("AGENT_DEBUG", "").strip() == "1"
+
+
+@contextmanager
+def span(kind: str, name: str, **fields):
+    event = {"kind": kind, "name": name, **fields}
+    prev = getattr(_local, "event", None)
+    _local.event = event
+    t0 = time.perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        event["error"] = type(e).__name__
+        raise
+    finally:
+        event["wallMs"] = round((time.perf_counter() - t0) * 1000, 2)
+        _local.event = prev
+        if enabled():
+            with _lock:
+                _events.append(event)
+
+
+def add(**counts):
+    """Sum numeric fields into the innermost open span of this thread (no-op outside a span)."""
+    event = getattr(_local, "event", None)
+    if event is None:
+        return
+    for k, v in counts.items():
+        event[k] = event.get(k, 0) + (v or 0)
+
+
+def annotate(**fields):
+    """Set fields on the innermost open span of this thread (no-op outside a span)."""
+    event = getattr(_local, "event", None)
+    if event is not None:
+        event.update(fields)
+
+
+def events() -> list:
+    with _lock:
+        return list(_events)
+
+
+def flush(entry: str, mode: str, ok: bool = True, **extra):
+    """Write this process's record to the sidecar file (and stderr in debug mode)."""
+    if not enabled():
+        return
+    with _lock:
+        evs, _events[:] = list(_events), []
+    record = {
+        "ts": round(time.time(), 3),
+        "entry": entry,
+        "mode": mode,
+        "pid": os.getpid(),
+        "wallMs": round((time.monotonic() - _start) * 1000, 2),
+        "ok": ok,
+        **extra,
+        "events": evs,
+    }
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    path = os.getenv("AGENT_METRICS_PATH", "").strip()
+    if path:
+        try:
+            d = os.path.dirname(path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            # one append per process; short lines from concurrent processes don't interleave
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            sys.stderr.write(f"[metrics] write failed: {e}\n")
+    if os.getenv("AGENT_DEBUG", "").strip() == "1":
+        sys.stderr.write(f"[metrics] {line}\n")
+        sys.stderr.flush()
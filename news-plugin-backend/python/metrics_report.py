@@ -0,0 +1,122 @@
+"""Aggregate the AGENT_METRICS_PATH sidecar file into per-mode / per-step percentiles.
+
+Each line of the file is one process record written by metrics.flush(). Rows:
+
+    <entry> <mode>                       whole process (wall time, ok rate)
+    <entry> <mode> <kind>:<name>         spans inside it (step / llm / search)
+
+with count, wall p50/p95/p99, mean prompt/completion tokens, mean input chars
+before/after packing, cache-hit / parse-failure rates, total retries / escalations
+and how often each routing tier's model answered.
+
+Usage:
+  python metrics_report.py /tmp/bubblepop_metrics.jsonl
+  python metrics_report.py /tmp/bubblepop_metrics.jsonl --since 3600 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of an unsorted list (0 for an empty one)."""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, int(round(q * (len(s) - 1)))))]
+
+
+def read_records(path: str, since_s: float | None = None) -> list:
+    cutoff = time.time() - since_s if since_s else None
+    out = []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # a torn line from a crashed writer
+                continue
+            if cutoff is None or rec.get("ts", 0) >= cutoff:
+                out.append(rec)
+    return out
+
+
+def _mean(values: list) -> float:
+    return round(sum(values) / len(values), 1) if values else 0.0
+
+
+def _summarize(rows: list) -> dict:
+    wall = [r.get("wallMs", 0.0) for r in rows]
+    n = len(rows)
+    out = {
+        "count": n,
+        "p50Ms": round(percentile(wall, 0.50), 1),
+        "p95Ms": round(percentile(wall, 0.95), 1),
+        "p99Ms": round(percentile(wall, 0.99), 1),
+    }
+    if any("ok" in r for r in rows):
+        out["okRate"] = round(sum(1 for r in rows if r.get("ok")) / n, 3)
+    for field in ("promptTokens", "completionTokens", "charsIn", "charsSent", "results", "queueWaitMs"):
+        vals = [r[field] for r in rows if isinstance(r.get(field), (int, float))]
+        if vals:
+            out[f"mean{field[0].upper()}{field[1:]}"] = _mean(vals)
+    if any("cacheHits" in r or "calls" in r for r in rows):
+        out["cacheHitRate"] = round(sum(1 for r in rows if r.get("cacheHits")) / n, 3)
+    if any("attempts" in r for r in rows):
+        out["retries"] = sum(max(0, int(r.get("attempts", 1)) - 1) for r in rows)
+        out["parseFailureRate"] = round(sum(1 for r in rows if r.get("parseFailures")) / n, 3)
+    for field in ("hedges", "jsonRepairs", "escalations"):
+        total = sum(int(r.get(field, 0) or 0) for r in rows)
+        if total:
+            out[field] = total
+    models = {}
+    for r in rows:
+        if r.get("model"):
+            models[r["model"]] = models.get(r["model"], 0) + 1
+    if models:
+        # which routing tier answered (model_routing.py)
+        out["models"] = models
+    return out
+
+
+def aggregate(records: list) -> dict:
+    groups = {}
+    for rec in records:
+        base = f"{rec.get('entry', '?')} {rec.get('mode', '?')}"
+        groups.setdefault(base, []).append(rec)
+        for ev in rec.get("events") or []:
+            groups.setdefault(f"{base} {ev.get('kind', '?')}:{ev.get('name', '?')}", []).append(ev)
+    return {k: _summarize(v) for k, v in sorted(groups.items())}
+
+
+def _print_table(report: dict):
+    cols = ("count", "p50Ms", "p95Ms", "p99Ms", "meanPromptTokens", "meanCharsSent", "cacheHitRate", "retries")
+    width = max([len(k) for k in report] + [10])
+    print(f"{'':<{width}}  " + "  ".join(f"{c:>16}" for c in cols))
+    for key, row in report.items():
+        print(f"{key:<{width}}  " + "  ".join(f"{row.get(c, ''):>16}" for c in cols))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("path", nargs="?", default=os.getenv("AGENT_METRICS_PATH", ""))
+    ap.add_argument("--since", type=float, default=None, help="only records from the last N seconds")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args()
+    if not args.path or not os.path.exists(args.path):
+        sys.stderr.write("metrics file not found (pass a path or set AGENT_METRICS_PATH)\n")
+        sys.exit(1)
+    report = aggregate(read_records(args.path, args.since))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Per-step / per-mode model routing with a cheap-first cascade.
+
+Every analyzer step (summary / timeline / stances / relatedEvents / fused) and
+every runner mode (strategy / select / filter / summarize) has a list of model
+tiers. The first tier answers unless its output cannot be parsed or falls short
+of the schema minimums below; then the next tier is asked. The last tier's
+answer is kept as is, so a single-tier route (the default) behaves exactly as
+before. The tier that answered is recorded on the step/llm metrics span
+(model, tier) and in the analyzer stats, so routes can be tuned from
+metrics_report.py.
+
+Env:
+  AGENT_MODEL                  default model for every route (default glm-4-flash)
+  AGENT_MODEL_ROUTES           JSON object: route name -> model or [cheap, ..., strong], e.g.
+                               {"summary": "glm-4-flashx", "timeline": ["glm-4-flash", "glm-4-plus"]}
+                               ("default" replaces AGENT_MODEL's single tier for unlisted routes)
+  AGENT_MIN_TIMELINE           timeline items before escalating (default 1)
+  AGENT_MIN_STAKEHOLDERS       stances items before escalating (default 1)
+  AGENT_MIN_RELATED_EVENTS     relatedEvents items before escalating (default 1)
+  AGENT_MIN_QUERIES            strategy queries before escalating (default 1)
+  (0 turns a minimum off; an empty summary always escalates)
+
+Incremental (delta) calls only ask for new items, so an empty list is a valid
+answer there: delta=True skips the item minimums.
+"""
+import json
+import os
+import sys
+
+DEFAULT_MODEL = os.getenv("AGENT_MODEL", "").strip() or "glm-4-flash"
+
+# route -> (env knob, default minimum, fields the list may come back under)
+_MINIMUMS = {
+    "timeline": ("AGENT_MIN_TIMELINE", 1, ("timeline",)),
+    "stances": ("AGENT_MIN_STAKEHOLDERS", 1, ("stakeholders", "stances")),
+    "relatedEvents": ("AGENT_MIN_RELATED_EVENTS", 1, ("associations", "relatedEvents")),
+    "strategy": ("AGENT_MIN_QUERIES", 1, ("queries",)),
+}
+_FUSED_SECTIONS = ("summary", "timeline", "stances", "relatedEvents")
+
+_routes = None
+
+
+def _load_routes() -> dict:
+    raw = os.getenv("AGENT_MODEL_ROUTES", "").strip()
+    if not raw:
+        return {}
+    try:
+        table = json.loads(raw)
+        if not isinstance(table, dict):
+            raise ValueError("expected a JSON object")
+    except ValueError as e:
+        sys.stderr.write(f"[agent] AGENT_MODEL_ROUTES ignored ({e})\n")
+        return {}
+    out = {}
+    for name, tiers in table.items():
+        if isinstance(tiers, str):
+            tiers = [tiers]
+        if isinstance(tiers, list):
+            tiers = [str(t).strip() for t in tiers if str(t).strip()]
+            if tiers:
+                out[str(name)] = tiers
+    return out
+
+
+def tiers(route: str) -> list:
+    """Models to try for one route, cheapest first."""
+    global _routes
+    if _routes is None:
+        _routes = _load_routes()
+    return _routes.get(route) or _routes.get("default") or [DEFAULT_MODEL]
+
+
+def _minimum(env_name: str, fallback: int) -> int:
+    try:
+        return max(0, int(os.getenv(env_name, "")))
+    except ValueError:
+        return fallback
+
+
+def shortfall(route: str, data, delta: bool = False) -> str | None:
+    """Why `data` should go to the next tier, or None when it is good enough."""
+    if not isinstance(data, dict) or data.get("code") == 500:
+        return "parse failed"
+    if route == "fused":
+        for section in _FUSED_SECTIONS:
+            reason = shortfall(section, data, delta)
+            if reason:
+                return reason
+        return None
+    if route == "summary":
+        summary = data.get("summary")
+        return None if isinstance(summary, str) and summary.strip() else "empty summary"
+    if delta or route not in _MINIMUMS:
+        return None
+    env_name, fallback, fields = _MINIMUMS[route]
+    need = _minimum(env_name, fallback)
+    items = next((data[f] for f in fields if isinstance(data.get(f), list)), [])
+    if len(items) < need:
+        return f"{route} has {len(items)} < {need} items"
+    return None
@@ -0,0 +1,88 @@
+"""Near-duplicate clustering shared by ddg_search (syndicated results) and packing (snippets).
+
+Items are compared by the Jaccard similarity of their 3-char shingles. A one-permutation
+MinHash with LSH bands picks the candidates, so only items whose bands collide are compared
+exactly and the cost stays linear in the number of items.
+"""
+import re
+import zlib
+from collections import deque
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+# One-permutation MinHash over the crc32 shingles: 20 bins (empty bins borrow from the next
+# non-empty one), grouped into 5 LSH bands of 4. A pair at Jaccard 0.8 shares a band with
+# p~0.93, at 0.9 with p~0.995.
+_MINHASH_BINS = 20
+_MINHASH_ROWS = 4
+
+
+def shingle_hashes(text: str) -> set:
+    """crc32 of 3-char shingles over the normalized text; empty when it is too short to compare."""
+    s = _NON_WORD.sub("", (text or "").lower())
+    if len(s) < 8:
+        # too short to tell a syndicated copy from a different story
+        return set()
+    return {zlib.crc32(s[i:i + 3].encode("utf-8")) for i in range(len(s) - 2)}
+
+
+def _minhash_bands(sh: set) -> list:
+    k = _MINHASH_BINS
+    bins = [None] * k
+    for h in sh:
+        b, v = h % k, h // k
+        if bins[b] is None or v < bins[b]:
+            bins[b] = v
+    if None in bins:
+        # densification by rotation: an empty bin takes the next non-empty bin's value and distance
+        src = list(bins)
+        for i in range(k):
+            if src[i] is None:
+                d = 1
+                while src[(i + d) % k] is None:
+                    d += 1
+                bins[i] = (src[(i + d) % k], d)
+    r = _MINHASH_ROWS
+    return [(b, *bins[b * r:(b + 1) * r]) for b in range(k // r)]
+
+
+def cluster(items: list, shingles, rank, threshold: float = 0.8,
+            max_checks: int = 32, bucket_cap: int = 64) -> list:
+    """[(representative, size)] per cluster of near-duplicate items, in first-member order.
+
+    shingles(item) gives the item's shingle_hashes (empty: never clustered); the member with
+    the highest rank(item) represents the cluster. Buckets keep the latest bucket_cap
+    representatives and at most max_checks candidates are verified per item, so the cost
+    stays linear even when every item repeats the same words.
+    """
+    clusters = []  # [representative, shingles, size]
+    index = {}
+    for it in items:
+        sh = shingles(it)
+        keys = _minhash_bands(sh) if sh else ()
+        # candidates sharing more bands are likelier duplicates: check those first
+        votes = {}
+        for k in keys:
+            for ci in index.get(k, ()):
+                votes[ci] = votes.get(ci, 0) + 1
+        hit = None
+        for ci in sorted(votes, key=votes.get, reverse=True)[:max_checks]:
+            csh = clusters[ci][1]
+            inter = len(sh & csh)
+            if inter / (len(sh) + len(csh) - inter) >= threshold:
+                hit = ci
+                break
+        if hit is None:
+            ci = len(clusters)
+            clusters.append([it, sh, 1])
+            for k in keys:
+                bucket = index.get(k)
+                if bucket is None:
+                    bucket = index[k] = deque(maxlen=bucket_cap)
+                bucket.append(ci)
+            continue
+        c = clusters[hit]
+        c[2] += 1
+        if rank(it) > rank(c[0]):
+            c[0] = it
+    return [(rep, size) for rep, _, size in clusters]
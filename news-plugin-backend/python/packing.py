@@ -0,0 +1,274 @@
+"""Token-budgeted input packing for the ReAct steps.
+
+The Node side builds rawText as:
+
+    QUERY: ...
+    CURRENT_URL: ...            (optional)
+    TIMESTAMP: ...              (optional)
+    SNIPPETS:
+    #1
+    DATE: / SOURCE: / TITLE: / SNIPPET: / URL:   (each optional)
+
+    #2
+    ...
+    ARTICLE_TITLE: ...          (optional)
+    ARTICLE_TEXT:               (optional, rest of the text)
+
+Instead of `content[:max_chars]` (which cuts snippets in half and usually drops
+ARTICLE_TEXT), pack_for_step() parses the blocks, drops near-duplicate
+snippets, orders them with a per-step policy and fills an estimated-token
+budget with whole snippets plus a share of the article text. Snippets that
+don't fit whole keep their title / date / source / url and the lead of the
+snippet (LEAD_TOKENS) while there is room.
+"""
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from near_dup import cluster, shingle_hashes
+
+_HEADER_KEYS = ("QUERY", "CURRENT_URL", "TIMESTAMP")
+_FIELD_KEYS = ("DATE", "SOURCE", "TITLE", "SNIPPET", "URL")
+_BLOCK_START = re.compile(r"^#(\d+)\s*$")
+_FIELD_LINE = re.compile(r"^(DATE|SOURCE|TITLE|SNIPPET|URL):\s?(.*)$")
+_CJK = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_DATE_KEY = re.compile(r"(\d{4})\D{0,3}(\d{1,2})\D{0,3}(\d{1,2})")
+_SENTENCE_END = re.compile(r"[。！？!?；;.\n]")
+
+# Share of the budget reserved for ARTICLE_TEXT per step (when an article exists).
+ARTICLE_SHARE = {"0": 0.35, "A": 0.15, "B": 0.3, "C": 0.4}
+# Snippets that don't fit whole keep their other fields and this many tokens of their lead.
+LEAD_TOKENS = 60
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough GLM token estimate: ~0.7 token per CJK char, ~4 chars per token otherwise."""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return int(cjk * 0.7 + (len(text) - cjk) / 4) + 1
+
+
+@lru_cache(maxsize=8)
+def parse_raw_text(raw_text: str) -> dict:
+    header = []
+    blocks = []
+    article_title = ""
+    article_lines = None
+    cur = None
+    in_snippets = False
+
+    for line in raw_text.splitlines():
+        if article_lines is not None:
+            article_lines.append(line)
+            continue
+        if line.startswith("ARTICLE_TEXT:"):
+            article_lines = [line[len("ARTICLE_TEXT:"):].strip()]
+            continue
+        if line.startswith("ARTICLE_TITLE:"):
+            article_title = line[len("ARTICLE_TITLE:"):].strip()
+            continue
+        if line.strip() == "SNIPPETS:":
+            in_snippets = True
+            continue
+        m = _BLOCK_START.match(line.strip()) if in_snippets else None
+        if m:
+            cur = {"n": int(m.group(1))}
+            blocks.append(cur)
+            continue
+        if cur is not None:
+            fm = _FIELD_LINE.match(line)
+            if fm:
+                cur[fm.group(1)] = fm.group(2).strip()
+            elif line.strip() and "SNIPPET" in cur:
+                # multi-line snippet
+                cur["SNIPPET"] += " " + line.strip()
+            continue
+        if line.strip() and any(line.startswith(k + ":") for k in _HEADER_KEYS):
+            header.append(line.rstrip())
+
+    return {
+        "header": header,
+        "blocks": [b for b in blocks if any(b.get(k) for k in _FIELD_KEYS)],
+        "articleTitle": article_title,
+        "articleText": "\n".join(article_lines).strip() if article_lines else "",
+    }
+
+
+def _render_block(b: dict) -> str:
+    lines = [f"#{b['n']}"]
+    for k in _FIELD_KEYS:
+        if b.get(k):
+            lines.append(f"{k}: {b[k]}")
+    return "\n".join(lines)
+
+
+def _shingles(b: dict) -> set:
+    return shingle_hashes(f"{b.get('TITLE', '')}{b.get('SNIPPET', '')}")
+
+
+def _richness(b: dict) -> tuple:
+    return (bool(b.get("DATE")), bool(b.get("SOURCE")), len(b.get("SNIPPET", "")))
+
+
+def dedup_blocks(blocks: list, threshold: float = 0.8) -> list:
+    """Drop near-duplicate snippets (same clustering as ddg_search), keeping the richer copy in place."""
+    return [b for b, _ in cluster(blocks, _shingles, _richness, threshold)]
+
+
+def _source_key(b: dict) -> str:
+    url = b.get("URL") or ""
+    try:
+        host = urlsplit(url).netloc.lower()
+        if host.startswith("www."):
+            host = host[4:]
+        if host:
+            return host
+    except Exception:
+        pass
+    return (b.get("SOURCE") or "").lower()
+
+
+def _round_robin_by_source(blocks: list) -> list:
+    groups = {}
+    for b in blocks:
+        groups.setdefault(_source_key(b), []).append(b)
+    out = []
+    queues = list(groups.values())
+    while queues:
+        nxt = []
+        for q in queues:
+            out.append(q.pop(0))
+            if q:
+                nxt.append(q)
+        queues = nxt
+    return out
+
+
+def _date_key(b: dict) -> tuple:
+    m = _DATE_KEY.search(b.get("DATE") or "")
+    if not m:
+        return (1, "")
+    return (0, f"{m.group(1)}{int(m.group(2)):02d}{int(m.group(3)):02d}")
+
+
+def order_for_step(agent_key: str, blocks: list) -> list:
+    """Per-step selection policy (what gets in first when the budget is tight)."""
+    if agent_key == "A":
+        # timeline: dated items first, newest first so a tight budget drops the oldest; then
+        # spread across sources (pack_for_step shows the kept ones chronologically)
+        dated = sorted((b for b in blocks if _date_key(b)[0] == 0), key=_date_key, reverse=True)
+        undated = [b for b in blocks if _date_key(b)[0] == 1]
+        return _round_robin_by_source(dated) + _round_robin_by_source(undated)
+    if agent_key == "B":
+        # stances: as many distinct sources as possible, longer snippets first within a source
+        return _round_robin_by_source(sorted(blocks, key=lambda b: -len(b.get("SNIPPET", ""))))
+    # summary / related events / fused: keep upstream (relevance) order, spread sources
+    return _round_robin_by_source(blocks)
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    if budget <= 0 or not text:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    # prefer ending on a sentence boundary if it doesn't waste too much
+    ends = [m.end() for m in _SENTENCE_END.finditer(cut)]
+    if ends and ends[-1] >= lo * 0.6:
+        cut = cut[:ends[-1]]
+    return cut
+
+
+def _fit_block(b: dict, budget: int) -> str | None:
+    """b within budget tokens: every field but SNIPPET, plus at most LEAD_TOKENS of the snippet's lead.
+
+    None when even the fields without the snippet don't fit.
+    """
+    head = _render_block({k: v for k, v in b.items() if k != "SNIPPET"})
+    room = budget - estimate_tokens(head) - 2
+    if room < 0:
+        return None
+    lead = _truncate_to_tokens(b.get("SNIPPET", ""), min(LEAD_TOKENS, room - estimate_tokens("SNIPPET: ")))
+    return _render_block({**b, "SNIPPET": lead}) if lead else head
+
+
+def _fit_leads(blocks: list, picked: list, used: int, limit: int) -> tuple:
+    """Title + lead of each block in blocks while they fit under limit -> (blocks not added, used)."""
+    rest = []
+    for b in blocks:
+        fitted = _fit_block(b, limit - used - 1)
+        if fitted is None:
+            rest.append(b)
+            continue
+        picked.append((b, fitted))
+        used += estimate_tokens(fitted) + 1
+    return rest, used
+
+
+def pack_for_step(raw_text: str, agent_key: str, budget_tokens: int) -> str | None:
+    """Return packed text for the step, or None when raw_text has no snippet blocks."""
+    parsed = parse_raw_text(raw_text)
+    blocks = parsed["blocks"]
+    if not blocks:
+        return None
+
+    parts = list(parsed["header"])
+    parts.append("SNIPPETS:")
+    used = estimate_tokens("\n".join(parts))
+
+    article = parsed["articleText"]
+    reserve = int(budget_tokens * ARTICLE_SHARE.get(agent_key, 0.3)) if article else 0
+
+    picked = []
+    leftovers = []
+    for b in order_for_step(agent_key, dedup_blocks(blocks)):
+        rendered = _render_block(b)
+        cost = estimate_tokens(rendered) + 1
+        if used + cost <= budget_tokens - reserve:
+            picked.append((b, rendered))
+            used += cost
+        else:
+            leftovers.append((b, rendered, cost))
+    # snippets too long for what's left keep their title and lead sentence ahead of the article
+    trimmed, used = _fit_leads([b for b, _, _ in leftovers], picked, used, budget_tokens - reserve)
+    trimmed = {id(b) for b in trimmed}
+    leftovers = [x for x in leftovers if id(x[0]) in trimmed]
+
+    tail = []
+    if article:
+        if parsed["articleTitle"]:
+            title_line = f"ARTICLE_TITLE: {parsed['articleTitle']}"
+            used += estimate_tokens(title_line)
+            tail.append(title_line)
+        body = _truncate_to_tokens(article, budget_tokens - used - 3)
+        if body:
+            tail.append("ARTICLE_TEXT:")
+            tail.append(body)
+            used += estimate_tokens(body) + 3
+
+    # article shorter than its reserve: give the rest back to snippets
+    still_left = []
+    for b, rendered, cost in leftovers:
+        if used + cost <= budget_tokens:
+            picked.append((b, rendered))
+            used += cost
+        else:
+            still_left.append(b)
+    _fit_leads(still_left, picked, used, budget_tokens)
+
+    if agent_key == "A":
+        # picked newest first; the timeline reads them oldest first (undated last)
+        picked.sort(key=lambda x: _date_key(x[0]))
+    for _, rendered in picked:
+        parts.append(rendered)
+        parts.append("")
+    parts.extend(tail)
+    return "\n".join(parts)
@@ -0,0 +1,174 @@
+"""Local pre-classification for the runner's "filter" mode.
+
+Candidates arrive with the signals the Node side / ddg_search already computed
+(hasDate, hasSourceName, titleLen, snippetLen, urlDepth, urlHasDate, ...); missing
+ones are derived from the URL. A small linear score plus overlap with the query
+that found the candidate decides the clear-cut cases:
+
+    news        score >= AGENT_PREFILTER_NEWS_MIN and overlap >= AGENT_PREFILTER_OVERLAP_MIN
+    discard     no title/snippet/url, score <= AGENT_PREFILTER_DISCARD_MAX, or zero overlap
+    background  the first AGENT_PREFILTER_BACKGROUND_MAX wiki / encyclopedia pages (default 1);
+                further wiki pages are scored like any other candidate
+    ambiguous   everything else -> glm-4-flash, as before
+
+Env:
+  AGENT_PREFILTER=0                 send every candidate to the LLM (old behaviour)
+  AGENT_PREFILTER_NEWS_MIN          default 4.0
+  AGENT_PREFILTER_DISCARD_MAX       default 1.0
+  AGENT_PREFILTER_OVERLAP_MIN       default 0.6
+  AGENT_PREFILTER_BACKGROUND_MAX    default 1
+  AGENT_PREFILTER_WEIGHTS           JSON object overriding entries of WEIGHTS
+"""
+import json
+import os
+import re
+
+from ddg_search import url_features
+
+# feature -> weight; features are 0/1 except where noted
+WEIGHTS = {
+    "hasDate": 1.5,
+    "urlHasDate": 1.0,
+    "hasSourceName": 1.0,
+    "deepUrl": 0.5,         # urlDepth >= 2 (article page, not a section front)
+    "snippetLong": 0.5,     # snippetLen >= 60
+    "titleShaped": 0.5,     # 8 <= titleLen <= 80
+    "overlap": 2.0,         # 0..1, share of query tokens found in title+snippet
+    "homepage": -2.0,       # urlDepth == 0
+    "shortText": -1.5,      # titleLen < 6 and snippetLen < 30
+}
+
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+")
+_LATIN_WORD = re.compile(r"[a-z0-9]{2,}")
+_SITE_EXCL = re.compile(r"-site:\S+")
+
+
+def _env_float(name: str, fallback: float) -> float:
+    try:
+        return float(os.getenv(name, ""))
+    except ValueError:
+        return fallback
+
+
+def _weights() -> dict:
+    w = dict(WEIGHTS)
+    raw = os.getenv("AGENT_PREFILTER_WEIGHTS", "").strip()
+    if raw:
+        try:
+            w.update({k: float(v) for k, v in json.loads(raw).items() if k in w})
+        except (ValueError, TypeError, AttributeError):
+            pass
+    return w
+
+
+def thresholds() -> dict:
+    return {
+        "newsMin": _env_float("AGENT_PREFILTER_NEWS_MIN", 4.0),
+        "discardMax": _env_float("AGENT_PREFILTER_DISCARD_MAX", 1.0),
+        "overlapMin": _env_float("AGENT_PREFILTER_OVERLAP_MIN", 0.6),
+        "backgroundMax": int(_env_float("AGENT_PREFILTER_BACKGROUND_MAX", 1)),
+    }
+
+
+def enabled() -> bool:
+    return os.getenv("AGENT_PREFILTER", "1").strip() != "0"
+
+
+def query_tokens(query: str) -> set:
+    """CJK bigrams + latin words of the query (without -site: exclusions)."""
+    q = _SITE_EXCL.sub(" ", query or "").lower()
+    tokens = set(_LATIN_WORD.findall(q))
+    for run in _CJK_RUN.findall(q):
+        if len(run) == 1:
+            tokens.add(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _num(c: dict, key: str, fallback: int) -> int:
+    v = c.get(key)
+    return v if isinstance(v, (int, float)) and not isinstance(v, bool) else fallback
+
+
+def features(c: dict, q_tokens: set) -> dict:
+    url = str(c.get("url") or "")
+    title = str(c.get("title") or "")
+    snippet = str(c.get("snippet") or "")
+    _, _, _, _, depth, url_has_date, is_wiki = url_features(url)
+    depth = _num(c, "urlDepth", depth)
+    title_len = _num(c, "titleLen", len(title))
+    snippet_len = _num(c, "snippetLen", len(snippet))
+    text = f"{title} {snippet}".lower()
+    overlap = sum(1 for t in q_tokens if t in text) / len(q_tokens) if q_tokens else 1.0
+    return {
+        "hasDate": float(bool(c.get("hasDate", bool(c.get("datePublished"))))),
+        "urlHasDate": float(bool(c.get("urlHasDate", url_has_date))),
+        "hasSourceName": float(bool(c.get("hasSourceName", bool(c.get("sourceName"))))),
+        "deepUrl": float(depth >= 2),
+        "snippetLong": float(snippet_len >= 60),
+        "titleShaped": float(8 <= title_len <= 80),
+        "overlap": overlap,
+        "homepage": float(depth == 0),
+        "shortText": float(title_len < 6 and snippet_len < 30),
+        # decision-only signals (not weighted)
+        "isWiki": bool(c.get("isWiki", is_wiki)),
+        "empty": not url or not (title or snippet),
+        "hasQuery": bool(q_tokens),
+    }
+
+
+def score(f: dict, weights: dict) -> float:
+    return sum(w * f[k] for k, w in weights.items())
+
+
+def classify(candidates: list, query: str = "", limits: dict | None = None, weights: dict | None = None):
+    """-> ({"news_ids", "background_ids", "discard_ids"} decided locally, ambiguous candidates)."""
+    limits = limits or thresholds()
+    weights = weights or _weights()
+    decided = {"news_ids": [], "background_ids": [], "discard_ids": []}
+    ambiguous = []
+    token_cache = {}
+    for c in candidates:
+        cid = c.get("id")
+        if cid is None:
+            ambiguous.append(c)
+            continue
+        q = c.get("queryUsed") or query
+        if q not in token_cache:
+            token_cache[q] = query_tokens(q)
+        f = features(c, token_cache[q])
+        s = score(f, weights)
+        if f["empty"]:
+            decided["discard_ids"].append(cid)
+        elif f["hasQuery"] and f["overlap"] == 0:
+            decided["discard_ids"].append(cid)
+        elif f["isWiki"] and len(decided["background_ids"]) < limits.get("backgroundMax", 1):
+            decided["background_ids"].append(cid)
+        elif s >= limits["newsMin"] and f["overlap"] >= limits["overlapMin"]:
+            decided["news_ids"].append(cid)
+        elif s <= limits["discardMax"]:
+            decided["discard_ids"].append(cid)
+        else:
+            ambiguous.append(c)
+    return decided, ambiguous
+
+
+def merge(candidates: list, decided: dict, llm_data: dict | None, ambiguous: list) -> dict:
+    """Local + LLM decisions in one filter result, ids in candidate order.
+
+    LLM ids are only accepted for the candidates it was actually shown.
+    """
+    allowed = {c.get("id") for c in ambiguous}
+    label = {}
+    for key in ("news_ids", "background_ids", "discard_ids"):
+        for cid in (llm_data or {}).get(key) or []:
+            if cid in allowed and cid not in label:
+                label[cid] = key
+        for cid in decided.get(key) or []:
+            label.setdefault(cid, key)
+    out = {"news_ids": [], "background_ids": [], "discard_ids": []}
+    for c in candidates:
+        key = label.get(c.get("id"))
+        if key:
+            out[key].append(c.get("id"))
+    return out
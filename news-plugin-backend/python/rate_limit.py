@@ -0,0 +1,261 @@
+"""Cross-process token-bucket limiter for LLM calls.
+
+Every spawned runner process shares two buckets in the cache SQLite file:
+requests per minute and (estimated) tokens per minute. A call takes one request
+and its prompt + max_tokens estimate; when a bucket is short the caller queues
+(polls) instead of failing, up to AGENT_RATE_MAX_WAIT_S, then goes ahead anyway.
+
+Priority classes (lower = more urgent):
+    0  analyze steps          (interactive)
+    1  strategy / select
+    2  summarize / filter     (background)
+A caller waits while a more urgent caller from any process is queued, and only
+priority 0 may spend the last AGENT_RATE_RESERVE share of either bucket.
+
+A 429 from the API drains the request bucket for everyone (see penalize()) and
+the call is retried (AGENT_RATE_RETRIES times) after a backoff and queueing again.
+
+Off by default: set AGENT_RATE_RPM / AGENT_RATE_TPM to the deployment's quota
+before turning it on.
+
+Env:
+  AGENT_RATE_LIMIT=1            use the limiter (default 0: calls go straight out)
+  AGENT_RATE_RPM                requests per minute (default 120)
+  AGENT_RATE_TPM                estimated tokens per minute (default 200000)
+  AGENT_RATE_RESERVE            share kept for priority 0 (default 0.2)
+  AGENT_RATE_MAX_WAIT_S         longest queue wait before going ahead (default 30)
+  AGENT_RATE_RETRIES            retries after a 429 (default 2)
+  AGENT_RATE_MIN_PRIORITY       demote every call of this process to at least this class
+                                (batch_runner.py sets 2: backfills never outrank live traffic)
+"""
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from disk_cache import DEFAULT_PATH, env_num
+
+PRIORITY_ANALYZE = 0
+PRIORITY_SEARCH = 1
+PRIORITY_BACKGROUND = 2
+
+# runner modes -> priority class (anything else is treated as interactive)
+MODE_PRIORITY = {
+    "strategy": PRIORITY_SEARCH,
+    "select": PRIORITY_SEARCH,
+    "summarize": PRIORITY_BACKGROUND,
+    "filter": PRIORITY_BACKGROUND,
+}
+
+# queued callers refresh their row this often; rows older than WAITER_STALE_S belong to dead processes
+HEARTBEAT_S = 1.0
+WAITER_STALE_S = 5.0
+
+
+def enabled() -> bool:
+    return os.getenv("AGENT_RATE_LIMIT", "0").strip() == "1"
+
+
+def is_rate_limited(err: Exception) -> bool:
+    if getattr(err, "status_code", None) == 429:
+        return True
+    text = str(err)
+    return "429" in text or "rate limit" in text.lower()
+
+
+class RateLimiter:
+    def __init__(self, path: str | None = None, rpm: float = 120, tpm: float = 200000,
+                 reserve: float = 0.2, max_wait_s: float = 30):
+        self.path = path or DEFAULT_PATH
+        self.capacity = {"requests": float(rpm), "tokens": float(tpm)}
+        # refill per second; a full bucket is one minute of budget
+        self.rate = {k: v / 60.0 for k, v in self.capacity.items()}
+        self.reserve = min(max(reserve, 0.0), 0.9)
+        self.max_wait_s = max_wait_s
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_waiters ("
+                " id TEXT PRIMARY KEY, priority INTEGER NOT NULL, heartbeat REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _levels(self, conn, now: float) -> dict:
+        rows = dict(
+            (name, (level, updated))
+            for name, level, updated in conn.execute("SELECT name, level, updated FROM rate_buckets")
+        )
+        levels = {}
+        for name, cap in self.capacity.items():
+            level, updated = rows.get(name, (cap, now))
+            levels[name] = min(cap, level + max(0.0, now - updated) * self.rate[name])
+        return levels
+
+    def _store(self, conn, levels: dict, now: float):
+        conn.executemany(
+            "INSERT OR REPLACE INTO rate_buckets (name, level, updated) VALUES (?, ?, ?)",
+            [(name, level, now) for name, level in levels.items()],
+        )
+
+    def _try_take(self, priority: int, tokens: float, waiter_id: str | None) -> float:
+        """Take the budget if allowed: returns 0.0, else a suggested sleep in seconds."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM rate_waiters WHERE heartbeat < ?", (now - WAITER_STALE_S,))
+                (urgent,) = conn.execute(
+                    "SELECT COUNT(*) FROM rate_waiters WHERE priority < ? AND id != ?", (priority, waiter_id or "")
+                ).fetchone()
+                levels = self._levels(conn, now)
+                need = {"requests": 1.0, "tokens": min(float(tokens), self.capacity["tokens"])}
+                floor = 0.0 if priority == PRIORITY_ANALYZE else self.reserve
+                short = 0.0
+                for name, amount in need.items():
+                    deficit = amount + floor * self.capacity[name] - levels[name]
+                    if deficit > 0:
+                        short = max(short, deficit / self.rate[name])
+                if urgent or short > 0:
+                    if waiter_id:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO rate_waiters (id, priority, heartbeat) VALUES (?, ?, ?)",
+                            (waiter_id, priority, now),
+                        )
+                    return max(short, 0.05)
+                for name, amount in need.items():
+                    levels[name] -= amount
+                self._store(conn, levels, now)
+                if waiter_id:
+                    conn.execute("DELETE FROM rate_waiters WHERE id = ?", (waiter_id,))
+                return 0.0
+            finally:
+                conn.execute("COMMIT")
+
+    def try_acquire(self, priority: int, tokens: float) -> bool:
+        """Non-blocking take (hedge requests only go out when there is spare budget)."""
+        try:
+            return self._try_take(priority, tokens, None) == 0.0
+        except (sqlite3.Error, OSError):
+            return True
+
+    def acquire(self, priority: int, tokens: float) -> float:
+        """Block until the budget is taken (or max_wait_s passed); returns seconds spent queued."""
+        start = time.monotonic()
+        waiter_id = uuid.uuid4().hex
+        queued = False
+        try:
+            while True:
+                sleep_s = self._try_take(priority, tokens, waiter_id)
+                waited = time.monotonic() - start
+                if sleep_s == 0.0 or waited >= self.max_wait_s:
+                    return waited if queued else 0.0
+                queued = True
+                # jitter so processes woken by the same refill don't all collide again
+                time.sleep(min(sleep_s, HEARTBEAT_S, self.max_wait_s - waited) * random.uniform(0.8, 1.2))
+        except (sqlite3.Error, OSError) as e:
+            # a broken limiter must not fail the request
+            if os.getenv("AGENT_DEBUG", "").strip() == "1":
+                sys.stderr.write(f"[rate] acquire failed: {e}\n")
+            return time.monotonic() - start
+        finally:
+            try:
+                with self._lock:
+                    self._connect().execute("DELETE FROM rate_waiters WHERE id = ?", (waiter_id,))
+            except (sqlite3.Error, OSError):
+                pass
+
+    def penalize(self):
+        """After a 429: cap the request bucket at the priority-0 reserve, minus 2s worth of refill.
+
+        How long a caller then waits depends on the refill rate (AGENT_RATE_RPM) and that
+        penalty window: priority 1/2 wait until the bucket is back above the reserve
+        (at least 2s plus one request's refill). Priority 0 only waits when the reserve
+        holds less than the penalty plus one request; at the defaults (reserve 24 requests,
+        penalty 4) it does not wait and only the retry backoff applies.
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    levels = self._levels(conn, now)
+                    cap = self.capacity["requests"]
+                    levels["requests"] = min(levels["requests"], self.reserve * cap) - 2 * self.rate["requests"]
+                    self._store(conn, levels, now)
+                finally:
+                    conn.execute("COMMIT")
+        except (sqlite3.Error, OSError):
+            pass
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                path=os.getenv("AGENT_CACHE_PATH") or None,
+                rpm=env_num("AGENT_RATE_RPM", 120.0, float),
+                tpm=env_num("AGENT_RATE_TPM", 200000.0, float),
+                reserve=env_num("AGENT_RATE_RESERVE", 0.2, float, minimum=0),
+                max_wait_s=env_num("AGENT_RATE_MAX_WAIT_S", 30.0, float, minimum=0),
+            )
+        return _limiter
+
+
+def _effective(priority: int) -> int:
+    try:
+        return max(priority, int(os.getenv("AGENT_RATE_MIN_PRIORITY", "0")))
+    except ValueError:
+        return priority
+
+
+def try_acquire(priority: int, tokens: float) -> bool:
+    return get_limiter().try_acquire(_effective(priority), tokens) if enabled() else True
+
+
+def limited_call(priority: int, tokens: float, fn, on_wait=None):
+    """fn() once the shared budget allows it; 429s are retried after queueing again.
+
+    on_wait(seconds) is called with the queue wait of every attempt that had to wait.
+    """
+    if not enabled():
+        return fn()
+    limiter = get_limiter()
+    priority = _effective(priority)
+    retries = env_num("AGENT_RATE_RETRIES", 2, minimum=0)
+    attempt = 0
+    while True:
+        waited = limiter.acquire(priority, tokens)
+        if on_wait and waited > 0:
+            on_wait(waited)
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not is_rate_limited(e):
+                raise
+            attempt += 1
+            limiter.penalize()
+            time.sleep(0.5 * 2 ** attempt * random.uniform(0.8, 1.2))
@@ -0,0 +1,315 @@
+"""Record/replay stand-ins for ZhipuAI and DDGS (offline tests and benchmarks).
+
+LLM (picked up by Agent.ReActTrinityAnalyzer and agent_runner):
+  AGENT_LLM_REPLAY=fake            canned outputs routed by prompt
+  AGENT_LLM_REPLAY=<cassette.json> replay recorded outputs (canned fallback on miss)
+  AGENT_LLM_RECORD=<cassette.json> call the real API and record every completion
+  AGENT_LLM_FAKE_LATENCY_MS=300    per-call latency of fake/replayed calls
+  AGENT_LLM_FAKE_JITTER_MS=100     uniform extra latency in [0, jitter]
+
+Search (picked up by ddg_search):
+  DDG_REPLAY=fake | <cassette.json>, DDG_RECORD=<cassette.json>,
+  DDG_FAKE_LATENCY_MS, DDG_FAKE_JITTER_MS
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from disk_cache import cache_key
+from packing import estimate_tokens
+
+
+def _env_ms(name: str, fallback: float = 0.0) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, "")))
+    except ValueError:
+        return fallback
+
+
+class _Cassette:
+    """JSON file of key -> recorded payload, written through on every record()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def record(self, key: str, value):
+        with self._lock:
+            self.entries[key] = value
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+
+
+def _sleep(latency_ms: float, jitter_ms: float, rng: random.Random, timeout_s: float | None = None):
+    delay = latency_ms + (rng.uniform(0, jitter_ms) if jitter_ms else 0.0)
+    if timeout_s and delay > timeout_s * 1000:
+        # like the SDK's per-request timeout: give up after timeout_s
+        time.sleep(timeout_s)
+        raise TimeoutError("Request timed out.")
+    if delay > 0:
+        time.sleep(delay / 1000.0)
+
+
+# --- LLM ---------------------------------------------------------------------
+
+def _chat_key(kwargs: dict) -> str:
+    return cache_key("chat", kwargs.get("model"), kwargs.get("messages"),
+                     kwargs.get("temperature"), kwargs.get("max_tokens"))
+
+
+def _response(content: str, prompt_tokens: int):
+    usage = SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=estimate_tokens(content),
+        total_tokens=prompt_tokens + estimate_tokens(content),
+    )
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=usage,
+    )
+
+
+_COMPACT_ROW = re.compile(r"^(\d+) \| ", re.M)
+
+
+def _ids_from_user_msg(user_msg: str, field: str) -> list:
+    try:
+        data = json.loads(user_msg)
+    except ValueError:
+        # compact table encoding (agent_runner._compact_candidates): ordinal id first on each row
+        return _COMPACT_ROW.findall(user_msg)
+    return [str(c.get("id")) for c in data.get(field) or [] if isinstance(c, dict) and c.get("id") is not None]
+
+
+_TIMELINE_ITEM = (
+    '{{"date": "2024-0{m}-1{m}", "title": "事件进展{m}", "snippet": "相关报道概述{m}", '
+    '"sourceName": "媒体{m}", "url": "https://news{m}.example.com/a/{m}", "tags": ["媒体"], "isReversal": false}}'
+)
+
+
+def canned_output(messages: list) -> str:
+    """Plausible model output for each prompt this repo sends."""
+    system = messages[0].get("content", "") if messages else ""
+    user = messages[-1].get("content", "") if messages else ""
+    summary = '"summary": "某事件的核心信息概括"'
+    timeline = '"timeline": [' + ", ".join(_TIMELINE_ITEM.format(m=m) for m in range(1, 4)) + "]"
+    stakeholders = ('"stakeholders": [{"party": "企业", "stance": "支持", "viewpoint": "认为调整合理"}, '
+                    '{"party": "消费者", "stance": "反对", "viewpoint": "认为负担加重"}]')
+    associations = '"associations": [{"eventName": "类似历史事件", "reason": "起因相似"}]'
+
+    if "事件档案" in system:
+        body = ", ".join([summary, timeline, stakeholders, associations])
+    elif "内容总结" in system:
+        body = summary
+    elif "时间轴梳理" in system:
+        body = timeline
+    elif "立场分析" in system:
+        body = stakeholders
+    elif "关联推荐" in system:
+        body = associations
+    elif "搜索策略" in system:
+        body = ('"queries": [{"q": "事件 官方回应", "priority": 1, "angle": "官方", "lang": "zh"}, '
+                '{"q": "事件 争议", "priority": 2, "angle": "争议", "lang": "zh"}, '
+                '{"q": "event impact", "priority": 3, "angle": "影响", "lang": "en"}]')
+    elif "新闻筛选器" in system:
+        m = re.search(r"数量不超过(\d+)", system)
+        ids = _ids_from_user_msg(user, "candidates")[: int(m.group(1)) if m else 10]
+        body = '"selected_ids": ' + json.dumps(ids, ensure_ascii=False)
+    elif "候选过滤器" in system:
+        ids = _ids_from_user_msg(user, "candidates")
+        body = ('"news_ids": ' + json.dumps(ids[1:], ensure_ascii=False)
+                + ', "background_ids": ' + json.dumps(ids[:1], ensure_ascii=False) + ', "discard_ids": []')
+    elif "摘要器" in system:
+        ids = _ids_from_user_msg(user, "items")
+        body = '"summaries": ' + json.dumps([{"id": i, "summary": "一句话摘要"} for i in ids], ensure_ascii=False)
+    else:
+        return "pong"
+    return "Thought: 已梳理关键信息。\nAction: {" + body + "}"
+
+
+class FakeZhipuAI:
+    """Drop-in for ZhipuAI: client.chat.completions.create(...) with canned or replayed outputs."""
+
+    def __init__(self, cassette: str | None = None, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 responder=None, seed: int = 0):
+        self.cassette = _Cassette(cassette) if cassette else None
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.responder = responder or canned_output
+        self.calls = 0
+        self.timeout = None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        messages = kwargs.get("messages") or []
+        with self._lock:
+            self.calls += 1
+            rng_seed = self._rng.random()
+        _sleep(self.latency_ms, self.jitter_ms, random.Random(rng_seed), kwargs.get("timeout"))
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        recorded = self.cassette.get(_chat_key(kwargs)) if self.cassette else None
+        if recorded is not None:
+            return _response(recorded["content"], recorded.get("promptTokens", prompt_tokens))
+        return _response(self.responder(messages), prompt_tokens)
+
+
+class RecordingZhipuAI:
+    """Wraps a real client and writes every completion into a cassette."""
+
+    def __init__(self, client, cassette: str):
+        self._client = client
+        self.cassette = _Cassette(cassette)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    @property
+    def timeout(self):
+        return getattr(self._client, "timeout", None)
+
+    @timeout.setter
+    def timeout(self, value):
+        self._client.timeout = value
+
+    def _create(self, **kwargs):
+        resp = self._client.chat.completions.create(**kwargs)
+        usage = getattr(resp, "usage", None)
+        self.cassette.record(_chat_key(kwargs), {
+            "content": resp.choices[0].message.content,
+            "promptTokens": int(getattr(usage, "prompt_tokens", 0) or 0),
+        })
+        return resp
+
+
+def llm_client_from_env(api_key: str):
+    """Replay/record client configured by env, or None to use the plain SDK client."""
+    replay = os.getenv("AGENT_LLM_REPLAY", "").strip()
+    latency = _env_ms("AGENT_LLM_FAKE_LATENCY_MS")
+    jitter = _env_ms("AGENT_LLM_FAKE_JITTER_MS")
+    if replay:
+        return FakeZhipuAI(cassette=None if replay == "fake" else replay, latency_ms=latency, jitter_ms=jitter)
+    record = os.getenv("AGENT_LLM_RECORD", "").strip()
+    if record:
+        from zhipuai import ZhipuAI
+
+        return RecordingZhipuAI(ZhipuAI(api_key=api_key), record)
+    return None
+
+
+# --- DDGS --------------------------------------------------------------------
+
+FAKE_DOMAINS = [
+    "news.sina.com.cn", "finance.sina.com.cn", "www.thepaper.cn", "www.caixin.com", "www.reuters.com",
+    "www.bbc.com", "news.163.com", "www.chinanews.com.cn", "www.yicai.com", "www.36kr.com",
+    "www.jiemian.com", "www.bloomberg.com", "zh.wikipedia.org", "www.zaobao.com", "www.ft.com",
+]
+_SITE_EXCL = re.compile(r"-site:(\S+)")
+
+
+def fake_search_results(query: str, max_results: int, domains: list | None = None) -> list:
+    """Deterministic DDGS-shaped results; honours -site: exclusions and skews towards a few domains."""
+    domains = domains or FAKE_DOMAINS
+    excluded = {d.lower().removeprefix("www.") for d in _SITE_EXCL.findall(query)}
+    base = _SITE_EXCL.sub("", query).strip()
+    seed = int(hashlib.sha1(query.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    pool = [d for d in domains if d.removeprefix("www.") not in excluded] or domains
+    out = []
+    for i in range(max_results or 10):
+        # first domains are "dominant", like real DDG result pages
+        dom = pool[min(int(rng.expovariate(0.35)), len(pool) - 1)]
+        day = 1 + rng.randrange(28)
+        out.append({
+            "title": f"{base} 最新进展 {i + 1}",
+            "body": f"{base} 相关报道：第{i + 1}条，记者从多方获悉事件后续（{rng.randrange(10 ** 6)}）",
+            "href": f"https://{dom}/2024/05/{day:02d}/{seed % 9973}-{i}.html?utm_source=ddg",
+            "source": dom.split(".")[-2] if rng.random() < 0.7 else "",
+            "date": f"2024-05-{day:02d}" if rng.random() < 0.6 else "",
+        })
+    return out
+
+
+class FakeDDGS:
+    """Drop-in for ddgs.DDGS (context manager with .text())."""
+
+    cassette = None
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    calls = 0
+    _lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, query, max_results=10, backend="auto", region="wt-wt", safesearch="off", **kwargs):
+        cls = type(self)
+        with cls._lock:
+            cls.calls += 1
+        _sleep(cls.latency_ms, cls.jitter_ms, random.Random(query))
+        if cls.cassette is not None:
+            recorded = cls.cassette.get(cache_key("ddg", query, max_results, backend, region))
+            if recorded is not None:
+                return list(recorded)
+        return fake_search_results(query, max_results)
+
+
+def make_fake_ddgs(cassette: str | None = None, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+    return type("FakeDDGS", (FakeDDGS,), {
+        "cassette": _Cassette(cassette) if cassette else None,
+        "latency_ms": latency_ms,
+        "jitter_ms": jitter_ms,
+        "calls": 0,
+        "_lock": threading.Lock(),
+    })
+
+
+def make_recording_ddgs(real_cls, cassette: str):
+    tape = _Cassette(cassette)
+
+    class RecordingDDGS:
+        def __init__(self, *args, **kwargs):
+            self._inner = real_cls(*args, **kwargs)
+
+        def __enter__(self):
+            self._inner.__enter__()
+            return self
+
+        def __exit__(self, *exc):
+            return self._inner.__exit__(*exc)
+
+        def text(self, query, max_results=10, backend="auto", region="wt-wt", safesearch="off", **kwargs):
+            rows = list(self._inner.text(query, max_results=max_results, backend=backend, region=region,
+                                         safesearch=safesearch, **kwargs))
+            tape.record(cache_key("ddg", query, max_results, backend, region), rows)
+            return rows
+
+    return RecordingDDGS
+
+
+def ddgs_cls_from_env():
+    """Fake/replay DDGS class configured by env, or None to use the real library."""
+    replay = os.getenv("DDG_REPLAY", "").strip()
+    if not replay:
+        return None
+    return make_fake_ddgs(
+        cassette=None if replay == "fake" else replay,
+        latency_ms=_env_ms("DDG_FAKE_LATENCY_MS"),
+        jitter_ms=_env_ms("DDG_FAKE_JITTER_MS"),
+    )
@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import pytest
+
+from agent_server import AgentServer, build_raw_text
+from replay import FakeZhipuAI
+
+SNIPPETS = [{"title": "咖啡涨价", "snippet": "咖啡价格上涨三成", "url": "https://a.com/1", "datePublished": "2024-05-01"}]
+ANALYZE = {"query": "咖啡涨价", "snippets": SNIPPETS}
+
+
+@pytest.fixture(autouse=True)
+def _offline(monkeypatch):
+    for name, value in {"AGENT_CACHE": "0", "AGENT_HEDGE": "0", "AGENT_RATE_LIMIT": "0",
+                        "AGENT_INCREMENTAL": "0", "AGENT_EXEC_MODE": "sequential", "AGENT_STEP_RETRIES": "0"}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("AGENT_METRICS_PATH", raising=False)
+
+
+async def _request(port: int, method: str, path: str, body=None, close_after: float | None = None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = b"" if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+    head = f"{method} {path} HTTP/1.1\r\nHost: x\r\n"
+    if body is not None:
+        head += f"Content-Length: {len(data)}\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + data)
+    await writer.drain()
+    if close_after is not None:
+        await asyncio.sleep(close_after)
+        writer.close()
+        return None
+    raw = await reader.read()
+    writer.close()
+    status_line, _, payload = raw.partition(b"\r\n\r\n")
+    return int(status_line.split(b" ")[1]), json.loads(payload)
+
+
+def _serve(test, concurrency=2, queue_limit=4, latency_ms=0.0):
+    """Run test(app, port) against a server on a free port with a fake LLM client."""
+    async def main():
+        app = AgentServer("k", concurrency=concurrency, queue_limit=queue_limit, search=False)
+        app.client = FakeZhipuAI(latency_ms=latency_ms)
+        app.get_client = lambda: app.client
+        server = await asyncio.start_server(app.handle_conn, "127.0.0.1", 0)
+        try:
+            return await test(app, server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            app.executor.shutdown(wait=True)
+
+    return asyncio.run(main())
+
+
+def test_analyze_and_health():
+    async def test(app, port):
+        status, body = await _request(port, "POST", "/analyze", ANALYZE)
+        assert status == 200 and body["code"] == 200 and body["data"]["summary"]
+        status, body = await _request(port, "GET", "/health")
+        assert status == 200 and body["data"]["served"] == 1 and body["data"]["inFlight"] == 0
+
+    _serve(test)
+
+
+@pytest.mark.parametrize("method, path, body, status", [
+    ("POST", "/nowhere", {}, 404),
+    ("POST", "/search", {}, 404),
+    ("GET", "/analyze", None, 405),
+    ("POST", "/analyze", None, 411),
+    ("POST", "/analyze", {"query": ""}, 400),
+    ("POST", "/run", {"mode": "translate"}, 400),
+])
+def test_error_statuses(method, path, body, status):
+    async def test(app, port):
+        got, envelope = await _request(port, method, path, body)
+        assert got == status and envelope["code"] == status
+
+    _serve(test)
+
+
+def test_queue_full_is_503():
+    async def test(app, port):
+        # one running, one queued; the third is turned away
+        running = asyncio.ensure_future(_request(port, "POST", "/analyze", ANALYZE))
+        await asyncio.sleep(0.1)
+        queued = asyncio.ensure_future(_request(port, "POST", "/analyze", ANALYZE))
+        await asyncio.sleep(0.1)
+        assert (app.in_flight, app.queued) == (1, 1)
+        status, body = await _request(port, "POST", "/analyze", ANALYZE)
+        assert status == 503 and body["msg"] == "agent_server busy"
+        assert [(await running)[0], (await queued)[0]] == [200, 200]
+
+    _serve(test, concurrency=1, queue_limit=1, latency_ms=100)
+
+
+def test_disconnect_cancels_remaining_model_calls():
+    async def test(app, port):
+        await _request(port, "POST", "/analyze", ANALYZE, close_after=0.1)
+        for _ in range(50):
+            if app.in_flight == 0:
+                break
+            await asyncio.sleep(0.05)
+        # sequential steps: the call in progress finishes, the other three are never sent
+        assert app.in_flight == 0 and app.client.calls == 1 and app.served == 0
+        status, _ = await _request(port, "POST", "/analyze", ANALYZE)
+        assert status == 200
+
+    _serve(test, concurrency=1, latency_ms=300)
+
+
+def test_disconnect_while_queued_frees_the_queue_slot():
+    async def test(app, port):
+        running = asyncio.ensure_future(_request(port, "POST", "/analyze", ANALYZE))
+        await asyncio.sleep(0.1)
+        await _request(port, "POST", "/analyze", ANALYZE, close_after=0.1)
+        await asyncio.sleep(0.05)
+        assert app.queued == 0
+        assert (await running)[0] == 200
+        assert app.client.calls == 4
+
+    _serve(test, concurrency=1, latency_ms=100)
+
+
+def test_build_raw_text_matches_the_node_format():
+    raw = build_raw_text("q", {"currentUrl": "https://x.com", "timestamp": "t"},
+                         SNIPPETS + ["junk"], {"title": "T", "text": "body"})
+    assert raw.splitlines() == [
+        "QUERY: q", "CURRENT_URL: https://x.com", "TIMESTAMP: t", "SNIPPETS:", "#1", "DATE: 2024-05-01",
+        "TITLE: 咖啡涨价", "SNIPPET: 咖啡价格上涨三成", "URL: https://a.com/1", "", "ARTICLE_TITLE: T",
+        "ARTICLE_TEXT:", "body",
+    ]
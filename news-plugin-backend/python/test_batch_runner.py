@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from batch_runner import read_checkpoint, run_batch
+
+RAW = "QUERY: 咖啡涨价\nSNIPPETS:\n#1\nTITLE: 咖啡涨价\nSNIPPET: 咖啡价格上涨三成\nURL: https://a.com/1\n"
+PAYLOADS = [
+    {"id": "a", "rawText": RAW},
+    {"id": "b", "mode": "nope"},
+    {"id": "c", "rawText": RAW + "#2\nTITLE: 第二条\nURL: https://b.com/2\n"},
+]
+
+
+@pytest.fixture(autouse=True)
+def _offline(monkeypatch):
+    for name, value in {"AGENT_LLM_REPLAY": "fake", "ZAI_API_KEY": "k", "AGENT_CACHE": "0", "AGENT_HEDGE": "0",
+                        "AGENT_RATE_LIMIT": "0", "AGENT_INCREMENTAL": "0"}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("AGENT_METRICS_PATH", raising=False)
+
+
+@pytest.fixture
+def files(tmp_path):
+    src = tmp_path / "events.jsonl"
+    src.write_text("\n".join(json.dumps(p, ensure_ascii=False) for p in PAYLOADS) + "\n\nnot json\n", "utf-8")
+    return src, tmp_path / "results.jsonl"
+
+
+def _records(path) -> dict:
+    """line -> last record for it (later records win, as on resume)."""
+    out = {}
+    for raw in path.read_text("utf-8").splitlines():
+        rec = json.loads(raw)
+        out[rec["line"]] = rec
+    return out
+
+
+def _rec(line: int, code: int) -> str:
+    return json.dumps({"line": line, "id": None, "ms": 1.0, "result": {"code": code}})
+
+
+def test_checkpoint_cuts_a_torn_last_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text(_rec(0, 200) + "\n" + _rec(1, 500) + "\n" + '{"line": 2, "res', "utf-8")
+    assert read_checkpoint(str(path), retry_errors=False) == {0, 1}
+    assert path.read_text("utf-8") == _rec(0, 200) + "\n" + _rec(1, 500) + "\n"
+
+
+def test_checkpoint_retry_errors_and_junk_lines(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text("\n".join([_rec(0, 200), _rec(1, 500), "garbage", '{"line": "3"}', "[]"]) + "\n", "utf-8")
+    assert read_checkpoint(str(path), retry_errors=False) == {0, 1}
+    assert read_checkpoint(str(path), retry_errors=True) == {0}
+    assert read_checkpoint(str(tmp_path / "missing.jsonl"), retry_errors=False) == set()
+    assert read_checkpoint("-", retry_errors=False) == set()
+
+
+@pytest.mark.parametrize("order", ["input", "completion"])
+def test_full_run(files, order):
+    src, out = files
+    summary = run_batch(str(src), str(out), workers=3, order=order)
+    assert (summary["items"], summary["skipped"], summary["errors"]) == (4, 0, 2)
+    recs = _records(out)
+    assert sorted(recs) == [0, 1, 2, 4]
+    assert [recs[i]["id"] for i in (0, 1, 2)] == ["a", "b", "c"]
+    assert [recs[i]["result"]["code"] for i in (0, 1, 2, 4)] == [200, 400, 200, 400]
+    if order == "input":
+        assert [json.loads(raw)["line"] for raw in out.read_text("utf-8").splitlines()] == [0, 1, 2, 4]
+
+
+def test_resume_skips_finished_lines(files):
+    src, out = files
+    out.write_text(_rec(0, 200) + "\n" + '{"line": 1, "id"', "utf-8")
+    summary = run_batch(str(src), str(out), workers=2)
+    assert (summary["items"], summary["skipped"]) == (3, 1)
+    recs = _records(out)
+    assert sorted(recs) == [0, 1, 2, 4]
+    assert recs[0]["ms"] == 1.0  # kept from the checkpoint, not redone
+
+
+def test_retry_errors_redoes_failed_lines(files):
+    src, out = files
+    out.write_text("\n".join(_rec(i, 500 if i == 2 else 200) for i in (0, 1, 2, 4)) + "\n", "utf-8")
+    summary = run_batch(str(src), str(out), workers=2, retry_errors=True)
+    assert (summary["items"], summary["skipped"]) == (1, 3)
+    assert _records(out)[2]["result"]["code"] == 200
+
+
+def test_no_resume_overwrites(files):
+    src, out = files
+    out.write_text(_rec(0, 200) + "\n", "utf-8")
+    summary = run_batch(str(src), str(out), workers=2, resume=False)
+    assert (summary["items"], summary["skipped"]) == (4, 0)
+    assert _records(out)[0]["id"] == "a"
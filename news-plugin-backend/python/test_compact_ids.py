@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import agent_runner
+from agent_runner import _compact_candidates, _map_ids_back
+from replay import FakeZhipuAI
+
+CANDIDATES = [
+    {"id": f"u_{i}", "title": f"咖啡涨价报道 {i}", "snippet": "咖啡价格上涨",
+     "url": f"https://site{i}.com/2024/05/0{i}/story.html"}
+    for i in range(1, 4)
+]
+ID_MAP = _compact_candidates(CANDIDATES, 120)[1]
+
+
+def _select(ids) -> list:
+    return _map_ids_back({"selected_ids": ids}, ("selected_ids",), ID_MAP)["selected_ids"]
+
+
+def test_table_rows_use_ordinals():
+    table, id_map = _compact_candidates(CANDIDATES, 120)
+    assert id_map == {"1": "u_1", "2": "u_2", "3": "u_3"}
+    assert [row.split(" | ")[0] for row in table.splitlines()[1:]] == ["1", "2", "3"]
+
+
+def test_ints_strings_and_hash_prefix():
+    assert _select([1, "2", " #3 "]) == ["u_1", "u_2", "u_3"]
+
+
+@pytest.mark.parametrize("bad", [0, 4, -1, "4", "99", "", "#", "##2", None])
+def test_out_of_range_ids_dropped(bad):
+    assert _select([bad, 2]) == ["u_2"]
+
+
+@pytest.mark.parametrize("bad", [2.0, True, [2], {"id": 2}, "2.0", "2,3"])
+def test_non_ordinal_values_dropped(bad):
+    assert _select([bad, 1]) == ["u_1"]
+
+
+def test_duplicated_ids_kept_once_in_first_position():
+    assert _select([2, "2", "#2", 1, 2]) == ["u_2", "u_1"]
+
+
+def test_echoed_url_or_original_id_dropped():
+    assert _select([CANDIDATES[0]["url"], "u_2", 3]) == ["u_3"]
+
+
+def test_id_in_two_keys_stays_in_the_first():
+    keys = ("news_ids", "background_ids", "discard_ids")
+    out = _map_ids_back({"news_ids": [1], "background_ids": ["1", 2], "discard_ids": [2, 3]}, keys, ID_MAP)
+    assert (out["news_ids"], out["background_ids"], out["discard_ids"]) == (["u_1"], ["u_2"], ["u_3"])
+
+
+def test_missing_or_null_key():
+    out = _map_ids_back({"selected_ids": None, "reason": "x"}, ("selected_ids",), ID_MAP)
+    assert out == {"selected_ids": [], "reason": "x"}
+
+
+def test_select_mode_drops_invalid_ids(monkeypatch):
+    monkeypatch.setenv("AGENT_PROMPT_COMPACT", "1")
+    client = FakeZhipuAI(responder=lambda messages: json.dumps(
+        {"selected_ids": [3, "9", CANDIDATES[0]["url"], "3", "#1"]}))
+    out = agent_runner.handle({"mode": "select", "candidates": CANDIDATES, "noCache": True},
+                              "k", lambda: client)
+    assert out["code"] == 200
+    assert out["data"]["selected_ids"] == ["u_3", "u_1"]
@@ -0,0 +1,190 @@
+import pytest
+
+from ddg_search import _dedup_by_url, _diversify, _enrich
+from replay import fake_search_results
+
+
+def _diversify_legacy(
+    items: list,
+    limit: int,
+    per_domain_cap: int,
+    per_author_cap: int,
+    exclude_domains: set,
+    excluded_domain_cap: int,
+    min_external_domains: int,
+) -> list:
+    """Previous list-scanning implementation of _diversify (quadratic in len(items) when limit is large).
+
+    Kept here as the reference _diversify is checked against (bench_suite times both).
+    """
+
+    def _cap_for_domain(d: str) -> int:
+        if d and d in exclude_domains:
+            return excluded_domain_cap
+        return per_domain_cap
+
+    def _pick(src, cap_domain, cap_author, allow_excluded: bool):
+        dom_cnt = {}
+        au_cnt = {}
+        picked = []
+        ext_domains = set()
+        for it in src:
+            if len(picked) >= limit:
+                break
+            d = it.get("sourceDomain") or ""
+            a = it.get("authorKey") or ""
+            is_excluded = bool(d and d in exclude_domains)
+            if (not allow_excluded) and is_excluded:
+                continue
+            dom_cap = cap_domain(d) if cap_domain else 0
+            if dom_cap and d and dom_cnt.get(d, 0) >= dom_cap:
+                continue
+            if cap_author and a and au_cnt.get(a, 0) >= cap_author:
+                continue
+            picked.append(it)
+            if d:
+                dom_cnt[d] = dom_cnt.get(d, 0) + 1
+                if not is_excluded:
+                    ext_domains.add(d)
+            if a:
+                au_cnt[a] = au_cnt.get(a, 0) + 1
+        return picked, dom_cnt, au_cnt, ext_domains
+
+    # Pass 1: try to collect enough external domains (do not allow excluded domains)
+    picked1, dom_cnt, au_cnt, ext_domains = _pick(items, _cap_for_domain, per_author_cap, allow_excluded=False)
+
+    # If we still don't have enough external domain coverage, relax author cap for external-only picking
+    if len(ext_domains) < min_external_domains and len(picked1) < limit:
+        picked1b, dom_cnt2, au_cnt2, ext_domains2 = _pick(
+            [it for it in items if it not in picked1],
+            _cap_for_domain,
+            0,
+            allow_excluded=False,
+        )
+        # merge counters
+        picked1.extend(picked1b)
+        for k, v in dom_cnt2.items():
+            dom_cnt[k] = dom_cnt.get(k, 0) + v
+        for k, v in au_cnt2.items():
+            au_cnt[k] = au_cnt.get(k, 0) + v
+        ext_domains |= ext_domains2
+
+    picked = picked1
+
+    # Pass 2: fill remaining slots (allow excluded domains with separate cap)
+    if len(picked) < limit:
+        for it in items:
+            if len(picked) >= limit:
+                break
+            if it in picked:
+                continue
+            d = it.get("sourceDomain") or ""
+            a = it.get("authorKey") or ""
+            dom_cap = _cap_for_domain(d)
+            if dom_cap and d and dom_cnt.get(d, 0) >= dom_cap:
+                continue
+            if per_author_cap and a and au_cnt.get(a, 0) >= per_author_cap:
+                continue
+            picked.append(it)
+            if d:
+                dom_cnt[d] = dom_cnt.get(d, 0) + 1
+            if a:
+                au_cnt[a] = au_cnt.get(a, 0) + 1
+
+    # Pass 3: if still not enough, relax author cap, then domain cap (last resort)
+    if len(picked) < limit:
+        for it in items:
+            if len(picked) >= limit:
+                break
+            if it in picked:
+                continue
+            d = it.get("sourceDomain") or ""
+            dom_cap = _cap_for_domain(d)
+            if dom_cap and d and dom_cnt.get(d, 0) >= dom_cap:
+                continue
+            picked.append(it)
+            if d:
+                dom_cnt[d] = dom_cnt.get(d, 0) + 1
+
+    if len(picked) < limit:
+        picked.extend([it for it in items if it not in picked])
+
+    return picked[:limit]
+
+
+def _legacy_reference(items, args, scores=None, group_key="sourceDomain"):
+    """What _diversify(items, *args, scores, group_key) should pick, via the legacy version:
+    visit by descending score (ties keep arrival order) and cap on group_key."""
+    order = list(range(len(items)))
+    if scores is not None:
+        order.sort(key=lambda i: -(scores[i] or 0))
+    view = [items[i].copy(sourceDomain=items[i].get(group_key)) for i in order]
+    back = {id(v): items[i] for v, i in zip(view, order)}
+    return [back[id(v)] for v in _diversify_legacy(view, *args)]
+
+
+def _pool(n: int) -> list:
+    raw = [
+        {"title": r["title"], "snippet": r["body"], "url": r["href"],
+         "sourceName": r["source"], "datePublished": r["date"]}
+        for r in fake_search_results("咖啡涨价 测试", n)
+    ]
+    # some author keys so the author cap has something to do
+    return [it.copy(authorKey=f"author{i % 5}" if i % 2 else "")
+            for i, it in enumerate(_dedup_by_url(_enrich(raw)))]
+
+
+POOL = _pool(120)
+CAPS = [(2, 1, 1, 2), (0, 0, 0, 0), (1, 2, 0, 6), (3, 0, 2, 1)]
+EXCLUDES = [set(), {"news.sina.com.cn"}, {"news.sina.com.cn", "thepaper.cn", "reuters.com"}]
+LIMITS = [0, 1, 5, 20, 60, 125]
+
+
+def _urls(items):
+    return [it.urlNormalized for it in items]
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+@pytest.mark.parametrize("caps", CAPS)
+@pytest.mark.parametrize("exclude", EXCLUDES)
+def test_matches_legacy(limit, caps, exclude):
+    per_domain, per_author, excluded_cap, min_ext = caps
+    args = (limit, per_domain, per_author, exclude, excluded_cap, min_ext)
+    assert _urls(_diversify(POOL, *args)) == _urls(_diversify_legacy(POOL, *args))
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+@pytest.mark.parametrize("caps", CAPS)
+def test_scores_match_legacy(limit, caps):
+    # few distinct values: most items tie, and ties must keep arrival order
+    scores = [(i * 7) % 4 if i % 5 else None for i in range(len(POOL))]
+    args = (limit, *caps[:2], {"news.sina.com.cn"}, *caps[2:])
+    assert _urls(_diversify(POOL, *args, scores=scores)) == _urls(_legacy_reference(POOL, args, scores))
+
+
+def test_all_tied_scores_keep_arrival_order():
+    args = (20, 2, 1, set(), 1, 2)
+    assert _urls(_diversify(POOL, *args, scores=[1.0] * len(POOL))) == _urls(_diversify(POOL, *args))
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+@pytest.mark.parametrize("caps", CAPS)
+def test_group_key_matches_legacy(limit, caps):
+    exclude = {"sina.com.cn"}
+    args = (limit, *caps[:2], exclude, *caps[2:])
+    new = _diversify(POOL, *args, group_key="sourceSite")
+    assert _urls(new) == _urls(_legacy_reference(POOL, args, group_key="sourceSite"))
+
+
+def test_group_key_counts_subdomains_as_one_site():
+    out = _diversify(POOL, 20, 1, 0, set(), 1, 0, group_key="sourceSite")
+    sites = [it.sourceSite for it in out[:len({it.sourceSite for it in POOL})]]
+    assert len(sites) == len(set(sites))
+    assert {it.sourceDomain for it in POOL} > {"news.sina.com.cn", "finance.sina.com.cn"}
+
+
+def test_scores_and_group_key_match_legacy():
+    scores = [len(it.title or "") % 3 for it in POOL]
+    args = (30, 2, 1, {"sina.com.cn"}, 0, 3)
+    new = _diversify(POOL, *args, scores=scores, group_key="sourceSite")
+    assert _urls(new) == _urls(_legacy_reference(POOL, args, scores, "sourceSite"))
@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+import event_state
+from disk_cache import DiskCache
+from event_state import EventStore
+
+
+def _raw(snippets, query="某公司涨价", article=""):
+    parts = [f"QUERY: {query}", "SNIPPETS:"]
+    for i, (url, snippet) in enumerate(snippets):
+        parts += [f"#{i + 1}", f"TITLE: 标题 {url}", f"SNIPPET: {snippet}", f"URL: {url}", ""]
+    if article:
+        parts += ["ARTICLE_TEXT:", article]
+    return "\n".join(parts)
+
+
+BASE = [(f"https://site{i}.com/a/{i}", f"某公司宣布涨价，第{i}条报道") for i in range(5)]
+SECTIONS = {"summary": "s", "timeline": [], "stances": [], "relatedEvents": []}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EventStore(DiskCache(path=str(tmp_path / "events.sqlite3"), namespace="event", ttl_s=3600))
+    plan = store.plan(_raw(BASE))
+    store.save(plan, SECTIONS)
+    return store
+
+
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("AGENT_INCREMENTAL", raising=False)
+    assert not event_state.enabled()
+    monkeypatch.setenv("AGENT_INCREMENTAL", "1")
+    assert event_state.enabled()
+
+
+def test_first_run_is_full(tmp_path):
+    store = EventStore(DiskCache(path=str(tmp_path / "e.sqlite3"), namespace="event", ttl_s=3600))
+    plan = store.plan(_raw(BASE))
+    assert plan.state is None and not plan.unchanged and not plan.delta
+
+
+def test_same_snippets_unchanged(store):
+    plan = store.plan(_raw(list(reversed(BASE))))
+    assert plan.unchanged and plan.state["summary"] == "s"
+
+
+def test_new_snippet_is_delta(store):
+    plan = store.plan(_raw(BASE + [("https://site9.com/a/9", "新增报道")]))
+    assert plan.delta and plan.new_count == 1
+    assert "site9.com" in plan.delta_text and "site0.com" not in plan.delta_text
+
+
+def test_rewritten_snippet_at_known_url_is_not_stale(store):
+    changed = list(BASE)
+    changed[2] = (BASE[2][0], "某公司撤回涨价决定")
+    plan = store.plan(_raw(changed))
+    assert not plan.unchanged
+    assert plan.delta and plan.new_count == 1 and "撤回涨价" in plan.delta_text
+
+
+def test_fewer_snippets_get_a_full_run(store):
+    plan = store.plan(_raw(BASE[:3]))
+    assert plan.state is None
+
+
+def test_new_article_is_delta(store):
+    plan = store.plan(_raw(BASE, article="原文正文。"))
+    assert plan.delta and plan.new_count == 0 and "ARTICLE_TEXT:" in plan.delta_text
+
+
+def test_other_query_is_a_new_event(store):
+    assert store.plan(_raw(BASE, query="另一件事")).state is None
+
+
+def test_mostly_new_snippets_treated_as_new_event(store):
+    other = [(f"https://other{i}.com/x/{i}", f"别的报道{i}") for i in range(20)]
+    assert store.plan(_raw(BASE[:1] + other)).state is None
+
+
+def test_refresh_bypasses_and_replaces_state(store):
+    plan = store.plan(_raw(BASE), refresh=True)
+    assert plan.state is None
+    store.save(plan, {**SECTIONS, "summary": "fresh"})
+    assert store.plan(_raw(BASE)).state["summary"] == "fresh"
+
+
+def test_no_query_or_snippets(store):
+    assert store.plan("SNIPPETS:\n#1\nTITLE: x\n") is None
+    assert store.plan("QUERY: q\nSNIPPETS:\n") is None
+
+
+def test_no_change_delta_does_not_escalate(monkeypatch, tmp_path):
+    import model_routing
+    from Agent import ReActTrinityAnalyzer
+    from replay import FakeZhipuAI
+
+    monkeypatch.setenv("AGENT_INCREMENTAL", "1")
+    monkeypatch.setenv("AGENT_CACHE", "0")
+    monkeypatch.setenv("AGENT_CACHE_PATH", str(tmp_path / "agent.sqlite3"))
+    monkeypatch.setenv("AGENT_MODEL_ROUTES", '{"default": ["cheap", "strong"]}')
+    monkeypatch.setattr(model_routing, "_routes", None)
+    monkeypatch.setattr(event_state, "_store", None)
+    full = {"summary": "s", "timeline": [{"date": "2024-05-01", "title": "t", "url": BASE[0][0]}],
+            "stakeholders": [{"name": "某公司", "stance": "涨价"}], "associations": [{"eventName": "e"}]}
+    no_change = {"summary": "s", "timeline": [], "stakeholders": [], "associations": []}
+
+    def analyze(raw, answer):
+        analyzer = ReActTrinityAnalyzer("k")
+        analyzer._client = FakeZhipuAI(responder=lambda messages: "Action: " + json.dumps(answer, ensure_ascii=False))
+        out = json.loads(analyzer.run(raw))
+        assert out["code"] == 200
+        return analyzer.stats, out["data"]
+
+    stats, _ = analyze(_raw(BASE), full)
+    assert stats["incremental"] == "full" and stats["escalations"] == 0
+    stats, data = analyze(_raw(BASE + [("https://site9.com/a/9", "重复报道")]), no_change)
+    assert stats["incremental"] == "delta" and stats["escalations"] == 0
+    assert set(stats["models"].values()) == {"cheap"}
+    assert data["timeline"] == full["timeline"] and data["stances"] == full["stakeholders"]
+
+
+def test_delta_skips_item_minimums():
+    import model_routing
+    empty = {"summary": "s", "timeline": [], "stakeholders": [], "associations": []}
+    assert model_routing.shortfall("timeline", empty) and model_routing.shortfall("fused", empty)
+    assert model_routing.shortfall("timeline", empty, delta=True) is None
+    assert model_routing.shortfall("fused", empty, delta=True) is None
+    assert model_routing.shortfall("summary", {"summary": ""}, delta=True) == "empty summary"
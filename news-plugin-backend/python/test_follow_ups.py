@@ -0,0 +1,54 @@
+import pytest
+
+import ddg_search
+
+QUERIES = ["咖啡价格上涨", "茶叶产量下降"]
+
+
+@pytest.fixture(autouse=True)
+def _fake_ddgs(monkeypatch):
+    monkeypatch.setenv("DDG_REPLAY", "fake")
+    monkeypatch.delenv("DDG_SPECULATIVE", raising=False)
+
+
+def _search(**payload):
+    out = ddg_search.search({"count": 10, "noCache": True, "includeMeta": True, "diversify": False, **payload})
+    assert "error" not in out
+    return out["results"], out["meta"]["searches"]
+
+
+def _follow_ups(searches, kind):
+    return [s for s in searches if s["kind"] == kind]
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+def test_diversity_retry_per_query_keeps_query_tag(speculative):
+    results, searches = _search(queries=QUERIES, count=60, perQueryCount=10, minUniqueDomains=50,
+                                speculative=speculative)
+    retries = [s for s in _follow_ups(searches, "diversity") if s["used"]]
+    assert sorted(s["group"] for s in retries) == sorted(QUERIES)
+    assert all(s["q"].startswith(s["group"] + " -site:") for s in retries)
+    # the fake titles start with the query they were searched with
+    assert {r["query"] for r in results} == set(QUERIES)
+    assert all(r["title"].startswith(r["query"]) for r in results)
+
+
+def test_external_retry_per_query():
+    results, searches = _search(queries=QUERIES, seedUrl="https://news.sina.com.cn/x.html",
+                                minExternalDomains=50, antiDominantRetry=False)
+    retries = _follow_ups(searches, "external")
+    assert sorted(s["group"] for s in retries) == sorted(QUERIES)
+    assert all("-site:news.sina.com.cn" in s["q"] and s["q"].startswith(s["group"]) for s in retries)
+    assert all(r["title"].startswith(r["query"]) for r in results)
+
+
+def test_no_retry_when_merged_results_are_diverse_enough():
+    results, _ = _search(queries=QUERIES)
+    _, searches = _search(queries=QUERIES, minUniqueDomains=len({r["sourceDomain"] for r in results}))
+    assert _follow_ups(searches, "diversity") == []
+
+
+def test_single_query_has_no_group_tag():
+    results, searches = _search(query=QUERIES[0], minUniqueDomains=50)
+    assert [s.get("group") for s in _follow_ups(searches, "diversity")] == [None]
+    assert all("query" not in r for r in results)
@@ -0,0 +1,46 @@
+import json
+import time
+
+import pytest
+
+from Agent import ReActTrinityAnalyzer
+from replay import FakeZhipuAI
+
+RAW = "QUERY: 咖啡涨价\nSNIPPETS:\n#1\nTITLE: 咖啡涨价\nSNIPPET: 咖啡价格上涨三成\nURL: https://a.com/1\n"
+
+
+@pytest.fixture(autouse=True)
+def _env(monkeypatch):
+    monkeypatch.setenv("AGENT_CACHE", "0")
+    monkeypatch.setenv("AGENT_HEDGE", "0")
+    monkeypatch.setenv("AGENT_RATE_LIMIT", "0")
+    monkeypatch.setenv("AGENT_STEP_RETRIES", "0")
+    monkeypatch.delenv("AGENT_MODEL_ROUTES", raising=False)
+
+
+def _summary_only(messages):
+    return 'Action: {"summary": "咖啡涨价"}'
+
+
+def _analyzer(step_timeout, latency_ms):
+    analyzer = ReActTrinityAnalyzer("k", exec_mode="fused", step_timeout=step_timeout, incremental=False)
+    analyzer._client = FakeZhipuAI(responder=_summary_only, latency_ms=latency_ms)
+    return analyzer
+
+
+def test_fallback_only_gets_the_time_left():
+    analyzer = _analyzer(0.8, 600)
+    start = time.monotonic()
+    out = json.loads(analyzer.run(RAW))
+    elapsed = time.monotonic() - start
+    # fused call 0.6 s + a fallback with a fresh deadline would take ~1.4 s
+    assert elapsed < 1.1
+    assert out["data"]["summary"] == "咖啡涨价" and out["data"]["partial"]
+    assert set(out["data"]["sectionErrors"]) == {"timeline", "stances", "relatedEvents"}
+
+
+def test_fallback_re_requests_missing_sections_in_time():
+    analyzer = _analyzer(5.0, 0)
+    out = json.loads(analyzer.run(RAW))
+    assert analyzer._client.calls == 4
+    assert out["data"]["partial"] and out["data"]["summary"] == "咖啡涨价"
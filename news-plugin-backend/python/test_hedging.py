@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+import hedging
+
+KEY = "agent:test"
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch, tmp_path):
+    monkeypatch.setenv("AGENT_HEDGE", "1")
+    monkeypatch.setenv("AGENT_CACHE_PATH", str(tmp_path / "latency.sqlite3"))
+    monkeypatch.setenv("AGENT_HEDGE_MIN_SAMPLES", "5")
+    monkeypatch.setenv("AGENT_HEDGE_MIN_MS", "0")
+    monkeypatch.setenv("AGENT_HEDGE_BUDGET", "1")
+    monkeypatch.setattr(hedging, "_store", None)
+    store = hedging.get_store()
+    # learned p90 falls in the first bucket: hedge after ~0.125 s
+    for _ in range(10):
+        store.record(KEY, 20)
+    return store
+
+
+def _slow_first(delay_s=2.0):
+    calls = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            calls.append(1)
+            n = len(calls)
+        if n == 1:
+            time.sleep(delay_s)
+            return "primary"
+        return "hedge"
+
+    return fn, calls
+
+
+def test_off_by_default(monkeypatch):
+    monkeypatch.delenv("AGENT_HEDGE")
+    assert not hedging.enabled()
+    assert hedging.timeout_s(KEY, 20.0) == 20.0
+
+
+def test_slow_primary_is_hedged():
+    fn, calls = _slow_first()
+    thresholds = []
+    start = time.monotonic()
+    assert hedging.hedged_call(KEY, fn, on_hedge=thresholds.append) == "hedge"
+    assert time.monotonic() - start < 1.0
+    assert len(calls) == 2 and thresholds == [pytest.approx(0.125)]
+
+
+def test_on_hedge_veto_waits_for_the_primary():
+    fn, calls = _slow_first(0.4)
+    assert hedging.hedged_call(KEY, fn, on_hedge=lambda threshold_s: False) == "primary"
+    assert len(calls) == 1
+
+
+def test_zero_budget_never_hedges(monkeypatch):
+    monkeypatch.setenv("AGENT_HEDGE_BUDGET", "0")
+    fn, calls = _slow_first(0.4)
+    assert hedging.hedged_call(KEY, fn) == "primary"
+    assert len(calls) == 1
+
+
+def test_fast_call_is_not_hedged():
+    calls = []
+    assert hedging.hedged_call(KEY, lambda: calls.append(1) or "ok") == "ok"
+    assert len(calls) == 1
+
+
+def test_cold_key_runs_once_and_records(store):
+    assert hedging.hedged_call("agent:cold", lambda: "ok") == "ok"
+    assert store.percentile_ms("agent:cold", 0.5, 1) is not None
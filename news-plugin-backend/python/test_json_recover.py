@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from json_recover import parse_object
+
+
+def test_clean_object_is_not_a_repair():
+    assert parse_object('Thought: ok\nAction: {"summary": "a"}') == ({"summary": "a"}, False)
+
+
+@pytest.mark.parametrize("text", [
+    'Thought: 先看时间线。\nAction: {"summary": "a"}\n以上是结果，如需更多请告诉我。',
+    'Sure! Here is the JSON:\n```json\n{"summary": "a"}\n```\nLet me know {if} you need more.',
+    'Thought: the {key} facts are below\nAction: {"summary": "a"} trailing {garbage',
+    'Action：{"summary": "a"}。',
+])
+def test_prose_around_the_object(text):
+    data, _ = parse_object(text)
+    assert data == {"summary": "a"}
+
+
+def test_action_object_preferred_over_braces_in_thought():
+    text = 'Thought: I considered {"summary": "draft"} first.\nAction: {"summary": "final"} done'
+    assert parse_object(text)[0] == {"summary": "final"}
+
+
+@pytest.mark.parametrize("value", [
+    "用 {大括号} 标注",
+    "closing } first then {",
+    'escaped \\" quote and } brace',
+    "nested {{[]}} and ] ]",
+])
+def test_braces_inside_strings(value):
+    text = "Thought: x\nAction: " + json.dumps({"summary": value, "n": [1, 2]}, ensure_ascii=False) + " 结束"
+    assert parse_object(text)[0] == {"summary": value, "n": [1, 2]}
+
+
+def test_trailing_commas():
+    data, repaired = parse_object('Action: {"a": [1, 2,], "b": {"c": 3,},}')
+    assert data == {"a": [1, 2], "b": {"c": 3}} and repaired
+
+
+def test_truncated_array_keeps_finished_items():
+    text = ('Action: {"summary": "s", "timeline": [{"date": "2024-01-01", "title": "t1"}, '
+            '{"date": "2024-01-02", "title": "t2"}, {"date": "2024-01-0')
+    data, repaired = parse_object(text)
+    assert repaired
+    assert data == {"summary": "s", "timeline": [{"date": "2024-01-01", "title": "t1"},
+                                                  {"date": "2024-01-02", "title": "t2"}]}
+
+
+def test_truncated_array_of_scalars():
+    data, repaired = parse_object('Action: {"selected_ids": [1, 2, 3')
+    assert repaired and data == {"selected_ids": [1, 2]}
+
+
+def test_truncated_before_first_item_gives_empty_list():
+    data, repaired = parse_object('Action: {"summary": "s", "timeline": [{"date": "20')
+    assert repaired and data == {"summary": "s", "timeline": []}
+
+
+def test_truncated_inside_a_string_value():
+    data, repaired = parse_object('Action: {"summary": "咖啡价格上涨三成，多家')
+    assert repaired and data == {"summary": "咖啡价格上涨三成，多家"}
+
+
+def test_truncated_after_dangling_backslash():
+    data, repaired = parse_object('Action: {"summary": "a\\')
+    assert repaired and data == {"summary": "a"}
+
+
+def test_truncated_nested_object():
+    data, repaired = parse_object('Action: {"summary": "s", "meta": {"sources": 3, "lang": "zh"')
+    assert repaired and data == {"summary": "s", "meta": {"sources": 3, "lang": "zh"}}
+
+
+def test_truncated_after_key_cuts_back_to_last_element():
+    data, repaired = parse_object('Action: {"summary": "s", "meta": {"sources": 3, "lang":')
+    assert repaired and data == {"summary": "s", "meta": {"sources": 3}}
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    None,
+    "抱歉，我无法完成这个请求。",
+    "Thought: nothing to add\nAction: none",
+    "[1, 2, 3]",
+    '"just a string"',
+    "Action: {",
+    "Action: {{{",
+    "} {",
+])
+def test_no_json_object(text):
+    assert parse_object(text) == (None, False)
+
+
+def test_literal_empty_object_is_kept():
+    assert parse_object("Action: {}") == ({}, False)
@@ -0,0 +1,56 @@
+import pytest
+
+import metrics
+from metrics_report import aggregate, read_records
+
+
+@pytest.fixture
+def sidecar(monkeypatch, tmp_path):
+    path = tmp_path / "metrics" / "agent.jsonl"
+    monkeypatch.setenv("AGENT_METRICS_PATH", str(path))
+    monkeypatch.delenv("AGENT_DEBUG", raising=False)
+    monkeypatch.setattr(metrics, "_events", [])
+    return path
+
+
+def test_spans_are_flushed_to_the_sidecar(sidecar):
+    with metrics.span("step", "timeline", charsIn=10):
+        metrics.add(promptTokens=3)
+        with metrics.span("llm", "timeline"):
+            metrics.add(promptTokens=5, calls=1)
+        metrics.add(promptTokens=4)
+        metrics.annotate(attempts=1)
+    metrics.add(promptTokens=100)  # outside a span: dropped
+    metrics.flush("agent_runner", "analyze", ok=True, results=2)
+
+    (record,) = read_records(str(sidecar))
+    assert (record["entry"], record["mode"], record["ok"], record["results"]) == ("agent_runner", "analyze", True, 2)
+    llm, step = record["events"]
+    assert (llm["kind"], llm["promptTokens"], llm["calls"]) == ("llm", 5, 1)
+    assert (step["kind"], step["name"], step["promptTokens"], step["charsIn"], step["attempts"]) == \
+        ("step", "timeline", 7, 10, 1)
+    assert all(ev["wallMs"] >= 0 for ev in record["events"])
+
+    report = aggregate([record])
+    assert report["agent_runner analyze step:timeline"]["meanPromptTokens"] == 7
+    assert report["agent_runner analyze llm:timeline"]["count"] == 1
+    assert metrics.events() == []
+
+
+def test_failed_span_records_the_error(sidecar):
+    with pytest.raises(ValueError):
+        with metrics.span("search", "auto"):
+            raise ValueError("boom")
+    metrics.flush("ddg_search", "single", ok=False)
+    (record,) = read_records(str(sidecar))
+    assert record["ok"] is False and record["events"][0]["error"] == "ValueError"
+
+
+def test_disabled_writes_nothing(monkeypatch, tmp_path):
+    monkeypatch.delenv("AGENT_METRICS_PATH", raising=False)
+    monkeypatch.delenv("AGENT_DEBUG", raising=False)
+    monkeypatch.setattr(metrics, "_events", [])
+    with metrics.span("step", "summary"):
+        pass
+    metrics.flush("agent_runner", "analyze")
+    assert metrics.events() == [] and list(tmp_path.iterdir()) == []
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import model_routing
+from Agent import ReActTrinityAnalyzer
+from model_routing import shortfall, tiers
+from replay import FakeZhipuAI, canned_output
+
+RAW = "QUERY: 咖啡涨价\nSNIPPETS:\n#1\nTITLE: 咖啡涨价\nSNIPPET: 咖啡价格上涨三成\nURL: https://a.com/1\n"
+
+
+@pytest.fixture
+def routes(monkeypatch):
+    def set_routes(raw):
+        monkeypatch.setenv("AGENT_MODEL_ROUTES", raw)
+        monkeypatch.setattr(model_routing, "_routes", None)
+
+    return set_routes
+
+
+def test_tiers_from_routes(routes):
+    routes('{"summary": "flashx", "timeline": ["cheap", " ", "strong"], "default": "base", "stances": []}')
+    assert tiers("summary") == ["flashx"]
+    assert tiers("timeline") == ["cheap", "strong"]
+    # an empty list falls back like an unlisted route
+    assert tiers("stances") == ["base"] and tiers("strategy") == ["base"]
+
+
+@pytest.mark.parametrize("raw", ["", "not json", '["cheap"]'])
+def test_missing_or_invalid_routes_use_the_default_model(routes, raw):
+    routes(raw)
+    assert tiers("timeline") == [model_routing.DEFAULT_MODEL]
+
+
+def test_shortfall(monkeypatch):
+    assert shortfall("timeline", None) == shortfall("summary", {"code": 500}) == "parse failed"
+    assert shortfall("summary", {"summary": " "}) == "empty summary"
+    assert shortfall("timeline", {"timeline": []}) == "timeline has 0 < 1 items"
+    # stances may come back under either field name
+    assert shortfall("stances", {"stances": [{"party": "企业"}]}) is None
+    assert shortfall("fused", {"summary": "s", "timeline": [1], "stakeholders": [1]}).startswith("relatedEvents")
+    monkeypatch.setenv("AGENT_MIN_TIMELINE", "0")
+    assert shortfall("timeline", {"timeline": []}) is None
+    monkeypatch.setenv("AGENT_MIN_QUERIES", "2")
+    assert shortfall("strategy", {"queries": [{"q": "a"}]}) == "strategy has 1 < 2 items"
+
+
+def _analyze(monkeypatch, answer):
+    """Run the analyzer with answer(model, messages) -> output; returns (stats, data, models asked)."""
+    for name, value in {"AGENT_CACHE": "0", "AGENT_HEDGE": "0", "AGENT_RATE_LIMIT": "0",
+                        "AGENT_INCREMENTAL": "0", "AGENT_EXEC_MODE": "sequential", "AGENT_STEP_RETRIES": "0"}.items():
+        monkeypatch.setenv(name, value)
+    asked = []
+    client = FakeZhipuAI()
+    create = client.chat.completions.create
+
+    def routed_create(**kwargs):
+        asked.append(kwargs["model"])
+        # steps run sequentially, so the responder can be swapped per call
+        client.responder = lambda messages: answer(kwargs["model"], messages)
+        return create(**kwargs)
+
+    client.chat.completions.create = routed_create
+    analyzer = ReActTrinityAnalyzer("k")
+    analyzer._client = client
+    out = json.loads(analyzer.run(RAW))
+    assert out["code"] == 200
+    return analyzer.stats, out["data"], asked
+
+
+def test_short_answer_escalates_to_the_next_tier(monkeypatch, routes):
+    routes('{"timeline": ["cheap", "strong"], "default": "base"}')
+
+    def answer(model, messages):
+        if model == "cheap":
+            return 'Action: {"timeline": []}'
+        return canned_output(messages)
+
+    stats, data, asked = _analyze(monkeypatch, answer)
+    assert sorted(asked) == ["base", "base", "base", "cheap", "strong"]
+    assert stats["escalations"] == 1 and stats["models"]["timeline"] == "strong"
+    assert stats["models"]["summary"] == "base" and len(data["timeline"]) == 3
+
+
+def test_failed_call_escalates_and_the_last_tier_is_kept(monkeypatch, routes):
+    routes('{"default": ["cheap", "strong"]}')
+
+    def answer(model, messages):
+        if model == "cheap":
+            raise RuntimeError("overloaded")
+        # the last tier's answer is kept even when it falls short
+        return 'Action: {"timeline": []}' if "时间轴梳理" in messages[0]["content"] else canned_output(messages)
+
+    stats, data, asked = _analyze(monkeypatch, answer)
+    assert asked.count("cheap") == 4 and asked.count("strong") == 4
+    assert stats["escalations"] == 4 and set(stats["models"].values()) == {"strong"}
+    assert data["timeline"] == []
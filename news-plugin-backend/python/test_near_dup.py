@@ -0,0 +1,73 @@
+import copy
+
+from ddg_search import _collapse_near_dups, _enrich
+
+STORY = "某公司宣布旗下主要产品自下月起全面涨价百分之十，多家经销商表示已提前备货"
+
+
+def _item(i: int, snippet: str, domain: str, title: str = "某公司宣布涨价", **fields) -> dict:
+    return {
+        "title": title,
+        "snippet": snippet,
+        "url": f"https://{domain}/news/{i}.html",
+        "sourceDomain": domain,
+        **fields,
+    }
+
+
+def _syndicated() -> list:
+    return [
+        _item(0, STORY, "a.com"),
+        _item(1, STORY + "（转载）", "b.com", hasDate=True),
+        _item(2, "完全不同的另一条新闻：某地举办马拉松比赛，数万名选手参加", "c.com"),
+        _item(3, STORY, "d.com"),
+    ]
+
+
+def test_accepts_plain_dicts():
+    out = _collapse_near_dups(_syndicated())
+    assert [it["clusterSize"] for it in out] == [3, 1]
+
+
+def test_input_not_mutated():
+    items = _syndicated()
+    before = copy.deepcopy(items)
+    _collapse_near_dups(items)
+    assert items == before
+
+
+def test_candidates_not_mutated():
+    items = _enrich(_syndicated())
+    out = _collapse_near_dups(items)
+    assert [c.clusterSize for c in out] == [3, 1]
+    assert all(c.clusterSize is None for c in items)
+    assert out[0].to_dict()["clusterSize"] == 3
+
+
+def test_representative_prefers_richer_copy():
+    out = _collapse_near_dups(_syndicated())
+    # the dated copy represents the cluster, in the slot of its first member
+    assert out[0]["sourceDomain"] == "b.com"
+    assert out[1]["sourceDomain"] == "c.com"
+
+
+def test_representative_avoids_excluded_domain():
+    out = _collapse_near_dups(_syndicated(), exclude_set={"b.com"})
+    assert out[0]["sourceDomain"] == "a.com"
+
+
+def test_short_text_never_collapsed():
+    items = [_item(i, "", f"s{i}.com", title="涨价") for i in range(3)]
+    out = _collapse_near_dups(items)
+    assert [it["clusterSize"] for it in out] == [1, 1, 1]
+
+
+def test_threshold():
+    # shingle Jaccard of the pair is ~0.9
+    items = [_item(0, STORY, "a.com"), _item(1, STORY + "记者王某", "b.com")]
+    assert len(_collapse_near_dups(items, threshold=0.95)) == 2
+    assert len(_collapse_near_dups(items, threshold=0.85)) == 1
+
+
+def test_empty():
+    assert _collapse_near_dups([]) == []
@@ -0,0 +1,109 @@
+import pytest
+
+from packing import LEAD_TOKENS, dedup_blocks, estimate_tokens, pack_for_step, parse_raw_text
+
+LEAD = "某公司宣布涨价百分之十。"
+
+
+def _raw(n: int, snippet_chars: int = 200, article: str = "") -> str:
+    parts = ["QUERY: 某公司涨价", "SNIPPETS:"]
+    for i in range(n):
+        snippet = (LEAD + "后续报道细节" * snippet_chars)[:snippet_chars]
+        parts.append("\n".join([
+            f"#{i + 1}",
+            f"DATE: 2024-01-{i % 28 + 1:02d}",
+            f"SOURCE: 媒体{i}",
+            f"TITLE: 第{i}条新闻标题",
+            f"SNIPPET: {snippet}",
+            f"URL: https://site{i % 5}.com/news/{i}",
+        ]))
+        parts.append("")
+    if article:
+        parts += ["ARTICLE_TITLE: 原文标题", "ARTICLE_TEXT:", article]
+    return "\n".join(parts)
+
+
+ARTICLE = "原文第一句导语。" + "正文内容很长。" * 500
+
+
+@pytest.mark.parametrize("step", ["0", "A", "B", "C", "fused"])
+@pytest.mark.parametrize("budget", [80, 200, 800, 3000])
+def test_budget_respected(step, budget):
+    out = pack_for_step(_raw(30, 300, ARTICLE), step, budget)
+    assert estimate_tokens(out) <= budget
+
+
+def test_small_input_kept_whole():
+    raw = _raw(3, 40)
+    out = pack_for_step(raw, "0", 3000)
+    for b in parse_raw_text(raw)["blocks"]:
+        assert f"SNIPPET: {b['SNIPPET']}" in out
+
+
+def test_header_kept():
+    out = pack_for_step(_raw(30, 300), "B", 100)
+    assert out.startswith("QUERY: 某公司涨价\nSNIPPETS:")
+
+
+@pytest.mark.parametrize("step", ["0", "A", "B", "C"])
+def test_title_and_lead_survive_when_snippet_too_long(step):
+    out = pack_for_step(_raw(1, 5000), step, 200)
+    assert "TITLE: 第0条新闻标题" in out
+    assert "URL: https://site0.com/news/0" in out
+    assert f"SNIPPET: {LEAD}" in out
+    assert estimate_tokens(out) <= 200
+
+
+def test_truncated_lead_is_capped():
+    out = pack_for_step(_raw(1, 5000), "0", 3000)
+    snippet = next(line for line in out.splitlines() if line.startswith("SNIPPET: "))
+    assert estimate_tokens(snippet[len("SNIPPET: "):]) <= LEAD_TOKENS
+
+
+def test_every_step_sees_some_snippet_next_to_article():
+    out = pack_for_step(_raw(30, 300, ARTICLE), "C", 200)
+    assert "TITLE: " in out.split("ARTICLE_TITLE:")[0]
+    assert "ARTICLE_TEXT:\n原文第一句导语。" in out
+
+
+def test_article_lead_survives_truncation():
+    out = pack_for_step(_raw(2, 40, ARTICLE), "0", 400)
+    body = out.split("ARTICLE_TEXT:\n", 1)[1]
+    assert body.startswith("原文第一句导语。")
+    assert len(body) < len(ARTICLE)
+
+
+def test_near_duplicates_dropped():
+    raw = _raw(1, 80)
+    dup = raw + "\n" + "\n".join([
+        "#2", "TITLE: 第0条新闻标题", "SNIPPET: " + (LEAD + "后续报道细节" * 80)[:80], "URL: https://other.com/x",
+    ])
+    out = pack_for_step(dup, "0", 3000)
+    assert out.count("TITLE: 第0条新闻标题") == 1
+
+
+def test_no_snippet_blocks_returns_none():
+    assert pack_for_step("just some text", "0", 100) is None
+
+
+def _distinct_raw(n: int) -> str:
+    parts = ["QUERY: 某公司涨价", "SNIPPETS:"]
+    for i in range(n):
+        snippet = "甲乙丙丁戊己庚辛壬癸"[i % 10] * 60 + str(i)
+        parts += [f"#{i + 1}", f"DATE: 2024-01-{i + 1:02d}", f"TITLE: 第{i}条", f"SNIPPET: {snippet}",
+                  f"URL: https://site{i % 5}.com/news/{i}", ""]
+    return "\n".join(parts)
+
+
+def test_timeline_keeps_newest_and_shows_them_in_date_order():
+    out = pack_for_step(_distinct_raw(20), "A", 400)
+    whole = [b["DATE"] for b in parse_raw_text(out)["blocks"] if len(b.get("SNIPPET", "")) > 60]
+    assert 0 < len(whole) < 20
+    assert whole == sorted(whole) and whole[-1] == "2024-01-20"
+    assert whole[0] > "2024-01-10"
+
+
+def test_near_duplicates_keep_the_richer_copy_in_place():
+    blocks = parse_raw_text(_distinct_raw(2))["blocks"]
+    copy = {k: v for k, v in blocks[0].items() if k != "DATE"}
+    assert dedup_blocks([copy, blocks[1], blocks[0]]) == [blocks[0], blocks[1]]
@@ -0,0 +1,17 @@
+import pytest
+
+import agent_runner
+
+
+def _no_client():
+    raise AssertionError("a rejected payload must not reach the model")
+
+
+@pytest.mark.parametrize("payload, msg", [
+    ({"mode": "translate", "rawText": "x"}, "unknown mode: translate"),
+    ({"rawText": ""}, "rawText is required"),
+    ({}, "rawText is required"),
+])
+def test_rejected_payloads_are_400(payload, msg):
+    out = agent_runner.handle(payload, "k", _no_client)
+    assert out["code"] == 400 and out["msg"] == msg
@@ -0,0 +1,120 @@
+import pytest
+
+from prefilter import WEIGHTS, classify, features, merge, query_tokens, score, thresholds
+
+QUERY = "咖啡价格上涨"
+LIMITS = {"newsMin": 4.0, "discardMax": 1.0, "overlapMin": 0.6, "backgroundMax": 1}
+LONG = "咖啡价格上涨三成，多家连锁品牌宣布调价，业内人士认为原料成本与汇率波动是主要原因，后续仍有上调压力，部分门店已经开始限购热门单品。"
+
+
+def _c(cid, url, title="", snippet="", **fields):
+    return {"id": cid, "url": url, "title": title, "snippet": snippet, **fields}
+
+
+NEWS = _c("news", "https://www.reuters.com/world/2024/05/01/coffee.html", "咖啡价格上涨三成", LONG,
+          datePublished="2024-05-01", sourceName="Reuters")
+MIDDLE = _c("middle", "https://www.example.com/food/coffee", "咖啡价格上涨的原因分析", "咖啡价格上涨")
+HOMEPAGE = _c("home", "https://www.example.com/", "咖啡", "")
+OFF_TOPIC = _c("off", "https://www.reuters.com/world/2024/05/01/rain.html", "某地暴雨", LONG.replace("咖啡", "茶叶")
+               .replace("价格上涨", "产量下降"), datePublished="2024-05-01")
+EMPTY = _c("empty", "", "", "")
+WIKI_1 = _c("wiki1", "https://zh.wikipedia.org/wiki/咖啡", "咖啡 - 维基百科", "咖啡价格上涨的历史")
+WIKI_2 = _c("wiki2", "https://baike.baidu.com/item/咖啡", "咖啡_百度百科", "咖啡价格上涨的原因")
+WIKI_3 = _c("wiki3", "https://en.wikipedia.org/wiki/Coffee", "Coffee", "咖啡价格上涨与期货")
+
+
+def _f(c):
+    return features(c, query_tokens(QUERY))
+
+
+def test_query_tokens():
+    assert query_tokens("咖啡 price -site:sina.com.cn") == {"咖啡", "price"}
+    assert query_tokens("涨") == {"涨"}
+    assert query_tokens("") == set()
+
+
+def test_score_of_a_full_news_item():
+    f = _f(NEWS)
+    assert f["overlap"] == 1.0
+    # every positive signal, none of the penalties
+    assert score(f, WEIGHTS) == pytest.approx(1.5 + 1.0 + 1.0 + 0.5 + 0.5 + 0.5 + 2.0)
+
+
+def test_score_of_a_homepage():
+    f = _f(HOMEPAGE)
+    assert f["homepage"] == 1.0 and f["shortText"] == 1.0
+    assert score(f, WEIGHTS) == pytest.approx(2.0 * f["overlap"] - 2.0 - 1.5)
+
+
+def test_signals_from_candidate_win_over_url():
+    f = _f({**MIDDLE, "urlDepth": 0, "hasDate": True})
+    assert f["homepage"] == 1.0 and f["deepUrl"] == 0.0 and f["hasDate"] == 1.0
+
+
+def test_classify_fixed_list():
+    decided, ambiguous = classify([NEWS, MIDDLE, HOMEPAGE, OFF_TOPIC, EMPTY], QUERY, LIMITS)
+    assert decided == {"news_ids": ["news"], "background_ids": [], "discard_ids": ["home", "off", "empty"]}
+    assert [c["id"] for c in ambiguous] == ["middle"]
+
+
+def test_news_needs_overlap_as_well_as_score():
+    partial = {**NEWS, "id": "partial", "title": "咖啡新闻", "snippet": LONG.replace("价格上涨", "")}
+    f = _f(partial)
+    assert score(f, WEIGHTS) >= LIMITS["newsMin"] and f["overlap"] < LIMITS["overlapMin"]
+    decided, ambiguous = classify([partial], QUERY, LIMITS)
+    assert decided["news_ids"] == [] and [c["id"] for c in ambiguous] == ["partial"]
+
+
+@pytest.mark.parametrize("news_min, expected", [(3.0, "news_ids"), (4.0, None)])
+def test_news_threshold(news_min, expected):
+    s = score(_f(MIDDLE), WEIGHTS)
+    assert 3.0 <= s < 4.0
+    decided, ambiguous = classify([MIDDLE], QUERY, {**LIMITS, "newsMin": news_min})
+    assert (decided[expected] == ["middle"]) if expected else [c["id"] for c in ambiguous] == ["middle"]
+
+
+@pytest.mark.parametrize("discard_max, expected", [(3.5, "discard_ids"), (1.0, None)])
+def test_discard_threshold(discard_max, expected):
+    decided, ambiguous = classify([MIDDLE], QUERY, {**LIMITS, "discardMax": discard_max})
+    assert (decided[expected] == ["middle"]) if expected else [c["id"] for c in ambiguous] == ["middle"]
+
+
+def test_only_one_wiki_page_goes_to_background():
+    decided, ambiguous = classify([WIKI_1, NEWS, WIKI_2, WIKI_3], QUERY, LIMITS)
+    assert decided["background_ids"] == ["wiki1"]
+    # the other wiki pages are scored like any other candidate
+    rest = decided["news_ids"] + decided["discard_ids"] + [c["id"] for c in ambiguous]
+    assert sorted(rest) == ["news", "wiki2", "wiki3"]
+
+
+def test_background_max():
+    decided, _ = classify([WIKI_1, WIKI_2, WIKI_3], QUERY, {**LIMITS, "backgroundMax": 2})
+    assert decided["background_ids"] == ["wiki1", "wiki2"]
+    decided, _ = classify([WIKI_1], QUERY, {**LIMITS, "backgroundMax": 0})
+    assert decided["background_ids"] == []
+
+
+def test_off_topic_wiki_does_not_take_the_background_slot():
+    off_wiki = _c("offwiki", "https://zh.wikipedia.org/wiki/茶", "茶 - 维基百科", "茶叶产量")
+    decided, _ = classify([off_wiki, WIKI_1], QUERY, LIMITS)
+    assert decided["background_ids"] == ["wiki1"] and decided["discard_ids"] == ["offwiki"]
+
+
+def test_query_used_overrides_payload_query():
+    decided, _ = classify([{**OFF_TOPIC, "queryUsed": "茶叶产量下降"}], QUERY, LIMITS)
+    assert decided["news_ids"] == ["off"]
+
+
+def test_env_thresholds(monkeypatch):
+    monkeypatch.setenv("AGENT_PREFILTER_NEWS_MIN", "5.5")
+    monkeypatch.setenv("AGENT_PREFILTER_BACKGROUND_MAX", "3")
+    monkeypatch.setenv("AGENT_PREFILTER_OVERLAP_MIN", "oops")
+    assert thresholds() == {"newsMin": 5.5, "discardMax": 1.0, "overlapMin": 0.6, "backgroundMax": 3}
+
+
+def test_merge_keeps_candidate_order_and_ignores_unshown_ids():
+    candidates = [NEWS, MIDDLE, HOMEPAGE]
+    decided, ambiguous = classify(candidates, QUERY, LIMITS)
+    llm = {"news_ids": ["middle", "home"], "background_ids": [], "discard_ids": ["news"]}
+    assert merge(candidates, decided, llm, ambiguous) == {
+        "news_ids": ["news", "middle"], "background_ids": [], "discard_ids": ["home"]}
@@ -0,0 +1,58 @@
+import pytest
+
+import rate_limit
+from disk_cache import env_num
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+@pytest.fixture(autouse=True)
+def _limiter(monkeypatch, tmp_path):
+    monkeypatch.setenv("AGENT_RATE_LIMIT", "1")
+    monkeypatch.setenv("AGENT_CACHE_PATH", str(tmp_path / "rate.sqlite3"))
+    monkeypatch.delenv("AGENT_RATE_RETRIES", raising=False)
+    monkeypatch.setattr(rate_limit, "_limiter", None)
+    monkeypatch.setattr(rate_limit.time, "sleep", lambda s: None)
+
+
+def _always_429(calls):
+    def fn():
+        calls.append(1)
+        raise RateLimited("429 Too Many Requests")
+    return fn
+
+
+@pytest.mark.parametrize("retries, expected_calls", [(None, 3), ("1", 2), ("0", 1)])
+def test_429_retries(monkeypatch, retries, expected_calls):
+    if retries is not None:
+        monkeypatch.setenv("AGENT_RATE_RETRIES", retries)
+    calls = []
+    with pytest.raises(RateLimited):
+        rate_limit.limited_call(1, 10, _always_429(calls))
+    assert len(calls) == expected_calls
+
+
+def test_other_errors_are_not_retried():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        rate_limit.limited_call(1, 10, fn)
+    assert len(calls) == 1
+
+
+def test_zero_reserve_is_kept(monkeypatch):
+    monkeypatch.setenv("AGENT_RATE_RESERVE", "0")
+    assert rate_limit.get_limiter().reserve == 0
+
+
+@pytest.mark.parametrize("value, expected", [("0", 0), ("3", 3), ("-1", 2), ("x", 2), ("", 2)])
+def test_env_num_minimum(monkeypatch, value, expected):
+    monkeypatch.setenv("AGENT_RATE_RETRIES", value)
+    assert env_num("AGENT_RATE_RETRIES", 2, minimum=0) == expected
+    assert env_num("AGENT_RATE_RETRIES", 2) == (expected or 2)
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+import ddg_search
+from ddg_search import _normalize_query, _search_key
+
+QUERY = "咖啡价格上涨"
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("DDG_REPLAY", "fake")
+    monkeypatch.setenv("DDG_CACHE", "1")
+    monkeypatch.setenv("DDG_CACHE_PATH", str(tmp_path / "ddg.sqlite3"))
+    monkeypatch.delenv("DDG_CACHE_TTL_S", raising=False)
+    monkeypatch.delenv("DDG_CACHE_STALE_S", raising=False)
+    monkeypatch.setattr(ddg_search, "_search_cache", None)
+    return ddg_search._get_search_cache
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """Queries that actually went to DDG."""
+    sent = []
+    real = ddg_search._search_pooled
+
+    def counting(pool, ddgs_cls, query, *args, **kwargs):
+        sent.append(query)
+        return real(pool, ddgs_cls, query, *args, **kwargs)
+
+    monkeypatch.setattr(ddg_search, "_search_pooled", counting)
+    return sent
+
+
+@pytest.fixture
+def spawned(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ddg_search, "_spawn_revalidate", lambda *args: calls.append(args))
+    return calls
+
+
+def _search(**payload):
+    out = ddg_search.search({"query": QUERY, "count": 10, "includeMeta": True, "antiDominantRetry": False,
+                             **payload})
+    return out["results"], out["meta"].get("cache")
+
+
+def test_normalized_query():
+    assert _normalize_query("  咖啡  Price -site:b.com -site:a.com") == _normalize_query("咖啡 price -site:a.com -site:b.com")
+    assert _search_key("q", 10, "auto", "cn-zh") != _search_key("q", 20, "auto", "cn-zh")
+
+
+def test_second_search_is_a_hit(cache, searches):
+    first, stats = _search()
+    assert stats["misses"] == 1 and searches == [QUERY]
+    second, stats = _search(query=f"  {QUERY} ")
+    assert stats == {"hits": 1, "stale": 0, "misses": 0, "revalidations": 0}
+    assert searches == [QUERY] and second == first
+
+
+def test_no_cache_payload_bypasses(cache, searches):
+    _search()
+    _search(noCache=True)
+    assert searches == [QUERY, QUERY]
+
+
+def test_stale_entry_served_and_revalidated_once(monkeypatch, cache, searches, spawned):
+    monkeypatch.setenv("DDG_CACHE_TTL_S", "0.05")
+    first, _ = _search()
+    time.sleep(0.1)
+    second, stats = _search()
+    assert second == first and stats["stale"] == 1 and stats["revalidations"] == 1
+    assert spawned == [(QUERY, 10, "auto", "cn-zh")]
+    # the lease stops a second process from spawning its own refresh
+    _, stats = _search()
+    assert stats["stale"] == 1 and stats["revalidations"] == 0 and len(spawned) == 1
+    assert searches == [QUERY]
+
+
+def test_zero_stale_window_searches_again(monkeypatch, cache, searches, spawned):
+    monkeypatch.setenv("DDG_CACHE_TTL_S", "0.05")
+    monkeypatch.setenv("DDG_CACHE_STALE_S", "0")
+    _search()
+    time.sleep(0.1)
+    _, stats = _search()
+    assert stats["misses"] == 1 and searches == [QUERY, QUERY] and spawned == []
+
+
+def test_empty_results_not_cached(monkeypatch, cache):
+    monkeypatch.setattr(ddg_search, "_search_pooled", lambda *args, **kwargs: [])
+    _search()
+    assert cache().get(_search_key(QUERY, 10, "auto", "cn-zh")) is None
+
+
+def test_revalidate_refreshes_the_entry(cache):
+    key = _search_key(QUERY, 10, "auto", "cn-zh")
+    cache().put(key, [{"title": "old", "url": "https://old.com/1"}])
+    assert ddg_search.search({"revalidate": {"query": QUERY, "count": 10, "backend": "auto", "region": "cn-zh"}}) is None
+    rows, stale = cache().get_entry(key)
+    assert not stale and len(rows) == 10 and rows[0]["title"] != "old"
+
+
+def test_detached_revalidation_process(cache):
+    key = _search_key(QUERY, 10, "auto", "cn-zh")
+    ddg_search._spawn_revalidate(QUERY, 10, "auto", "cn-zh")
+    deadline = time.monotonic() + 20
+    while cache().get(key) is None and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert len(cache().get(key)) == 10
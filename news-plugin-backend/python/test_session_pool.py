@@ -0,0 +1,106 @@
+import pytest
+
+import ddg_search
+from ddg_search import _SessionPool, _search_pooled
+from replay import fake_search_results
+
+
+class _Session:
+    """DDGS stand-in that records its lifecycle; fail_next makes its next search raise."""
+
+    instances = []
+
+    def __init__(self):
+        self.entered = self.exited = False
+        self.fail_next = False
+        self.searches = 0
+        _Session.instances.append(self)
+
+    def __enter__(self):
+        self.entered = True
+        return self
+
+    def __exit__(self, *exc):
+        self.exited = True
+
+    def text(self, query, max_results=10, **kwargs):
+        self.searches += 1
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("202 Ratelimit")
+        return fake_search_results(query, max_results)
+
+
+@pytest.fixture(autouse=True)
+def _fresh():
+    _Session.instances = []
+
+
+def test_released_session_is_reused():
+    pool = _SessionPool(_Session)
+    s = pool.acquire()
+    pool.release(s)
+    assert pool.acquire() is s and s.entered
+    assert len(_Session.instances) == 1
+
+
+def test_concurrent_acquires_open_separate_sessions():
+    pool = _SessionPool(_Session)
+    a, b = pool.acquire(), pool.acquire()
+    assert a is not b
+    pool.close()
+    assert a.exited and b.exited
+
+
+def test_broken_session_is_closed_not_reused():
+    pool = _SessionPool(_Session)
+    s = pool.acquire()
+    pool.release(s, broken=True)
+    assert s.exited and pool.acquire() is not s
+
+
+def test_search_retries_on_a_fresh_session():
+    pool = _SessionPool(_Session)
+    s = pool.acquire()
+    s.fail_next = True
+    pool.release(s)
+    rows = _search_pooled(pool, _Session, "咖啡", 5, "auto", "cn-zh")
+    assert len(rows) == 5
+    first, second = _Session.instances
+    assert first.exited and second.searches == 1 and not second.exited
+
+
+def test_search_gives_up_after_its_attempts():
+    class Failing(_Session):
+        def text(self, query, max_results=10, **kwargs):
+            raise RuntimeError("down")
+
+    pool = _SessionPool(Failing)
+    with pytest.raises(RuntimeError):
+        _search_pooled(pool, Failing, "咖啡", 5, "auto", "cn-zh", attempts=2)
+    assert len(_Session.instances) == 2 and all(s.exited for s in _Session.instances)
+
+
+def test_fan_out_shares_sessions(monkeypatch):
+    monkeypatch.setattr(ddg_search, "_load_ddgs_classes", lambda: (_Session, None))
+    out = ddg_search.search({"queries": [f"咖啡 {i}" for i in range(8)], "maxConcurrency": 2, "noCache": True,
+                             "antiDominantRetry": False, "includeMeta": True})
+    # two slots: never more than two sessions, all closed at the end
+    assert len(_Session.instances) <= 2 and all(s.exited for s in _Session.instances)
+    assert [q["count"] for q in out["meta"]["queries"]] == [20] * 8
+
+
+def test_one_failing_query_does_not_fail_the_fan_out(monkeypatch):
+    class Picky(_Session):
+        def text(self, query, max_results=10, **kwargs):
+            if query.endswith("bad"):
+                raise RuntimeError("blocked")
+            return super().text(query, max_results, **kwargs)
+
+    monkeypatch.setattr(ddg_search, "_load_ddgs_classes", lambda: (Picky, None))
+    out = ddg_search.search({"queries": ["咖啡 ok", "咖啡 bad"], "noCache": True, "antiDominantRetry": False,
+                             "includeMeta": True})
+    meta = {q["q"]: q for q in out["meta"]["queries"]}
+    assert meta["咖啡 ok"]["count"] == 20 and "error" not in meta["咖啡 ok"]
+    assert meta["咖啡 bad"]["count"] == 0 and meta["咖啡 bad"]["error"] == "blocked"
+    assert {r["query"] for r in out["results"]} == {"咖啡 ok"}
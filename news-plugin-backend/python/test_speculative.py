@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+import ddg_search
+
+SEED = "https://news.sina.com.cn/x.html"
+
+
+@pytest.fixture(autouse=True)
+def _fake_ddgs(monkeypatch):
+    monkeypatch.setenv("DDG_REPLAY", "fake")
+    monkeypatch.delenv("DDG_FAKE_LATENCY_MS", raising=False)
+    monkeypatch.delenv("DDG_SPECULATIVE", raising=False)
+
+
+def _search(**payload):
+    out = ddg_search.search({"query": "咖啡价格上涨", "seedUrl": SEED, "count": 10, "noCache": True,
+                             "includeMeta": True, **payload})
+    return out["results"], out["meta"]["searches"]
+
+
+def _kinds(searches):
+    return [(s["kind"], s["speculative"], s.get("status"), s["used"]) for s in searches]
+
+
+def test_needed_speculative_searches_are_kept():
+    _, searches = _search(speculative=True, minExternalDomains=50, minUniqueDomains=50)
+    assert _kinds(searches) == [("primary", False, None, True), ("external", True, "kept", True),
+                                ("diversity", True, "kept", True)]
+
+
+def test_unneeded_speculative_searches_are_discarded():
+    plain, _ = _search(minExternalDomains=1, minUniqueDomains=2)
+    results, searches = _search(speculative=True, minExternalDomains=1, minUniqueDomains=2)
+    assert _kinds(searches)[1:] == [("external", True, "discarded", False), ("diversity", True, "discarded", False)]
+    assert results == plain
+
+
+def test_sequential_follow_ups_without_speculation():
+    _, searches = _search(minExternalDomains=50, minUniqueDomains=50)
+    assert _kinds(searches) == [("primary", False, None, True), ("external", False, "kept", True),
+                                ("diversity", False, "kept", True)]
+
+
+def test_speculative_search_past_its_deadline_is_dropped(monkeypatch):
+    real = ddg_search._cached_search
+
+    def slow_follow_ups(pool, ddgs_cls, query, *args, **kwargs):
+        if "-site:" in query:
+            time.sleep(0.3)
+        return real(pool, ddgs_cls, query, *args, **kwargs)
+
+    monkeypatch.setattr(ddg_search, "_cached_search", slow_follow_ups)
+    _, searches = _search(speculative=True, speculativeDeadlineMs=1, minExternalDomains=50, antiDominantRetry=False)
+    assert _kinds(searches) == [("primary", False, None, True), ("external", True, "timeout", False)]
+
+
+def test_env_turns_it_on(monkeypatch):
+    monkeypatch.setenv("DDG_SPECULATIVE", "1")
+    _, searches = _search(minExternalDomains=50, antiDominantRetry=False)
+    assert [s["speculative"] for s in searches if s["kind"] == "external"] == [True]
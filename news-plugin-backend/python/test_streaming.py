@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import agent_runner
+
+HERE = os.path.dirname(os.path.abspath(agent_runner.__file__))
+RAW = "QUERY: 咖啡涨价\nSNIPPETS:\n#1\nTITLE: 咖啡涨价\nSNIPPET: 咖啡价格上涨三成\nURL: https://a.com/1\n"
+
+
+def _run(payload: dict, **env) -> str:
+    """agent_runner.py's stdout for one payload on stdin."""
+    base = {k: v for k, v in os.environ.items() if not k.startswith(("AGENT_", "ZAI_", "ZHIPU"))}
+    base.update({"AGENT_LLM_REPLAY": "fake", "ZAI_API_KEY": "k", "AGENT_CACHE": "0", "AGENT_HEDGE": "0",
+                 "AGENT_RATE_LIMIT": "0", "AGENT_INCREMENTAL": "0"}, **env)
+    proc = subprocess.run([sys.executable, "agent_runner.py"], cwd=HERE, env=base, capture_output=True,
+                          input=json.dumps(payload, ensure_ascii=False), text=True, encoding="utf-8", check=True)
+    return proc.stdout
+
+
+def _events(payload: dict, **env) -> list:
+    return [json.loads(line) for line in _run(dict(payload, stream=True), **env).splitlines() if line.strip()]
+
+
+@pytest.mark.parametrize("exec_mode", ["sequential", "concurrent", "fused"])
+def test_stream_emits_sections_then_the_result(exec_mode):
+    events = _events({"rawText": RAW}, AGENT_EXEC_MODE=exec_mode)
+    sections = {e["section"]: e["data"] for e in events[:-1]}
+    assert [e["event"] for e in events] == ["section"] * 4 + ["result"]
+    assert set(sections) == {"summary", "timeline", "stances", "relatedEvents"}
+    result = events[-1]["result"]
+    assert result["code"] == 200
+    # the streamed sections are the ones in the merged result
+    assert all(result["data"][name] == value for name, value in sections.items())
+
+
+def test_without_stream_the_output_is_one_envelope():
+    out = json.loads(_run({"rawText": RAW}))
+    assert out["code"] == 200 and out["data"]["summary"]
+
+
+@pytest.mark.parametrize("payload, env, code", [
+    ({"mode": "translate"}, {}, 400),
+    ({"rawText": RAW}, {"ZAI_API_KEY": ""}, 500),
+])
+def test_stream_errors_are_a_result_event(payload, env, code):
+    plain = json.loads(_run(payload, **env))
+    assert plain["code"] == code
+    assert _events(payload, **env) == [{"event": "result", "result": plain}]
@@ -0,0 +1,80 @@
+import json
+import threading
+
+import pytest
+
+import agent_runner
+from replay import FakeZhipuAI
+
+ITEMS = [{"id": f"i{n}", "title": f"标题{n}", "snippet": "咖啡价格上涨" * 5} for n in range(10)]
+
+
+class _Responder:
+    """Summarizes every id it is shown, except the ids in drop (always) and drop_once (first request only)."""
+
+    def __init__(self, drop=(), drop_once=()):
+        self.drop = set(drop)
+        self.drop_once = set(drop_once)
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def __call__(self, messages):
+        ids = [str(it["id"]) for it in json.loads(messages[-1]["content"])["items"]]
+        with self._lock:
+            self.requests.append(ids)
+            skip = self.drop | self.drop_once
+            self.drop_once -= set(ids)
+        # reversed: the merge must not depend on the order the model answers in
+        out = [{"id": i, "summary": f"摘要{i}"} for i in reversed(ids) if i not in skip]
+        return "Action: " + json.dumps({"summaries": out}, ensure_ascii=False)
+
+    def times_requested(self, sid: str) -> int:
+        return sum(ids.count(sid) for ids in self.requests)
+
+
+@pytest.fixture(autouse=True)
+def _small_batches(monkeypatch):
+    monkeypatch.setenv("AGENT_SUMMARIZE_BATCH_ITEMS", "3")
+    monkeypatch.setenv("AGENT_SUMMARIZE_BATCH_TOKENS", "100000")
+
+
+def _run(responder, items=ITEMS):
+    client = FakeZhipuAI(responder=responder)
+    out = agent_runner.handle({"mode": "summarize", "items": items, "noCache": True}, "k", lambda: client)
+    assert out["code"] == 200
+    return out["data"]["summaries"]
+
+
+def test_batches_cover_every_item_once():
+    responder = _Responder()
+    summaries = _run(responder)
+    assert sorted(len(ids) for ids in responder.requests) == [1, 3, 3, 3]
+    assert sorted(sum(responder.requests, [])) == sorted(it["id"] for it in ITEMS)
+    assert summaries == [{"id": it["id"], "summary": f"摘要{it['id']}"} for it in ITEMS]
+
+
+def test_dropped_id_rerequested_once_and_merged_in_input_order():
+    responder = _Responder(drop_once={"i4"})
+    summaries = _run(responder)
+    assert responder.times_requested("i4") == 2
+    assert responder.requests[-1] == ["i4"]
+    assert all(responder.times_requested(it["id"]) == 1 for it in ITEMS if it["id"] != "i4")
+    assert summaries == [{"id": it["id"], "summary": f"摘要{it['id']}"} for it in ITEMS]
+
+
+def test_id_missing_twice_is_left_out():
+    responder = _Responder(drop={"i4"})
+    summaries = _run(responder)
+    assert responder.times_requested("i4") == 2
+    assert [s["id"] for s in summaries] == [it["id"] for it in ITEMS if it["id"] != "i4"]
+
+
+def test_unknown_and_duplicate_ids_ignored():
+    def responder(messages):
+        ids = [str(it["id"]) for it in json.loads(messages[-1]["content"])["items"]]
+        out = [{"id": "zz", "summary": "x"}] + [{"id": i, "summary": f"摘要{i}"} for i in ids for _ in range(2)]
+        return "Action: " + json.dumps({"summaries": out}, ensure_ascii=False)
+
+    items = ITEMS[:4] + [dict(ITEMS[0], title="重复")]
+    summaries = _run(responder, items)
+    assert summaries == [{"id": it["id"], "summary": f"摘要{it['id']}"} for it in ITEMS[:4]]
@@ -0,0 +1,79 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import transport
+from transport import dumps, error_envelope, load_stdin_json, loads, scrub, search_error
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(transport, "orjson", None)
+    return request.param
+
+
+def test_error_envelope_shapes():
+    assert error_envelope("bad") == {"code": 500, "msg": "bad", "data": None}
+    assert error_envelope("bad", "detail", code=400) == {"code": 400, "msg": "bad", "data": {"error": "detail"}}
+    assert error_envelope("bad", trace="tb") == {"code": 500, "msg": "bad", "data": {"error": "bad", "trace": "tb"}}
+    assert error_envelope("bad\ud800", ValueError("x\udc00")) == {"code": 500, "msg": "bad", "data": {"error": "x"}}
+    assert search_error("no\ud800 ddgs") == {"error": "no ddgs"}
+
+
+def test_scrub():
+    assert scrub(None) == "" and scrub(12) == "12" and scrub("咖啡") == "咖啡"
+    assert scrub("a\ud83db") == "ab"
+
+
+def test_loads_bytes_and_str(backend):
+    assert loads(b'{"q": "\xe5\x92\x96\xe5\x95\xa1"}') == {"q": "咖啡"}
+    assert loads('{"q": "咖啡", "n": [1, 2.5, null]}') == {"q": "咖啡", "n": [1, 2.5, None]}
+
+
+def test_loads_invalid_utf8_is_replaced(backend):
+    assert loads(b'{"q": "a\xffb"}') == {"q": "a�b"}
+
+
+def test_loads_lone_surrogate_escape_falls_back(backend):
+    # orjson rejects "\ud800"; the stdlib fallback keeps it for scrub() to drop later
+    assert loads(b'{"q": "a\\ud800b"}') == {"q": "a\ud800b"}
+
+
+@pytest.mark.parametrize("bad", [b"", b"{", b"[1,]", b"nope"])
+def test_loads_invalid_json_raises_value_error(backend, bad):
+    with pytest.raises(ValueError):
+        loads(bad)
+
+
+def test_dumps_keeps_non_ascii(backend):
+    out = dumps({"q": "咖啡", 1: "int key"})
+    assert json.loads(out) == {"q": "咖啡", "1": "int key"} and "咖啡" in out
+    assert dumps({"a": [1]}, indent=True) == '{\n  "a": [\n    1\n  ]\n}'
+
+
+def test_dumps_lone_surrogate_falls_back(backend):
+    out = dumps({"q": "a\ud800b"})
+    out.encode("utf-8")
+    assert json.loads(out)["q"].startswith("a")
+
+
+def test_load_stdin_json_from_a_text_stream(monkeypatch):
+    monkeypatch.setattr(sys, "stdin", io.StringIO('  {"mode": "strategy"}  '))
+    assert load_stdin_json() == {"mode": "strategy"}
+    monkeypatch.setattr(sys, "stdin", io.StringIO(" \n"))
+    assert load_stdin_json() == {}
+
+
+def test_stdlib_backend_can_be_forced():
+    env = {**os.environ, "AGENT_JSON_BACKEND": "stdlib"}
+    out = subprocess.run([sys.executable, "-c", "import transport; print(transport.JSON_BACKEND)"],
+                         cwd=os.path.dirname(os.path.abspath(transport.__file__)), env=env,
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "stdlib"
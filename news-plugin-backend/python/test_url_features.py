@@ -0,0 +1,66 @@
+import pytest
+
+from ddg_search import _norm_domain, _normalize_url, registrable_domain, url_features
+
+
+@pytest.mark.parametrize("domain, site", [
+    ("news.sina.com.cn", "sina.com.cn"),
+    ("finance.sina.com.cn", "sina.com.cn"),
+    ("sina.com.cn", "sina.com.cn"),
+    ("news.bbc.co.uk", "bbc.co.uk"),
+    ("bbc.co.uk", "bbc.co.uk"),
+    ("a.b.example.co.jp", "example.co.jp"),
+    ("news.ltn.com.tw", "ltn.com.tw"),
+    ("zh.wikipedia.org", "wikipedia.org"),
+    ("reuters.com", "reuters.com"),
+    ("foo.github.io", "foo.github.io"),
+    ("co.uk", "co.uk"),
+    ("localhost", "localhost"),
+    ("", ""),
+])
+def test_registrable_domain(domain, site):
+    assert registrable_domain(domain) == site
+
+
+@pytest.mark.parametrize("ip", ["127.0.0.1", "10.1.2.3", "203.0.113.10"])
+def test_ip_hosts_are_their_own_site(ip):
+    assert registrable_domain(ip) == ip
+    _, domain, site, *_ = url_features(f"http://{ip}:8080/news/1.html")
+    assert (domain, site) == (ip, ip)
+
+
+@pytest.mark.parametrize("url, domain, site", [
+    ("https://www.reuters.com/world/", "reuters.com", "reuters.com"),
+    ("https://m.reuters.com/world/", "m.reuters.com", "reuters.com"),
+    ("https://WWW.BBC.CO.UK/news", "bbc.co.uk", "bbc.co.uk"),
+    ("https://m.bbc.co.uk/news", "m.bbc.co.uk", "bbc.co.uk"),
+    ("https://www.sina.com.cn:443/a", "sina.com.cn", "sina.com.cn"),
+    ("http://news.sina.com.cn:8080/a", "news.sina.com.cn", "sina.com.cn"),
+    ("https://user:pw@m.thepaper.cn/a", "m.thepaper.cn", "thepaper.cn"),
+])
+def test_prefixes_and_ports(url, domain, site):
+    _, d, s, *_ = url_features(url)
+    assert (d, s) == (domain, site)
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.reuters.com/world/2024/05/01/story.html?utm_source=ddg&id=3#frag",
+    "http://news.sina.com.cn:8080/c/2024-05-01/doc-1.shtml",
+    "https://zh.wikipedia.org/wiki/%E5%92%96%E5%95%A1",
+    "https://www.bbc.co.uk/news/author/jane-doe/",
+    "not a url",
+    "",
+])
+def test_matches_single_purpose_helpers(url):
+    nurl, domain, site, *_ = url_features(url)
+    assert nurl == _normalize_url(url)
+    assert domain == _norm_domain(nurl)
+    assert site == registrable_domain(domain)
+
+
+def test_url_signals():
+    nurl, _, _, _, depth, has_date, is_wiki = url_features(
+        "https://www.reuters.com/world/2024/05/01/story.html?utm_source=ddg&id=3")
+    assert nurl == "https://www.reuters.com/world/2024/05/01/story.html?id=3"
+    assert (depth, has_date, is_wiki) == (5, True, False)
+    assert url_features("https://zh.wikipedia.org/wiki/X")[6] is True
@@ -0,0 +1,121 @@
+"""stdin/stdout codec shared by the spawned Python entry points.
+
+- payloads are read from stdin as bytes (no text-layer decode/re-encode round trip)
+- scrub() drops lone surrogates with one regex pass, and only when the text is not
+  already valid UTF-8 (the common case costs a single C-level encode check)
+- JSON goes through orjson when it is installed, stdlib json otherwise
+  (AGENT_JSON_BACKEND=stdlib forces the fallback)
+- error_envelope() / search_error() are the error shapes agent.js / ddg.js expect
+
+Output bytes are always UTF-8 with non-ASCII kept as is (ensure_ascii=False).
+"""
+import json
+import os
+import re
+import sys
+
+_SURROGATES = re.compile("[\ud800-\udfff]")
+
+try:
+    if os.getenv("AGENT_JSON_BACKEND", "").strip().lower() == "stdlib":
+        raise ImportError
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "stdlib"
+
+
+def scrub(s) -> str:
+    """Make text safe for UTF-8 transport (lone surrogates removed)."""
+    if s is None:
+        return ""
+    if not isinstance(s, str):
+        s = str(s)
+    if s.isascii():
+        return s
+    try:
+        s.encode("utf-8")
+        return s
+    except UnicodeEncodeError:
+        return _SURROGATES.sub("", s)
+
+
+def read_stdin() -> bytes:
+    buf = getattr(sys.stdin, "buffer", None)
+    if buf is not None:
+        return buf.read()
+    # sys.stdin swapped for a text stream (tests / in-process benchmarks)
+    return sys.stdin.read().encode("utf-8", errors="replace")
+
+
+def loads(data):
+    """Parse JSON from bytes or str. Invalid UTF-8 bytes are replaced, like the old text read."""
+    if isinstance(data, str):
+        data = data.encode("utf-8", errors="replace")
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # invalid UTF-8 or lone-surrogate escapes: let the tolerant stdlib path decide
+            pass
+    return json.loads(data.decode("utf-8", errors="replace"))
+
+
+def load_stdin_json() -> dict:
+    """stdin payload as a dict; empty input -> {}."""
+    raw = read_stdin()
+    if not raw.strip():
+        return {}
+    return loads(raw)
+
+
+def dumps_bytes(obj, indent: bool = False) -> bytes:
+    if orjson is not None:
+        opts = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(obj, option=opts)
+        except TypeError:
+            # lone surrogates / unsupported types: stdlib below
+            pass
+    text = json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+    return text.encode("utf-8", errors="replace")
+
+
+def dumps(obj, indent: bool = False) -> str:
+    return dumps_bytes(obj, indent=indent).decode("utf-8")
+
+
+def write_json(obj, newline: bool = False, indent: bool = False):
+    """Serialize obj to stdout (binary when available) and flush."""
+    data = dumps_bytes(obj, indent=indent) + (b"\n" if newline else b"")
+    write_raw(data)
+
+
+def write_raw(data: bytes):
+    buf = getattr(sys.stdout, "buffer", None)
+    if buf is not None:
+        sys.stdout.flush()
+        buf.write(data)
+        buf.flush()
+    else:
+        sys.stdout.write(data.decode("utf-8"))
+        sys.stdout.flush()
+
+
+def error_envelope(msg: str, error=None, code: int = 500, trace: str | None = None) -> dict:
+    """{"code", "msg", "data"}: the agent_runner.py error shape agent.js checks (code/msg).
+
+    data stays null unless there is a detail to report: {"error"[, "trace"]}.
+    """
+    if error is None and not trace:
+        return {"code": code, "msg": scrub(msg), "data": None}
+    data = {"error": scrub(error if error is not None else msg)}
+    if trace:
+        data["trace"] = scrub(trace)
+    return {"code": code, "msg": scrub(msg), "data": data}
+
+
+def search_error(msg: str) -> dict:
+    """{"error"}: the ddg_search.py error shape ddg.js checks."""
+    return {"error": scrub(msg)}
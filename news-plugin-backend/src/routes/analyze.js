@@ -2,7 +2,7 @@ import { Router } from 'express';
 import { z } from 'zod';
 import axios from 'axios';
 
-import { ddgSearch } from '../services/ddg.js';
+import { ddgSearchMulti } from '../services/ddg.js';
 import { gdeltSearch } from '../services/gdelt.js';
 import { agentAnalyze, agentFilter, agentSelect, agentStrategy, isAgentConfigured } from '../services/agent.js';
 import { buildFallbackAnalysis } from '../utils/fallbackAnalyze.js';
@@ -29,7 +29,9 @@ const AnalyzeBody = z.object({
         datePublished: z.string().optional()
       })
     )
-    .optional()
+    .optional(),
+  // re-analyze from scratch instead of reusing the stored event state (AGENT_INCREMENTAL=1)
+  refresh: z.boolean().optional()
 });
 
 const AnalyzeOutput = z.object({
@@ -539,9 +541,11 @@ analyzeRouter.post('/', async (req, res, next) => {
         let ddgEmpty = 0;
         let gdeltEmpty = 0;
 
+        // One ddg_search.py process for all strategy queries.
+        const ddgAll = ddgSearchMulti({ queries: searchQueries, count: maxPerQuery, region: body.region });
         const searchTasks = searchQueries.map((q, idx) =>
           Promise.allSettled([
-            ddgSearch({ query: q, count: maxPerQuery, region: body.region }),
+            ddgAll.then((byQuery) => byQuery.get(q) || []),
             gdeltSearch({ query: q, maxrecords: maxPerQuery })
           ]).then((results) => {
             const out = [];
@@ -682,7 +686,8 @@ analyzeRouter.post('/', async (req, res, next) => {
           snippets,
           rawText,
           agentUrl,
-          apiKey: hasAgentKey ? agentApiKey.trim() : undefined
+          apiKey: hasAgentKey ? agentApiKey.trim() : undefined,
+          refresh: body.refresh
         });
         analysis = AnalyzeOutput.parse(agentOut);
         agentUsed = true;
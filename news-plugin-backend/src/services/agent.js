@@ -49,7 +49,7 @@ export function isAgentConfigured() {
   return false;
 }
 
-async function agentAnalyzeHttp({ query, context, snippets, agentUrl }) {
+async function agentAnalyzeHttp({ query, context, snippets, agentUrl, refresh }) {
   const url = agentUrl || process.env.AGENT_URL;
   if (!url) {
     throw new AppError(500, 'AGENT_URL not configured');
@@ -64,7 +64,8 @@ async function agentAnalyzeHttp({ query, context, snippets, agentUrl }) {
       {
         query,
         context,
-        snippets
+        snippets,
+        refresh: Boolean(refresh)
       },
       {
         timeout,
@@ -105,7 +106,7 @@ function resolvePythonCmd() {
   );
 }
 
-async function agentAnalyzeProcess({ rawText, apiKey, timeoutMs, validateOnly }) {
+async function agentAnalyzeProcess({ rawText, apiKey, timeoutMs, validateOnly, refresh }) {
   const pythonCmd = resolvePythonCmd();
   const runner = path.resolve(process.cwd(), process.env.AGENT_RUNNER || 'python/agent_runner.py');
   const timeout = Number(timeoutMs || process.env.AGENT_TIMEOUT_MS || 90000);
@@ -169,7 +170,9 @@ async function agentAnalyzeProcess({ rawText, apiKey, timeoutMs, validateOnly })
       if (typeof parsed.code === 'number') {
         if (parsed.code !== 200) {
           const errDetail = parsed.data ? JSON.stringify(parsed.data).slice(0, 500) : '';
-          reject(new AppError(502, `Agent returned error code ${parsed.code}: ${parsed.msg || 'unknown'} ${errDetail}`));
+          // 400: the payload itself was rejected (unknown mode / missing rawText), not an upstream failure
+          const status = parsed.code === 400 ? 400 : 502;
+          reject(new AppError(status, `Agent returned error code ${parsed.code}: ${parsed.msg || 'unknown'} ${errDetail}`));
           return;
         }
         if (parsed.data) {
@@ -187,7 +190,7 @@ async function agentAnalyzeProcess({ rawText, apiKey, timeoutMs, validateOnly })
       reject(new AppError(502, 'Agent response format not recognized'));
     });
 
-    child.stdin.write(JSON.stringify({ rawText, validateOnly: Boolean(validateOnly) }));
+    child.stdin.write(JSON.stringify({ rawText, validateOnly: Boolean(validateOnly), refresh: Boolean(refresh) }));
     child.stdin.end();
   });
 }
@@ -197,22 +200,22 @@ async function agentAnalyzeProcess({ rawText, apiKey, timeoutMs, validateOnly })
  * - mode=http: POST to AGENT_URL
  * - mode=process: spawn python runner (python/agent_runner.py) which imports python/Agent.py
  */
-export async function agentAnalyze({ query, context, snippets, rawText, agentUrl, apiKey }) {
+export async function agentAnalyze({ query, context, snippets, rawText, agentUrl, apiKey, refresh }) {
   const mode = getAgentMode();
 
   if (agentUrl) {
-    return agentAnalyzeHttp({ query, context, snippets, agentUrl });
+    return agentAnalyzeHttp({ query, context, snippets, agentUrl, refresh });
   }
 
   if (mode === 'http') {
-    return agentAnalyzeHttp({ query, context, snippets });
+    return agentAnalyzeHttp({ query, context, snippets, refresh });
   }
 
   if (mode === 'process') {
     if (!rawText) {
       throw new AppError(500, 'rawText is required for process mode');
     }
-    return agentAnalyzeProcess({ rawText, apiKey });
+    return agentAnalyzeProcess({ rawText, apiKey, refresh });
   }
 
   throw new AppError(500, 'Agent not configured');
@@ -291,7 +294,7 @@ async function agentRunTask({ payload, apiKey, timeoutMs }) {
       }
 
       if (typeof parsed?.code === 'number' && parsed.code !== 200) {
-        reject(new AppError(502, `Agent returned error code ${parsed.code}: ${parsed.msg || 'unknown'}`));
+        reject(new AppError(parsed.code === 400 ? 400 : 502, `Agent returned error code ${parsed.code}: ${parsed.msg || 'unknown'}`));
         return;
       }
 
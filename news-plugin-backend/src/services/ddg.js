@@ -144,76 +144,90 @@ function cleanResults(results, query, count, minScore = 3) {
   return cleaned.slice(0, count);
 }
 
-export async function ddgSearch({ query, count = 20, region }) {
+function resolveSearchPython() {
   const venvPythonLocal = path.resolve(process.cwd(), '.venv/bin/python');
   const venvPythonRepo = path.resolve(process.cwd(), '..', '.venv/bin/python');
-  const pythonCmd =
+  return (
     process.env.SEARCH_PYTHON ||
     process.env.PYTHON ||
     (fs.existsSync(venvPythonLocal)
       ? venvPythonLocal
       : fs.existsSync(venvPythonRepo)
         ? venvPythonRepo
-        : 'python3');
-  const runner = path.resolve(process.cwd(), 'python/ddg_search.py');
-  const timeout = Number(process.env.DDG_TIMEOUT_MS || 12000);
-  const backend = process.env.DDG_BACKEND || 'auto';
-  const normalizedRegion = normalizeRegion(region);
+        : 'python3')
+  );
+}
 
-  const runQuery = async (currentQuery) => {
-    return await new Promise((resolve, reject) => {
-      const child = spawn(pythonCmd, [runner], {
-        env: { ...process.env, PYTHONWARNINGS: 'ignore' },
-        stdio: ['pipe', 'pipe', 'pipe']
-      });
+function ddgTimeoutMs() {
+  return Number(process.env.DDG_TIMEOUT_MS || 12000);
+}
 
-      let stdout = '';
-      let stderr = '';
+function runDdgProcess(payload, timeout = ddgTimeoutMs()) {
+  const pythonCmd = resolveSearchPython();
+  const runner = path.resolve(process.cwd(), 'python/ddg_search.py');
 
-      const timer = setTimeout(() => {
-        child.kill('SIGKILL');
-        reject(new AppError(504, 'DDG search timeout'));
-      }, timeout);
+  return new Promise((resolve, reject) => {
+    const child = spawn(pythonCmd, [runner], {
+      env: { ...process.env, PYTHONWARNINGS: 'ignore' },
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
 
-      child.stdout.on('data', (d) => {
-        stdout += d.toString('utf8');
-      });
+    let stdout = '';
+    let stderr = '';
 
-      child.stderr.on('data', (d) => {
-        stderr += d.toString('utf8');
-      });
+    const timer = setTimeout(() => {
+      child.kill('SIGKILL');
+      reject(new AppError(504, 'DDG search timeout'));
+    }, timeout);
 
-      child.on('error', (err) => {
-        clearTimeout(timer);
-        reject(new AppError(502, `DDG spawn failed: ${err?.message || 'unknown error'}`));
-      });
+    child.stdout.on('data', (d) => {
+      stdout += d.toString('utf8');
+    });
 
-      child.on('close', (code) => {
-        clearTimeout(timer);
-        if (stderr.trim()) {
-          console.info(`[ddg] ${stderr.trim()}`);
-        }
-        if (code !== 0 && !stdout.trim()) {
-          reject(new AppError(502, `DDG exited with code ${code}: ${stderr.trim()}`));
-          return;
-        }
-        let parsed;
-        try {
-          parsed = JSON.parse(stdout);
-        } catch {
-          reject(new AppError(502, `DDG output parse failed: ${stderr.trim().slice(0, 200)}`));
-          return;
-        }
-        if (parsed?.error) {
-          reject(new AppError(502, `${parsed.error}${stderr.trim() ? ` | ${stderr.trim()}` : ''}`));
-          return;
-        }
-        resolve(parsed?.results || []);
-      });
+    child.stderr.on('data', (d) => {
+      stderr += d.toString('utf8');
+    });
+
+    child.on('error', (err) => {
+      clearTimeout(timer);
+      reject(new AppError(502, `DDG spawn failed: ${err?.message || 'unknown error'}`));
+    });
 
-      child.stdin.write(JSON.stringify({ query: currentQuery, count, backend, region: normalizedRegion }));
-      child.stdin.end();
+    child.on('close', (code) => {
+      clearTimeout(timer);
+      if (stderr.trim()) {
+        console.info(`[ddg] ${stderr.trim()}`);
+      }
+      if (code !== 0 && !stdout.trim()) {
+        reject(new AppError(502, `DDG exited with code ${code}: ${stderr.trim()}`));
+        return;
+      }
+      let parsed;
+      try {
+        parsed = JSON.parse(stdout);
+      } catch {
+        reject(new AppError(502, `DDG output parse failed: ${stderr.trim().slice(0, 200)}`));
+        return;
+      }
+      if (parsed?.error) {
+        reject(new AppError(502, `${parsed.error}${stderr.trim() ? ` | ${stderr.trim()}` : ''}`));
+        return;
+      }
+      resolve(parsed);
     });
+
+    child.stdin.write(JSON.stringify(payload));
+    child.stdin.end();
+  });
+}
+
+export async function ddgSearch({ query, count = 20, region }) {
+  const backend = process.env.DDG_BACKEND || 'auto';
+  const normalizedRegion = normalizeRegion(region);
+
+  const runQuery = async (currentQuery) => {
+    const parsed = await runDdgProcess({ query: currentQuery, count, backend, region: normalizedRegion });
+    return parsed?.results || [];
   };
 
   const firstResults = await runQuery(query);
@@ -232,3 +246,70 @@ export async function ddgSearch({ query, count = 20, region }) {
 
   return [];
 }
+
+/**
+ * Searches several queries in one ddg_search.py process (shared sessions, one global
+ * enrich/dedup/diversify). Resolves to a Map of query -> cleaned results.
+ * Set DDG_MULTI_QUERY=0 to fall back to one process per query.
+ */
+export async function ddgSearchMulti({ queries, count = 20, region }) {
+  const list = Array.from(new Set((queries || []).filter(Boolean)));
+  const byQuery = new Map();
+  if (!list.length) return byQuery;
+
+  if (process.env.DDG_MULTI_QUERY === '0' || list.length === 1) {
+    const settled = await Promise.allSettled(list.map((q) => ddgSearch({ query: q, count, region })));
+    const failed = settled.find((r) => r.status === 'rejected');
+    if (failed && settled.every((r) => r.status === 'rejected')) throw failed.reason;
+    settled.forEach((r, idx) => byQuery.set(list[idx], r.status === 'fulfilled' ? r.value : []));
+    return byQuery;
+  }
+
+  // one DDG_TIMEOUT_MS per wave of maxConcurrency queries; ddg_search.py answers with the
+  // queries finished by deadlineMs, so one slow query doesn't take the others down with it
+  const maxConcurrency = Number(process.env.DDG_MAX_CONCURRENCY || 4);
+  const timeout = ddgTimeoutMs() * Math.ceil(list.length / Math.max(1, maxConcurrency));
+  const parsed = await runDdgProcess(
+    {
+      queries: list,
+      count: count * list.length,
+      perQueryCount: count,
+      backend: process.env.DDG_BACKEND || 'auto',
+      region: normalizeRegion(region),
+      maxConcurrency,
+      deadlineMs: Math.max(1000, timeout - 2000)
+    },
+    timeout
+  );
+
+  const grouped = new Map(list.map((q) => [q, []]));
+  for (const r of parsed?.results || []) {
+    if (grouped.has(r?.query)) grouped.get(r.query).push(r);
+  }
+  const empty = [];
+  for (const [q, results] of grouped) {
+    const cleaned = cleanResults(results, q, count, 3);
+    byQuery.set(q, cleaned);
+    if (!cleaned.length) empty.push(q);
+  }
+
+  // same fallback as ddgSearch: an empty query gets one retry with its simplified form
+  await Promise.allSettled(
+    empty.map(async (q) => {
+      const retryQuery = buildRetryQuery(q);
+      if (!retryQuery || retryQuery === q) return;
+      const retried = await runDdgProcess({
+        query: retryQuery,
+        count,
+        backend: process.env.DDG_BACKEND || 'auto',
+        region: normalizeRegion(region)
+      });
+      const cleaned = cleanResults(retried?.results || [], retryQuery, count, 2);
+      if (cleaned.length > 0) {
+        console.info(`[ddg] retry query accepted: ${retryQuery}`);
+        byQuery.set(q, cleaned);
+      }
+    })
+  );
+  return byQuery;
+}